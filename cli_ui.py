@@ -1,18 +1,63 @@
+import os
 from rich.console import Console
 from rich.table import Table
 from core import manager
+from core import daemon, events, profiler
+from core.config import load_config
+from core.restart import RestartScheduler
+from core.state import StateStore, describe_age, refresh_in_background
 
 console = Console()
 
+def print_snapshot(state):
+    """Print the last known state without waiting for cloudflared"""
+    tunnels, tunnels_at = state.get("tunnels")
+    running, service_at = state.get("service_running")
+    if tunnels_at is None and service_at is None:
+        return
+    table = Table(title="Last known state")
+    table.add_column("Item")
+    table.add_column("Value")
+    table.add_column("Fetched")
+    if tunnels is not None:
+        table.add_row("Tunnels", str(len(tunnels)), describe_age(tunnels_at))
+    if service_at is not None:
+        table.add_row("Service running", str(running), describe_age(service_at))
+    console.print(table)
+
+def call(name, *args):
+    """Run a manager function through the daemon's warm caches when one is running"""
+    return daemon.call_or_direct(name, getattr(manager, name), *args)
+
 def main():
+    state = StateStore()
+    # Keep the snapshot in step with state-change events, including other front-ends'
+    events.track_snapshot(state)
+    restarts = RestartScheduler(state=state, on_decision=console.print)
+    print_snapshot(state)
+    if daemon.is_running():
+        console.print("[dim]Connected to ArgoGUI daemon[/dim]")
+    else:
+        # Reconcile the snapshot while the user picks an option
+        refresh_in_background(state, ["cloudflared_installed", "service_running", "tunnels"])
     while True:
+        events.get_bus().sync()
         console.print("\n[bold cyan]Cloudflared Tunnel CLI[/bold cyan]", style="green")
-        console.print("[1] List Tunnels\n[2] Cloudflared Login\n[3] Create Tunnel\n[4] Delete Tunnel\n[5] Start Service\n[6] Stop Service\n[7] Restart Service\n[8] Service Status\n[9] Install cloudflared\n[10] Install as Service\n[11] Uninstall Service\n[12] Clean Service Files\n[13] Exit")
+        # Exit stays last, after the allocation snapshot option that only exists while profiling
+        exit_choice = "22" if profiler.active() else "21"
+        console.print("[1] List Tunnels\n[2] Cloudflared Login\n[3] Create Tunnel\n[4] Delete Tunnel\n[5] Start Service\n[6] Stop Service\n[7] Restart Service\n[8] Service Status\n[9] Install cloudflared\n[10] Install as Service\n[11] Uninstall Service\n[12] Clean Service Files\n[13] Search Logs\n[14] Bulk Import DNS Routes\n[15] IP Route Lookup\n[16] Backup / Restore .cloudflared\n[17] API Scheduler Stats\n[18] Diagnostic Bundle\n[19] Clean Up Stale Tunnels\n[20] Per-Tunnel Services"
+                      + ("\n[21] Capture Allocation Snapshot" if profiler.active() else "")
+                      + f"\n[{exit_choice}] Exit")
         choice = input("Select an option: ")
 
         if choice == "1":
 
-            tunnels = manager.list_tunnels()
+            tunnels = call("list_tunnels")
+            try:
+                import json
+                state.put("tunnels", json.loads(tunnels))
+            except Exception:
+                pass
             console.print(tunnels)
         elif choice == "2":
             try:
@@ -22,14 +67,11 @@ def main():
                 console.print(f"Failed to run cloudflared login: {e}")
         elif choice == "3":
             name = input("Enter tunnel name: ")
-            manager.create_tunnel(name)
-            # Get tunnel UUID from tunnel list
-            import json, os
-            tunnels_json = manager.list_tunnels()
+            # create_tunnel returns the new tunnel's record
             try:
-                tunnels = json.loads(tunnels_json)
-                tunnel = next((t for t in tunnels if t['name'] == name), None)
-            except Exception:
+                tunnel = call("create_tunnel", name)
+            except Exception as e:
+                console.print(f"Failed to create tunnel: {e}", markup=False)
                 tunnel = None
             if not tunnel:
                 console.print("Tunnel creation failed or tunnel not found.")
@@ -56,8 +98,7 @@ def main():
                     # Ask to restart service
                     do_restart = input("Restart service to apply new tunnel config? (y/n): ").strip().lower() == 'y'
                     if do_restart:
-                        mgr.restart_service()
-                        console.print("Service restarted with new tunnel config.")
+                        restarts.restart_if_changed(f"new tunnel {tunnel_id}")
                 except Exception as e:
                     console.print(f"Failed to copy/symlink config or credentials: {e}")
             hostname = input("Enter hostname for DNS routing (optional, e.g. app.example.com): ")
@@ -68,6 +109,19 @@ def main():
                 except Exception as e:
                     console.print(f"Failed to add DNS route: {e}")
             ip_cidr = input("Enter IP/CIDR for IP routing (optional, e.g. 10.0.0.0/24): ")
+            if ip_cidr:
+                try:
+                    from core.iproutes import build_index, describe_finding
+                    findings = build_index().check(ip_cidr, tunnel_id)
+                    for finding in findings:
+                        console.print(f"[yellow]Warning: {describe_finding(ip_cidr, finding)}[/yellow]")
+                    if findings and input("Add the route anyway? (y/n): ").strip().lower() != 'y':
+                        ip_cidr = None
+                except Exception as e:
+                    # Without the route list the overlap check proves nothing
+                    console.print(f"[red]Could not check existing IP routes: {e}[/red]")
+                    if input("Add the route without the overlap check? (y/n): ").strip().lower() != 'y':
+                        ip_cidr = None
             if ip_cidr:
                 try:
                     manager.add_ip_route(ip_cidr, tunnel_id)
@@ -84,18 +138,26 @@ def main():
                 console.print(f"To start routing, run: cloudflared tunnel run {tunnel_id}")
         elif choice == "4":
             tunnel_id = input("Enter tunnel ID: ")
-            manager.delete_tunnel(tunnel_id)
+            try:
+                call("delete_tunnel", tunnel_id)
+            except Exception as e:
+                console.print(f"Failed to delete tunnel: {e}", markup=False)
         elif choice == "5":
             manager.start_service()
+            daemon.call_or_direct("invalidate", lambda *a: None, "is_service_running")
             console.print("Service started")
         elif choice == "6":
             manager.stop_service()
+            daemon.call_or_direct("invalidate", lambda *a: None, "is_service_running")
             console.print("Service stopped")
         elif choice == "7":
             manager.restart_service()
+            restarts.mark_applied()
+            daemon.call_or_direct("invalidate", lambda *a: None, "is_service_running")
             console.print("Service restarted")
         elif choice == "8":
-            status = manager.is_service_running()
+            status = call("is_service_running")
+            state.put("service_running", status)
             console.print(f"Service running: {status}")
         elif choice == "9":
             from core.utils import download_and_install_cloudflared
@@ -105,17 +167,10 @@ def main():
             try:
                 from core import manager as mgr
                 # Try to get current tunnel info from config
-                src_config = os.path.expanduser("~/.cloudflared/config.yml")
-                tunnel_uuid = None
-                creds_file = None
-                url = None
-                if os.path.exists(src_config):
-                    with open(src_config, 'r') as f:
-                        cfg = yaml.safe_load(f)
-                        if cfg:
-                            tunnel_uuid = cfg.get('tunnel')
-                            creds_file = cfg.get('credentials-file')
-                            url = cfg.get('url')
+                cfg = load_config()
+                tunnel_uuid = cfg.get('tunnel')
+                creds_file = cfg.get('credentials-file')
+                url = cfg.get('url')
                 
                 # Install service with current tunnel config if available
                 manager.install_service(tunnel_uuid=tunnel_uuid, credentials_file=creds_file, url=url)
@@ -127,12 +182,7 @@ def main():
                 from core import manager as mgr
                 src_config = os.path.expanduser("~/.cloudflared/config.yml")
                 # Try to find a credentials file in config
-                import yaml
-                creds_file = None
-                if os.path.exists(src_config):
-                    with open(src_config, 'r') as f:
-                        cfg = yaml.safe_load(f)
-                        creds_file = cfg.get('credentials-file')
+                creds_file = load_config().get('credentials-file')
                 if not creds_file or not os.path.exists(creds_file):
                     creds_file = input("Enter path to credentials file (e.g. ~/.cloudflared/<UUID>.json): ")
                 config_dest, creds_dest = mgr.copy_or_symlink_config_and_creds(src_config, creds_file)
@@ -148,23 +198,18 @@ def main():
                 # Offer to update service config with current tunnel
                 do_update = input("Update service config with current tunnel? (y/n): ").strip().lower() == 'y'
                 if do_update:
-                    src_config = os.path.expanduser("~/.cloudflared/config.yml")
-                    if os.path.exists(src_config):
-                        with open(src_config, 'r') as f:
-                            cfg = yaml.safe_load(f)
-                            if cfg:
-                                tunnel_uuid = cfg.get('tunnel')
-                                creds_file = cfg.get('credentials-file')
-                                url = cfg.get('url')
-                                if tunnel_uuid and creds_file:
-                                    mgr.update_service_config(tunnel_uuid, creds_file, url)
-                                    console.print("Service config updated.")
-                                    do_restart = input("Restart service to apply new config? (y/n): ").strip().lower() == 'y'
-                                    if do_restart:
-                                        mgr.restart_service()
-                                        console.print("Service restarted with new config.")
-                                else:
-                                    console.print("No tunnel configuration found in current config.")
+                    cfg = load_config()
+                    tunnel_uuid = cfg.get('tunnel')
+                    creds_file = cfg.get('credentials-file')
+                    url = cfg.get('url')
+                    if tunnel_uuid and creds_file:
+                        mgr.update_service_config(tunnel_uuid, creds_file, url)
+                        console.print("Service config updated.")
+                        do_restart = input("Restart service to apply new config? (y/n): ").strip().lower() == 'y'
+                        if do_restart:
+                            restarts.restart_if_changed("service config updated")
+                    else:
+                        console.print("No tunnel configuration found in current config.")
             except Exception as e:
                 console.print(f"Failed to diagnose service config: {e}")
         elif choice == "11":
@@ -181,7 +226,159 @@ def main():
                     console.print("Service config files removed.")
             except Exception as e:
                 console.print(f"Failed to clean service files: {e}")
-        elif choice == "13":
+        elif choice == exit_choice:
             break
+        elif choice == "13":
+            import time
+            from core.logstore import LogStore, format_record, ingest_service_logs
+            store = LogStore()
+            if input("Import recent service logs first? (y/n): ").strip().lower() == 'y':
+                console.print(f"Imported {ingest_service_logs(store)} service log lines")
+            text = input("Search text (optional, e.g. connection): ").strip() or None
+            tunnel_id = input("Tunnel ID (optional): ").strip() or None
+            level = input("Level (debug/info/warn/error/fatal, optional): ").strip() or None
+            hours = input("Hours back (default 1, 0 for all): ").strip() or "1"
+            try:
+                since = time.time() - float(hours) * 3600 if float(hours) > 0 else None
+                records = store.query(text=text, level=level, tunnel_id=tunnel_id, since=since)
+                for record in records:
+                    console.print(format_record(record), markup=False)
+                console.print(f"{len(records)} matching log entries")
+            except Exception as e:
+                console.print(f"Failed to search logs: {e}")
+            store.close()
+        elif choice == "14":
+            from core.dns_import import import_routes
+            path = os.path.expanduser(input("Path to CSV (hostname,tunnel) or BIND zone file: ").strip())
+            default_tunnel = input("Default tunnel for rows without one (optional): ").strip() or None
+            dry_run = input("Dry run only? (y/n): ").strip().lower() == 'y'
+            failures = []
+
+            def show(result):
+                if result["status"] == "failed":
+                    failures.append(result)
+                    console.print(f"[red]line {result['line']}: {result['hostname']} failed: {result['error']}[/red]")
+                elif result["status"] == "invalid":
+                    console.print(f"[red]line {result['line']}: skipped, {result['error']}[/red]")
+                elif result["status"] in ("added", "planned"):
+                    console.print(f"line {result['line']}: {result['hostname']} -> {result['tunnel']} {result['status']}")
+
+            try:
+                counts = import_routes(path, default_tunnel, dry_run=dry_run, on_result=show)
+                console.print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "No routes found")
+                if failures and not dry_run:
+                    console.print("Re-run the import to retry failed rows; completed rows are skipped.")
+            except Exception as e:
+                console.print(f"Failed to import DNS routes: {e}")
+        elif choice == "15":
+            from core.iproutes import build_index, describe_finding
+            try:
+                index = build_index()
+                console.print(f"Loaded {len(index)} IP routes")
+                while True:
+                    query = input("IP to look up, or CIDR to check (blank to return): ").strip()
+                    if not query:
+                        break
+                    if "/" in query:
+                        findings = index.check(query)
+                        for finding in findings:
+                            console.print(describe_finding(query, finding))
+                        if not findings:
+                            console.print(f"{query} does not overlap any existing route")
+                    else:
+                        route = index.lookup(query)
+                        if route:
+                            console.print(f"{query} -> {route.network} via tunnel {route.target}")
+                        else:
+                            console.print(f"No route serves {query}")
+            except Exception as e:
+                console.print(f"Failed to look up IP routes: {e}")
+        elif choice == "16":
+            from core.snapshots import get_store, describe as describe_snapshot
+            store = get_store()
+            manifests = store.list()
+            for manifest in manifests[:20]:
+                console.print(describe_snapshot(manifest))
+            if not manifests:
+                console.print("No snapshots yet")
+            action = input("[b]ackup now, [r]estore a snapshot, or blank to return: ").strip().lower()
+            try:
+                if action == "b":
+                    manifest = store.take("manual")
+                    console.print(f"Snapshot {manifest['id']}: {manifest['files']} files, {manifest['hashed']} changed")
+                elif action == "r":
+                    snapshot_id = input("Snapshot id to restore: ").strip()
+                    if snapshot_id and input(f"Replace current .cloudflared files with {snapshot_id}? (y/n): ").strip().lower() == "y":
+                        restored = store.restore(snapshot_id)
+                        console.print("Restored: " + ", ".join(restored))
+                        restarts.restart_if_changed(f"restored snapshot {snapshot_id}")
+            except Exception as e:
+                console.print(f"Snapshot operation failed: {e}")
+        elif choice == "17":
+            from core import scheduler
+            # API calls run in the daemon when one is serving this front-end
+            stats = daemon.call_or_direct("api_stats", lambda: scheduler.get_scheduler().stats())
+            console.print(scheduler.describe(stats), markup=False)
+        elif choice == "18":
+            from core.diagnostics import collect_bundle, describe_progress
+            try:
+                path = collect_bundle(on_progress=lambda name, entry: console.print(describe_progress(name, entry),
+                                                                                     markup=False))
+                console.print(f"Diagnostic bundle written to {path}", markup=False)
+            except Exception as e:
+                console.print(f"Failed to collect diagnostic bundle: {e}")
+        elif choice == "19":
+            from core import cleanup
+            days = input(f"Days without connectors [{cleanup.DEFAULT_DAYS}]: ").strip()
+            try:
+                _, items = cleanup.scan(int(days) if days else cleanup.DEFAULT_DAYS)
+            except (RuntimeError, ValueError) as e:
+                console.print(f"Could not take a snapshot, nothing was changed: {e}", markup=False)
+                continue
+            for i, item in enumerate(items, 1):
+                console.print(f"[{i}] {cleanup.describe_item(item)}", markup=False)
+            if not items:
+                console.print("Nothing to clean up")
+                continue
+            picked = input("Items to delete (e.g. 1,3 or 'all', blank to cancel): ").strip().lower()
+            if not picked:
+                continue
+            try:
+                selected = items if picked == "all" else [items[int(n) - 1] for n in picked.split(",")]
+            except (ValueError, IndexError):
+                console.print("Invalid selection")
+                continue
+            counts = cleanup.apply(selected, on_result=lambda item, status, error: console.print(
+                f"[{status}] {cleanup.describe_item(item)}" + (f": {error}" if error else ""), markup=False))
+            daemon.call_or_direct("invalidate", lambda *a: None, "list_tunnels")
+            console.print(", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+        elif choice == "20":
+            from core.units import describe_status
+            try:
+                # One systemctl call for every unit's status
+                for tunnel, status in manager.tunnel_services_status().items():
+                    console.print(f"{tunnel}: {describe_status(status)}", markup=False)
+                action = input("[i]nstall, [s]tart, s[t]op, [r]estart, [u]ninstall, or blank to return: ").strip().lower()
+                if action in ("i", "s", "t", "r", "u"):
+                    tunnel = input("Tunnel ID or name: ").strip()
+                    if action == "i":
+                        tunnel_id = input(f"Tunnel ID [{tunnel}]: ").strip() or tunnel
+                        url = input("Origin URL (optional): ").strip() or None
+                        unit = manager.install_tunnel_service(tunnel_id, url=url, tunnel=tunnel,
+                                                              on_written=restarts.mark_applied)
+                        console.print(f"Installed {unit}", markup=False)
+                    elif action == "r":
+                        # Only this tunnel's unit restarts, the others keep serving
+                        manager.restart_tunnel_service(tunnel)
+                        restarts.mark_applied(tunnel)
+                        console.print(f"Restarted {tunnel}", markup=False)
+                    else:
+                        {"s": manager.start_tunnel_service, "t": manager.stop_tunnel_service,
+                         "u": manager.uninstall_tunnel_service}[action](tunnel)
+                        console.print("Done")
+            except RuntimeError as e:
+                console.print(f"Per-tunnel service error: {e}", markup=False)
+        elif choice == "21" and profiler.active():
+            console.print(f"Allocation snapshot written to {profiler.capture_allocations()}", markup=False)
         else:
             console.print("Invalid option")
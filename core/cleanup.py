@@ -0,0 +1,211 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from core import scheduler
+
+# A tunnel must have been without connectors this long to be collected
+DEFAULT_DAYS = 30
+
+# Concurrent deletions and their rate, on top of the API scheduler's limit
+CONCURRENCY = 4
+RATE = 2.0
+
+# StateStore key: {tunnel_id: last time this host saw it with connectors}
+LAST_SEEN_KEY = "tunnel_last_seen"
+
+
+def parse_time(value):
+    """Epoch seconds of an RFC 3339 timestamp from cloudflared, None for empty or zero times"""
+    if not value or str(value).startswith("0001-01-01"):
+        return None
+    text = str(value).replace("Z", "+00:00")
+    # Python before 3.11 only accepts up to microseconds
+    if "." in text:
+        head, _, tail = text.partition(".")
+        digits = len(tail) - len(tail.lstrip("0123456789"))
+        text = f"{head}.{tail[:min(digits, 6)]}{tail[digits:]}"
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+class Snapshot:
+    """Everything the collector decides on, fetched once"""
+
+    def __init__(self, tunnels, dns_routes, ip_routes, config_refs, credentials, taken_at=None):
+        self.tunnels = tunnels
+        self.dns_routes = dns_routes
+        self.ip_routes = ip_routes
+        self.config_refs = config_refs  # tunnel ids and names named by a local config.yml
+        self.credentials = credentials  # {credentials file path: tunnel id}
+        self.taken_at = taken_at or time.time()
+
+
+def scan_local(directories=None):
+    """(tunnel refs of local configs, {credentials path: tunnel id}) in the .cloudflared directories"""
+    import yaml
+    from core.watcher import default_directories, is_tunnel_config
+    refs, credentials = set(), {}
+    for directory in directories or default_directories():
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                if name in ("config.yml", "config.yaml") or is_tunnel_config(path):
+                    with open(path, "r") as f:
+                        config = yaml.safe_load(f) or {}
+                    if config.get("tunnel"):
+                        refs.add(str(config["tunnel"]))
+                elif name.endswith(".json"):
+                    with open(path, "r") as f:
+                        data = json.load(f)
+                    if isinstance(data, dict) and data.get("TunnelID"):
+                        credentials[path] = data["TunnelID"]
+            except (OSError, ValueError, yaml.YAMLError):
+                continue
+    return refs, credentials
+
+
+def take_snapshot(directories=None):
+    """
+    Tunnels, routes and local files, with the API calls made concurrently. A
+    failed listing raises, since a missing route list would make every tunnel
+    look unused.
+    """
+    from core import manager
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        tunnels = pool.submit(lambda: list(manager.iter_tunnels()))
+        dns_routes = pool.submit(manager.list_dns_routes)
+        ip_routes = pool.submit(manager.list_ip_routes)
+        refs, credentials = scan_local(directories)
+        return Snapshot(tunnels.result(), dns_routes.result(), ip_routes.result(), refs, credentials)
+
+
+def scan(days=DEFAULT_DAYS, directories=None):
+    """Take a snapshot, record which tunnels are connected and return (snapshot, plan)"""
+    from core.state import StateStore
+    snapshot = take_snapshot(directories)
+    store = StateStore()
+    try:
+        last_seen = update_last_seen(store, snapshot)
+    finally:
+        store.close()
+    return snapshot, plan(snapshot, days, last_seen)
+
+
+def update_last_seen(state, snapshot):
+    """Remember which tunnels had connectors, so their idle time is known later"""
+    last_seen, _ = state.get(LAST_SEEN_KEY, {})
+    last_seen = dict(last_seen or {})
+    for tunnel in snapshot.tunnels:
+        if tunnel.get("connections"):
+            last_seen[tunnel["id"]] = snapshot.taken_at
+    known = {tunnel.get("id") for tunnel in snapshot.tunnels}
+    last_seen = {tid: seen for tid, seen in last_seen.items() if tid in known}
+    state.put(LAST_SEEN_KEY, last_seen)
+    return last_seen
+
+
+def idle_since(tunnel, last_seen=None):
+    """When the tunnel was last known to have connectors, falling back to its creation"""
+    times = [parse_time(tunnel.get("conns_inactive_at")), (last_seen or {}).get(tunnel.get("id")),
+             parse_time(tunnel.get("created_at"))]
+    times = [t for t in times if t]
+    return max(times) if times else None
+
+
+def plan(snapshot, days=DEFAULT_DAYS, last_seen=None):
+    """
+    Items to collect, as dicts with kind ("tunnel" or "credentials"), id, name,
+    paths and reason. A tunnel qualifies when it has no connectors for days,
+    no DNS or IP routes and no local config names it; a credentials file when
+    its tunnel no longer exists.
+    """
+    routed = {r.get("tunnel_id") for r in snapshot.dns_routes} | {r.get("tunnel_id") for r in snapshot.ip_routes}
+    credentials_of = {}
+    for path, tunnel_id in snapshot.credentials.items():
+        credentials_of.setdefault(tunnel_id, []).append(path)
+    cutoff = snapshot.taken_at - days * 86400
+    items = []
+    for tunnel in snapshot.tunnels:
+        tunnel_id, name = tunnel.get("id"), tunnel.get("name")
+        if not tunnel_id or parse_time(tunnel.get("deleted_at")):
+            continue
+        if tunnel.get("connections") or tunnel_id in routed:
+            continue
+        if tunnel_id in snapshot.config_refs or name in snapshot.config_refs:
+            continue
+        since = idle_since(tunnel, last_seen)
+        if since is None or since > cutoff:
+            continue
+        idle_days = int((snapshot.taken_at - since) // 86400)
+        items.append({"kind": "tunnel", "id": tunnel_id, "name": name,
+                      "paths": sorted(credentials_of.get(tunnel_id, [])),
+                      "reason": f"no connectors for {idle_days} days, no routes, not in a local config"})
+    existing = {tunnel.get("id") for tunnel in snapshot.tunnels}
+    for tunnel_id, paths in sorted(credentials_of.items()):
+        if tunnel_id not in existing and tunnel_id not in snapshot.config_refs:
+            items.append({"kind": "credentials", "id": tunnel_id, "name": None, "paths": sorted(paths),
+                          "reason": "tunnel no longer exists in the account"})
+    return items
+
+
+def apply(items, concurrency=CONCURRENCY, rate=RATE, on_result=None):
+    """
+    Delete planned tunnels (and their local credentials) and remove orphaned
+    credentials concurrently under a rate limit. The .cloudflared directories
+    are snapshotted first. on_result(item, status, error) is called per item
+    with status "deleted", "removed" or "failed". Returns counts per status.
+    """
+    from core import manager
+    from core.dns_import import RateLimiter
+    from core.snapshots import snapshot_before
+
+    if any(item["paths"] for item in items):
+        snapshot_before("tunnel cleanup")
+    limiter = RateLimiter(rate)
+    counts = {}
+    counts_lock = threading.Lock()
+
+    def report(item, status, error=None):
+        with counts_lock:
+            counts[status] = counts.get(status, 0) + 1
+        if on_result:
+            on_result(item, status, error)
+
+    def collect(item):
+        try:
+            if item["kind"] == "tunnel":
+                limiter.wait()
+                # Bulk cleanup yields to interactive calls in the API scheduler
+                with scheduler.background():
+                    result = manager.delete_tunnel(item["id"], capture_output=True)
+                if result.returncode != 0:
+                    report(item, "failed", (result.stderr or result.stdout or "").strip()
+                           or f"exit code {result.returncode}")
+                    return
+            for path in item["paths"]:
+                if os.path.exists(path):
+                    os.remove(path)
+            report(item, "deleted" if item["kind"] == "tunnel" else "removed")
+        except (OSError, subprocess.SubprocessError) as e:
+            report(item, "failed", str(e))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(collect, items))
+    return counts
+
+
+def describe_item(item):
+    if item["kind"] == "tunnel":
+        return f"tunnel {item['name']} ({item['id']}): {item['reason']}"
+    return f"credentials {', '.join(item['paths'])}: {item['reason']}"
@@ -1,21 +1,69 @@
+import copy
+import os
 import yaml
 from pathlib import Path
 
 CONFIG_PATH = Path.home() / ".cloudflared" / "config.yml"
 
-def load_config():
-    if CONFIG_PATH.exists():
-        with open(CONFIG_PATH, 'r') as f:
-            return yaml.safe_load(f)
-    return {}
+# ArgoGUI's own local data (log index, state, journals...)
+ARGOGUI_DIR = Path.home() / ".argogui"
+
+# Parsed configs by path. A regular file read while its directory had a live
+# inotify watch is trusted until the watcher invalidates it, as long as that
+# same watch is still in place; others (and symlinks, whose target may live
+# elsewhere) are revalidated with a stat().
+_cache = {}
+_watchers = []
+
+def _watch_generation(directory):
+    for watcher in _watchers:
+        generation = watcher.generation(directory)
+        if generation is not None:
+            return generation
+    return None
+
+def load_config(path=CONFIG_PATH):
+    path = os.path.abspath(str(path))
+    # Taken before reading, so a watch lost meanwhile can't vouch for this read
+    generation = _watch_generation(os.path.dirname(path))
+    entry = _cache.get(path)
+    if entry and generation is not None and entry[2] == generation:
+        return copy.deepcopy(entry[1])
+    try:
+        st = os.stat(path)
+    except OSError:
+        _cache.pop(path, None)
+        return {}
+    stamp = (st.st_mtime_ns, st.st_size)
+    trusted = None if os.path.islink(path) else generation
+    if entry and entry[0] == stamp:
+        _cache[path] = (stamp, entry[1], trusted)
+        return copy.deepcopy(entry[1])
+    with open(path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+    _cache[path] = (stamp, config, trusted)
+    return copy.deepcopy(config)
+
+def invalidate(path=None):
+    """Drop a cached config (or all of them)"""
+    if path is None:
+        _cache.clear()
+    else:
+        _cache.pop(os.path.abspath(str(path)), None)
+
+def attach_watcher(watcher):
+    """Let a core.watcher.Watcher invalidate cached configs precisely"""
+    watcher.subscribe(lambda event: invalidate(event.path))
+    _watchers.append(watcher)
 
 def save_config(config):
     CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
     with open(CONFIG_PATH, 'w') as f:
         yaml.safe_dump(config, f)
+    invalidate(CONFIG_PATH)
 
 
 def update_config(new_entries: dict):
     config = load_config()
     config.update(new_entries)
-    save_config(config)
\ No newline at end of file
+    save_config(config)
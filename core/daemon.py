@@ -0,0 +1,257 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from core import scheduler
+from core.config import ARGOGUI_DIR
+
+SOCKET_PATH = ARGOGUI_DIR / "daemon.sock"
+
+# Seconds a client waits for a cached read, and for any other call. The latter
+# outlasts the API scheduler's retries and backoff (up to MAX_BACKOFF each), so a
+# slow create or delete is answered rather than abandoned while it still runs.
+READ_TIMEOUT = 10
+CALL_TIMEOUT = 300
+
+# Seconds a cached answer is served before it is fetched again
+CACHE_TTL = {
+    "check_cloudflared_installed": 300,
+    "is_service_running": 5,
+    "list_tunnels": 30,
+}
+
+# Calls that make cached answers wrong
+INVALIDATES = {
+    "create_tunnel": ["list_tunnels"],
+    "delete_tunnel": ["list_tunnels"],
+    "start_service": ["is_service_running"],
+    "stop_service": ["is_service_running"],
+    "restart_service": ["is_service_running"],
+}
+
+
+class Daemon:
+    """
+    Resident process state: warm caches in front of core.manager, the connectors
+    it supervises and the local state snapshot.
+    """
+
+    def __init__(self, refresh_interval=15):
+        from core import manager
+        from core.fleet import LocalConnectors, build_methods
+        from core.state import StateStore
+        from core.utils import check_cloudflared_installed
+
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.refresh_interval = refresh_interval
+        self.state = StateStore()
+        self.connectors = LocalConnectors()
+        self.started = time.time()
+
+        self.direct = build_methods(self.connectors)
+        self.direct.update({
+            "check_cloudflared_installed": check_cloudflared_installed,
+            "create_tunnel": manager.create_tunnel,
+            "delete_tunnel": manager.delete_tunnel,
+            "tunnel_info": lambda tunnel: _captured(["cloudflared", "tunnel", "info", tunnel]),
+            "api_stats": lambda: scheduler.get_scheduler().stats(),
+        })
+        self.methods = dict(self.direct)
+        for name in CACHE_TTL:
+            self.methods[name] = (lambda n: lambda: self.cached(n))(name)
+        for name, keys in INVALIDATES.items():
+            self.methods[name] = (lambda n, k: lambda *a: self.invalidating(n, k, *a))(name, keys)
+        self.methods["invalidate"] = self.invalidate
+        self.methods["ping"] = lambda: {"pid": os.getpid(), "uptime": time.time() - self.started}
+
+    def cached(self, name):
+        with self.lock:
+            entry = self.cache.get(name)
+        if entry and time.monotonic() - entry[1] < CACHE_TTL[name]:
+            return entry[0]
+        return self.fetch(name)
+
+    def fetch(self, name):
+        value = self.direct[name]()
+        with self.lock:
+            self.cache[name] = (value, time.monotonic())
+        if name == "list_tunnels":
+            try:
+                self.state.put("tunnels", json.loads(value))
+            except ValueError:
+                pass
+        elif name == "is_service_running":
+            self.state.put("service_running", value)
+        elif name == "check_cloudflared_installed":
+            self.state.put("cloudflared_installed", value)
+        return value
+
+    def invalidate(self, *names):
+        with self.lock:
+            for name in names or list(self.cache):
+                self.cache.pop(name, None)
+        return True
+
+    def invalidating(self, name, keys, *args):
+        try:
+            return self.direct[name](*args)
+        finally:
+            self.invalidate(*keys)
+
+    def refresh_loop(self):
+        """Keep cached answers warm so clients never wait on cloudflared"""
+        while True:
+            for name in CACHE_TTL:
+                try:
+                    with scheduler.background():
+                        self.fetch(name)
+                except Exception:
+                    pass
+            time.sleep(self.refresh_interval)
+
+    def handle(self, request):
+        try:
+            method = self.methods[request["m"]]
+        except KeyError:
+            return {"ok": False, "e": f"unknown method: {request.get('m')}"}
+        try:
+            return {"ok": True, "r": method(*request.get("a", []))}
+        except Exception as e:
+            return {"ok": False, "e": str(e)}
+
+
+def _captured(args):
+    result = scheduler.run(args, retries=2, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"{' '.join(args)} failed")
+    return result.stdout
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One JSON request per line, one JSON reply per line"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                reply = {"ok": False, "e": f"bad request: {e}"}
+            else:
+                reply = self.server.daemon.handle(request)
+            self.wfile.write(json.dumps(reply, default=str).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def run_daemon(socket_path=SOCKET_PATH):
+    """Serve the daemon on a Unix domain socket until interrupted"""
+    if not hasattr(socket, "AF_UNIX"):
+        print("The daemon needs Unix domain sockets, which this platform does not support.")
+        return
+    socket_path = str(socket_path)
+    ARGOGUI_DIR.mkdir(parents=True, exist_ok=True)
+    if is_running(socket_path):
+        print(f"A daemon is already listening on {socket_path}")
+        return
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    daemon = Daemon()
+    # New or removed credentials mean the tunnel list changed elsewhere
+    from core import config
+    from core.watcher import Watcher, CREDENTIALS_ADDED, CREDENTIALS_REMOVED
+    watcher = Watcher()
+    config.attach_watcher(watcher)
+    watcher.subscribe(lambda event: event.kind in (CREDENTIALS_ADDED, CREDENTIALS_REMOVED)
+                      and daemon.invalidate("list_tunnels"))
+    watcher.start()
+    server = _Server(socket_path, _Handler)
+    os.chmod(socket_path, 0o600)
+    server.daemon = daemon
+    threading.Thread(target=daemon.refresh_loop, daemon=True).start()
+    print(f"ArgoGUI daemon listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        watcher.stop()
+        for tunnel_id in list(daemon.connectors.list()):
+            daemon.connectors.stop(tunnel_id)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class DaemonUnavailable(OSError):
+    """No daemon accepted the connection, so the request was never sent"""
+
+
+class DaemonNoReply(RuntimeError):
+    """The request was sent but no answer came back; the daemon may still have run it"""
+
+
+def call(method, *args, socket_path=SOCKET_PATH, timeout=None):
+    """
+    Call the daemon. Raises DaemonUnavailable if none is running, RuntimeError
+    if the call failed or the daemon stopped answering after it was sent.
+    timeout defaults to READ_TIMEOUT for cached reads and CALL_TIMEOUT otherwise.
+    """
+    if timeout is None:
+        timeout = READ_TIMEOUT if method in CACHE_TTL or method in ("ping", "invalidate") else CALL_TIMEOUT
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonUnavailable("Unix domain sockets are not available")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise DaemonUnavailable(str(e)) from e
+        data = b""
+        try:
+            sock.sendall(json.dumps({"m": method, "a": list(args)}).encode() + b"\n")
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        except OSError as e:
+            # The daemon may still be running the call, it must not be run again here
+            raise DaemonNoReply(f"daemon did not answer {method}: {e}") from e
+    if not data:
+        raise DaemonNoReply(f"daemon closed the connection during {method}")
+    reply = json.loads(data)
+    if not reply.get("ok"):
+        raise RuntimeError(reply.get("e", "unknown error"))
+    return reply.get("r")
+
+
+def call_or_direct(method, direct, *args):
+    """
+    Ask the daemon if one is running, otherwise call direct(*args) in-process.
+    A cached read without an answer is retried in-process too; any other call
+    (e.g. one in INVALIDATES) may already have run, so it raises instead.
+    """
+    try:
+        return call(method, *args)
+    except DaemonUnavailable:
+        return direct(*args)
+    except DaemonNoReply:
+        if method not in CACHE_TTL:
+            raise
+        return direct(*args)
+
+
+def is_running(socket_path=SOCKET_PATH):
+    try:
+        call("ping", socket_path=socket_path, timeout=1)
+        return True
+    except (OSError, RuntimeError, ValueError):
+        return False
@@ -0,0 +1,313 @@
+import io
+import json
+import os
+import platform
+import queue
+import re
+import subprocess
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core import scheduler
+from core.config import ARGOGUI_DIR
+
+BUNDLE_DIR = ARGOGUI_DIR / "bundles"
+
+# Seconds a single command may take, and the whole bundle
+COMMAND_TIMEOUT = 20
+BUNDLE_TIMEOUT = 60
+
+# Keys whose values never leave the machine
+_SECRET_KEY = re.compile(r"secret|token|password|passwd|private|api.?key|credential", re.IGNORECASE)
+_SECRET_TEXT = re.compile(r"(?im)^(\s*[\w.-]*(?:secret|token|password|passwd|api.?key)[\w.-]*\s*[:=]\s*).+$")
+# credentials-file is a path, not a secret
+_NOT_SECRET = {"credentials-file", "credentials_file"}
+
+
+def redact(value):
+    """Copy of parsed config/credentials data with secret values replaced"""
+    if isinstance(value, dict):
+        return {k: "REDACTED" if _SECRET_KEY.search(str(k)) and k not in _NOT_SECRET and v not in (None, "")
+                else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def redact_text(text):
+    return _SECRET_TEXT.sub(r"\1REDACTED", text)
+
+
+def redact_args(args):
+    """Command line with values of secret options (e.g. --token) replaced"""
+    redacted = []
+    for i, arg in enumerate(args):
+        option, equals, _ = arg.partition("=")
+        if equals and _SECRET_KEY.search(option):
+            redacted.append(f"{option}=REDACTED")
+        elif i and args[i - 1].startswith("-") and _SECRET_KEY.search(args[i - 1]) and "=" not in args[i - 1]:
+            redacted.append("REDACTED")
+        else:
+            redacted.append(arg)
+    return redacted
+
+
+def _command(args, timeout=COMMAND_TIMEOUT):
+    """stdout and stderr of a command as text, never raising for a failed or missing command"""
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    except FileNotFoundError:
+        return f"{args[0]}: not found\n"
+    except subprocess.TimeoutExpired:
+        return f"{' '.join(args)}: timed out after {timeout}s\n"
+    output = result.stdout
+    if result.stderr:
+        output += ("\n" if output else "") + result.stderr
+    if result.returncode:
+        output += f"\n(exit code {result.returncode})\n"
+    return output
+
+
+def _read_config_file(path):
+    """A config or credentials file with secrets redacted"""
+    import yaml
+    with open(path, "r") as f:
+        text = f.read()
+    try:
+        if path.endswith(".json"):
+            return json.dumps(redact(json.loads(text)), indent=2)
+        data = yaml.safe_load(text)
+        if isinstance(data, dict):
+            return yaml.safe_dump(redact(data), sort_keys=False)
+    except (ValueError, yaml.YAMLError):
+        pass
+    return redact_text(text)
+
+
+# Probes return {path inside the bundle: text}, or yield (path, text) pairs
+# so that results land in the bundle as they finish
+
+def probe_version():
+    return {"version.txt": _command(["cloudflared", "--version"])}
+
+
+def probe_service():
+    from core import manager
+    files = {"service/running.txt": f"{manager.is_service_running()}\n"}
+    if platform.system().lower() == "windows":
+        files["service/status.txt"] = _command(["sc", "query", "Cloudflared"])
+    else:
+        files["service/status.txt"] = _command(["systemctl", "status", "cloudflared", "--no-pager"])
+    files["service/diagnosis.txt"] = manager.diagnose_service_config()
+    return files
+
+
+def probe_configs():
+    from core import manager
+    files = {}
+    directories = {"user": os.path.expanduser("~/.cloudflared"), "service": manager.get_service_config_dir()}
+    for label, directory in directories.items():
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError as e:
+            files[f"configs/{label}/ERROR.txt"] = f"{directory}: {e}\n"
+            continue
+        for name in names:
+            path = os.path.join(directory, name)
+            if name.endswith(".pem"):
+                # Certificates are only listed, never copied
+                files[f"configs/{label}/{name}.txt"] = f"present, {os.path.getsize(path)} bytes, not included\n"
+            elif name.endswith((".yml", ".yaml", ".json")) and os.path.isfile(path):
+                try:
+                    files[f"configs/{label}/{name}"] = _read_config_file(path)
+                except OSError as e:
+                    files[f"configs/{label}/{name}.txt"] = f"unreadable: {e}\n"
+    return files
+
+
+def probe_tunnels():
+    """The tunnel list, on its own so it lands even if `tunnel info` calls time out"""
+    from core import manager
+    return {"tunnels/list.json": json.dumps(list(manager.iter_tunnels()), indent=2)}
+
+
+def probe_tunnel_info(workers=8):
+    """`tunnel info` of every tunnel, fetched concurrently and yielded as each one finishes"""
+    from core import manager
+    ids = [t.get("id") for t in manager.iter_tunnels() if t.get("id")]
+
+    def info(tunnel_id):
+        # Pool threads don't inherit the caller's priority
+        with scheduler.background():
+            try:
+                return manager.tunnel_info(tunnel_id, capture_output=True).stdout
+            except subprocess.CalledProcessError as e:
+                return f"{e.stderr or e}\n"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(ids)))) as pool:
+        futures = {pool.submit(info, tunnel_id): tunnel_id for tunnel_id in ids}
+        for future in as_completed(futures):
+            yield f"tunnels/info-{futures[future]}.txt", future.result()
+
+
+def probe_routes():
+    from core import manager
+    files = {}
+    for kind, fetch in (("dns", manager.list_dns_routes), ("ip", manager.list_ip_routes)):
+        try:
+            files[f"routes/{kind}.json"] = json.dumps(fetch(), indent=2)
+        except RuntimeError as e:
+            files[f"routes/{kind}-error.txt"] = f"{e}\n"
+    return files
+
+
+def probe_logs(hours=24, limit=5000):
+    from core.logstore import LogStore, format_record
+    files = {}
+    if platform.system().lower() == "linux":
+        files["logs/service-journal.txt"] = _command(
+            ["journalctl", "-u", "cloudflared", "-o", "cat", "--no-pager", "--since", f"-{hours}h", "-n", str(limit)])
+    store = LogStore()
+    try:
+        records = store.query(since=time.time() - hours * 3600, limit=limit)
+    finally:
+        store.close()
+    files["logs/index.txt"] = redact_text("\n".join(format_record(r) for r in records) + "\n")
+    return files
+
+
+def probe_processes():
+    """/proc counters of every cloudflared process on this host"""
+    from core.procmon import read_sample
+    processes = []
+    try:
+        pids = [int(p) for p in os.listdir("/proc") if p.isdigit()]
+    except OSError:
+        return {"processes.json": "[]"}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().split(b"\0")
+        except OSError:
+            continue
+        if not cmdline or not os.path.basename(cmdline[0]).startswith(b"cloudflared"):
+            continue
+        sample = read_sample(pid)
+        if sample is None:
+            continue
+        cpu_ticks, rss_bytes, fds, read_bytes, write_bytes, threads = sample
+        processes.append({"pid": pid, "cmdline": redact_args([a.decode(errors="replace") for a in cmdline if a]),
+                          "cpu_seconds": cpu_ticks / (os.sysconf("SC_CLK_TCK") or 100), "rss_bytes": rss_bytes,
+                          "fds": fds, "read_bytes": read_bytes, "write_bytes": write_bytes, "threads": threads})
+    return {"processes.json": json.dumps(processes, indent=2)}
+
+
+def probe_system():
+    return {"system.json": json.dumps({
+        "platform": platform.platform(), "python": platform.python_version(),
+        "hostname": platform.node(), "collected_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }, indent=2)}
+
+
+PROBES = {
+    "version": probe_version,
+    "service": probe_service,
+    "configs": probe_configs,
+    "tunnels": probe_tunnels,
+    "tunnel_info": probe_tunnel_info,
+    "routes": probe_routes,
+    "logs": probe_logs,
+    "processes": probe_processes,
+    "system": probe_system,
+}
+
+
+def _add_file(tar, name, text, mtime):
+    data = text.encode("utf-8", errors="replace") if isinstance(text, str) else (text or b"")
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    info.mode = 0o600
+    tar.addfile(info, io.BytesIO(data))
+
+
+def collect_bundle(path=None, probes=None, timeout=BUNDLE_TIMEOUT, on_progress=None):
+    """
+    Run every probe concurrently and stream each file into a gzipped tarball
+    as soon as a probe produces it, so the bundle takes about as long as the
+    slowest probe and a timed-out probe still contributes what it finished.
+    manifest.json records each probe's timing, files and error.
+    on_progress(name, entry) is called as each probe completes. Returns the path.
+    """
+    probes = probes or PROBES
+    if path is None:
+        os.makedirs(BUNDLE_DIR, exist_ok=True)
+        path = os.path.join(BUNDLE_DIR, f"argogui-diagnostics-{time.strftime('%Y%m%d-%H%M%S')}.tar.gz")
+    root = os.path.basename(path).split(".tar")[0]
+    started = time.perf_counter()
+    manifest = {"created": time.time(), "probes": {}}
+    pool = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="diagnose")
+
+    # Probe threads put ("file", name, path, text) and ("done", name, error, begin, end) here
+    results = queue.Queue()
+
+    def run(name, probe):
+        begin = time.perf_counter()
+        error = None
+        try:
+            # A support bundle must not hold up interactive API calls
+            with scheduler.background():
+                files = probe()
+                for file_name, text in files.items() if isinstance(files, dict) else files:
+                    results.put(("file", name, file_name, text))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        results.put(("done", name, error, begin, time.perf_counter()))
+
+    for name, probe in probes.items():
+        pool.submit(run, name, probe)
+    written = {name: [] for name in probes}
+    tmp = f"{path}.tmp"
+    try:
+        with tarfile.open(tmp, "w:gz") as tar:
+            pending = set(probes)
+            deadline = started + timeout
+            while pending:
+                try:
+                    message = results.get(timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if message[0] == "file":
+                    _, name, file_name, text = message
+                    _add_file(tar, f"{root}/{file_name}", text, int(time.time()))
+                    written[name].append(file_name)
+                    continue
+                _, name, error, begin, end = message
+                pending.discard(name)
+                entry = {"start": round(begin - started, 3), "seconds": round(end - begin, 3),
+                         "files": sorted(written[name]), "error": error}
+                manifest["probes"][name] = entry
+                if on_progress:
+                    on_progress(name, entry)
+            for name in sorted(pending):
+                # Whatever the probe streamed before the deadline is kept
+                entry = {"start": 0.0, "seconds": None, "files": sorted(written[name]),
+                         "error": f"timed out after {timeout}s"}
+                manifest["probes"][name] = entry
+                if on_progress:
+                    on_progress(name, entry)
+            manifest["seconds"] = round(time.perf_counter() - started, 3)
+            _add_file(tar, f"{root}/manifest.json", json.dumps(manifest, indent=2), int(time.time()))
+        os.replace(tmp, path)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def describe_progress(name, entry):
+    if entry["error"]:
+        return f"{name}: failed ({entry['error']})"
+    return f"{name}: {len(entry['files'])} files in {entry['seconds']:.2f}s"
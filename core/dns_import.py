@@ -0,0 +1,218 @@
+import csv
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import scheduler
+
+# Tunnel CNAME targets look like <uuid>.cfargotunnel.com
+_TUNNEL_TARGET = re.compile(r"^([0-9a-f-]{36})\.cfargotunnel\.com\.?$", re.IGNORECASE)
+_ZONE_TYPES = {"A", "AAAA", "CNAME"}
+_ZONE_CLASSES = {"IN", "CH", "HS"}
+
+
+def parse_csv(path, default_tunnel=None):
+    """
+    Yield (line_no, hostname, tunnel) from a CSV with hostname[,tunnel] columns.
+    A header row naming a "hostname" column is optional. hostname is None for
+    a row that leaves the header's hostname column empty.
+    """
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        columns = None
+        for line_no, row in enumerate(reader, start=1):
+            row = [cell.strip() for cell in row]
+            if not any(row) or row[0].startswith("#"):
+                continue
+            if columns is None and "hostname" in [c.lower() for c in row]:
+                columns = [c.lower() for c in row]
+                continue
+            if columns:
+                record = dict(zip(columns, row))
+                hostname, tunnel = record.get("hostname"), record.get("tunnel")
+            else:
+                hostname, tunnel = row[0], (row[1] if len(row) > 1 else None)
+            yield line_no, hostname.rstrip(".").lower() if hostname else None, tunnel or default_tunnel
+
+
+def parse_zone(path, default_tunnel=None):
+    """
+    Yield (line_no, hostname, tunnel) from a BIND zone file. CNAMEs pointing at
+    <uuid>.cfargotunnel.com route to that tunnel; other A/AAAA/CNAME records
+    route to default_tunnel (and are skipped without one).
+    """
+    origin = ""
+    owner = None
+    with open(path, "r") as f:
+        pending = ""
+        depth = 0
+        start_line = 0
+        for line_no, raw in enumerate(f, start=1):
+            line = raw.split(";", 1)[0].rstrip()
+            if not pending:
+                start_line = line_no
+            pending = f"{pending} {line}" if pending else line
+            depth += line.count("(") - line.count(")")
+            if depth > 0:
+                continue
+            line, pending, depth = pending.replace("(", " ").replace(")", " "), "", 0
+            if not line.strip():
+                continue
+
+            tokens = line.split()
+            if tokens[0].upper() == "$ORIGIN":
+                origin = tokens[1].rstrip(".")
+                continue
+            if tokens[0].startswith("$"):
+                continue
+            # Lines starting with whitespace reuse the previous owner name
+            if line[0].isspace():
+                name = owner
+            else:
+                name = tokens.pop(0)
+                owner = name
+            while tokens and (tokens[0].isdigit() or tokens[0].upper() in _ZONE_CLASSES):
+                tokens.pop(0)
+            if len(tokens) < 2 or tokens[0].upper() not in _ZONE_TYPES or name is None:
+                continue
+            rtype, target = tokens[0].upper(), tokens[1]
+
+            if name == "@":
+                hostname = origin
+            elif name.endswith("."):
+                hostname = name.rstrip(".")
+            else:
+                hostname = f"{name}.{origin}" if origin else name
+
+            match = _TUNNEL_TARGET.match(target) if rtype == "CNAME" else None
+            tunnel = match.group(1).lower() if match else default_tunnel
+            if tunnel:
+                yield start_line, hostname.lower(), tunnel
+
+
+def parse_file(path, default_tunnel=None):
+    """Pick the parser from the file extension (.csv, anything else is a zone file)"""
+    if path.lower().endswith(".csv"):
+        return parse_csv(path, default_tunnel)
+    return parse_zone(path, default_tunnel)
+
+
+def existing_hostnames():
+    """
+    Hostnames that already have a tunnel DNS route, fetched once. Raises rather
+    than returning an empty set, which would send every row to cloudflared.
+    """
+    from core import manager
+    records = manager.list_dns_routes()
+    return {str(r.get("hostname", "")).rstrip(".").lower() for r in records if r.get("hostname")}
+
+
+class RateLimiter:
+    """Spaces calls at most rate per second across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def load_checkpoint(path):
+    """Hostnames already routed by a previous run"""
+    done = set()
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of an interrupted run
+                if entry.get("ok"):
+                    done.add(entry["hostname"])
+    return done
+
+
+def import_routes(path, default_tunnel=None, concurrency=8, rate=5.0, checkpoint=None,
+                  dry_run=False, on_result=None, existing=None):
+    """
+    Stream routes from a CSV or zone file and add the missing ones concurrently.
+    Every row gets a result; failures don't stop the import. Successful rows are
+    appended to the checkpoint file (default: <path>.checkpoint) so a rerun
+    continues where an interrupted import left off.
+
+    on_result(result) is called for each row with a dict of line, hostname,
+    tunnel, status ("added", "exists", "duplicate", "done", "planned", "invalid",
+    "failed") and error. Returns counts per status.
+    """
+    from core import manager
+
+    checkpoint = checkpoint or f"{path}.checkpoint"
+    done = load_checkpoint(checkpoint)
+    existing = existing_hostnames() if existing is None else existing
+    limiter = RateLimiter(rate)
+    counts = {}
+    counts_lock = threading.Lock()
+    checkpoint_file = None if dry_run else open(checkpoint, "a")
+
+    def report(line, hostname, tunnel, status, error=None):
+        with counts_lock:
+            counts[status] = counts.get(status, 0) + 1
+            if checkpoint_file and status == "added":
+                checkpoint_file.write(json.dumps({"hostname": hostname, "tunnel": tunnel, "ok": True}) + "\n")
+                checkpoint_file.flush()
+        if on_result:
+            on_result({"line": line, "hostname": hostname, "tunnel": tunnel, "status": status, "error": error})
+
+    def apply(line, hostname, tunnel):
+        limiter.wait()
+        try:
+            # Bulk work yields to interactive calls in the API scheduler
+            with scheduler.background():
+                manager.add_dns_route(tunnel, hostname, capture_output=True)
+            report(line, hostname, tunnel, "added")
+        except subprocess.CalledProcessError as e:
+            report(line, hostname, tunnel, "failed", (e.stderr or str(e)).strip())
+        except Exception as e:
+            report(line, hostname, tunnel, "failed", str(e))
+
+    seen = set()
+    # Bound the number of queued rows so huge files are streamed, not loaded
+    slots = threading.BoundedSemaphore(concurrency * 4)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for line, hostname, tunnel in parse_file(path, default_tunnel):
+                if not hostname:
+                    report(line, hostname, tunnel, "invalid", "no hostname in this row")
+                    continue
+                if not tunnel:
+                    report(line, hostname, tunnel, "failed", "no tunnel given for this row")
+                elif hostname in seen:
+                    report(line, hostname, tunnel, "duplicate")
+                elif hostname in done:
+                    report(line, hostname, tunnel, "done")
+                elif hostname in existing:
+                    report(line, hostname, tunnel, "exists")
+                elif dry_run:
+                    report(line, hostname, tunnel, "planned")
+                else:
+                    slots.acquire()
+                    future = pool.submit(apply, line, hostname, tunnel)
+                    future.add_done_callback(lambda _: slots.release())
+                seen.add(hostname)
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+    return counts
@@ -0,0 +1,297 @@
+import http.client
+import re
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import yaml
+
+RULE_HEADER = "X-Argogui-Rule"
+
+# Hop-by-hop headers are not forwarded (RFC 7230 section 6.1)
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+              "te", "trailers", "transfer-encoding", "upgrade"}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+
+def parse_duration(value, default=30.0):
+    """Parse a Go style duration ("30s", "1m30s", "500ms") or a number of seconds"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = _DURATION_PART.findall(str(value))
+    if not parts:
+        return default
+    return sum(float(n) * scale[unit] for n, unit in parts)
+
+
+class IngressRule:
+    """One ingress rule with cloudflared's matching semantics"""
+
+    def __init__(self, index, hostname=None, path=None, service="http_status:503", origin_request=None):
+        self.index = index
+        self.hostname = hostname
+        self.path = path
+        self.path_re = re.compile(path) if path else None
+        self.service = service
+        self.origin_request = origin_request or {}
+
+    def matches(self, host, path):
+        if self.hostname and self.hostname != "*":
+            host = host.split(":", 1)[0].lower()
+            pattern = self.hostname.lower()
+            if pattern.startswith("*."):
+                # A wildcard matches any subdomain, not the bare domain
+                if not host.endswith(pattern[1:]):
+                    return False
+            elif host != pattern:
+                return False
+        if self.path_re and not self.path_re.search(path):
+            return False
+        return True
+
+    def label(self):
+        return f"#{self.index} {self.hostname or '*'}{' ' + self.path if self.path else ''} -> {self.service}"
+
+
+def load_rules(config):
+    """Build ingress rules from a parsed config (ingress list, or legacy top-level url)"""
+    defaults = config.get("originRequest") or {}
+    ingress = config.get("ingress")
+    if not ingress:
+        service = config.get("url") or "http_status:503"
+        return [IngressRule(0, service=service, origin_request=dict(defaults))]
+    rules = []
+    for index, entry in enumerate(ingress):
+        origin_request = dict(defaults)
+        origin_request.update(entry.get("originRequest") or {})
+        rules.append(IngressRule(index, entry.get("hostname"), entry.get("path"),
+                                 entry.get("service", "http_status:503"), origin_request))
+    last = rules[-1]
+    if last.hostname or last.path:
+        raise ValueError("The last ingress rule must match all requests (no hostname or path)")
+    return rules
+
+
+def load_rules_file(path):
+    with open(path, "r") as f:
+        return load_rules(yaml.safe_load(f) or {})
+
+
+class RuleStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.latencies.append(seconds)
+            if error:
+                self.errors += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(stats, elapsed):
+    """Turn {rule_label: RuleStats} into report rows"""
+    rows = []
+    for label, rule_stats in stats.items():
+        latencies = sorted(rule_stats.latencies)
+        count = len(latencies)
+        rows.append({
+            "rule": label,
+            "requests": count,
+            "rps": count / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p90_ms": percentile(latencies, 90) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "error_rate": rule_stats.errors / count if count else 0.0,
+        })
+    return rows
+
+
+class _OriginHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection whose SNI/verified name can differ from the origin host"""
+
+    def __init__(self, host, port, server_name=None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.server_name = server_name
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.server_name or self.host)
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; don't let Nagle delay the body
+    disable_nagle_algorithm = True
+
+    def _proxy(self):
+        emulator = self.server.emulator
+        start = time.perf_counter()
+        host = self.headers.get("Host", "")
+        rule = emulator.match(host, urlsplit(self.path).path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+        try:
+            status, headers, payload = emulator.forward(rule, self.command, self.path, self.headers, body)
+            error = status >= 500
+        except Exception as e:
+            status, headers, payload = 502, [], f"Bad gateway: {e}".encode()
+            error = True
+        self.send_response(status)
+        for name, value in headers:
+            if name.lower() not in HOP_BY_HOP and name.lower() != "content-length":
+                self.send_header(name, value)
+        self.send_header(RULE_HEADER, str(rule.index))
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        emulator.stats.setdefault(rule.label(), RuleStats()).record(time.perf_counter() - start, error)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_HEAD = do_OPTIONS = _proxy
+
+    def log_message(self, format, *args):
+        pass
+
+
+class IngressEmulator:
+    """
+    Local stand-in for the Cloudflare edge plus cloudflared: applies a config's
+    ingress rules and originRequest settings and proxies HTTP to the origins.
+    """
+
+    def __init__(self, rules, host="127.0.0.1", port=0):
+        self.rules = rules
+        self.stats = {rule.label(): RuleStats() for rule in rules}
+        self.server = ThreadingHTTPServer((host, port), _ProxyHandler)
+        self.server.daemon_threads = True
+        self.server.emulator = self
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def match(self, host, path):
+        for rule in self.rules:
+            if rule.matches(host, path):
+                return rule
+        return self.rules[-1]
+
+    def forward(self, rule, method, path, headers, body):
+        service = rule.service
+        if service.startswith("http_status:"):
+            return int(service.split(":", 1)[1]), [], b""
+        origin = urlsplit(service)
+        if origin.scheme not in ("http", "https"):
+            return 502, [], f"Service {service} cannot be emulated over HTTP".encode()
+
+        opts = rule.origin_request
+        timeout = parse_duration(opts.get("connectTimeout"), 30.0)
+        if origin.scheme == "https":
+            context = ssl.create_default_context()
+            if opts.get("noTLSVerify"):
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            conn = _OriginHTTPSConnection(origin.hostname, origin.port or 443, timeout=timeout,
+                                          context=context, server_name=opts.get("originServerName"))
+        else:
+            conn = http.client.HTTPConnection(origin.hostname, origin.port or 80, timeout=timeout)
+
+        forward_headers = {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP}
+        if opts.get("httpHostHeader"):
+            forward_headers["Host"] = opts["httpHostHeader"]
+        target = (origin.path.rstrip("/") + path) if origin.path else path
+        try:
+            conn.request(method, target, body=body, headers=forward_headers)
+            resp = conn.getresponse()
+            return resp.status, resp.getheaders(), resp.read()
+        finally:
+            conn.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def report(self, elapsed):
+        return summarize(self.stats, elapsed)
+
+
+def run_load(address, targets, concurrency=10, total=1000, timeout=30.0, rules=None):
+    """
+    Send total requests to the emulator from concurrency workers, cycling through
+    targets given as "host/path" strings. Returns (per-rule report rows, elapsed).
+    Pass the emulator's rules to label rows with the rule they matched.
+    """
+    labels = {str(rule.index): rule.label() for rule in rules or []}
+    host, port = address.rsplit(":", 1)
+    stats = {}
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        conn = http.client.HTTPConnection(host, int(port), timeout=timeout)
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                break
+            target = targets[n % len(targets)]
+            target_host, _, target_path = target.partition("/")
+            start = time.perf_counter()
+            rule = "unmatched"
+            error = False
+            try:
+                conn.request("GET", "/" + target_path, headers={"Host": target_host})
+                resp = conn.getresponse()
+                resp.read()
+                index = resp.getheader(RULE_HEADER, "?")
+                rule = labels.get(index, f"rule #{index}")
+                error = resp.status >= 500
+            except Exception:
+                error = True
+                conn.close()
+                conn = http.client.HTTPConnection(host, int(port), timeout=timeout)
+            elapsed = time.perf_counter() - start
+            with lock:
+                rule_stats = stats.setdefault(rule, RuleStats())
+            rule_stats.record(elapsed, error)
+        conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - start
+    return summarize(stats, elapsed), elapsed
+
+
+def format_report(rows, elapsed):
+    lines = [f"{'rule':<50} {'reqs':>7} {'rps':>9} {'p50ms':>8} {'p90ms':>8} {'p99ms':>8} {'err%':>6}"]
+    total = 0
+    for row in sorted(rows, key=lambda r: r["rule"]):
+        total += row["requests"]
+        lines.append(f"{row['rule'][:50]:<50} {row['requests']:>7} {row['rps']:>9.1f} {row['p50_ms']:>8.2f} "
+                     f"{row['p90_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['error_rate'] * 100:>6.1f}")
+    lines.append(f"{total} requests in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f} req/s)")
+    return "\n".join(lines)
@@ -0,0 +1,359 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from core.config import ARGOGUI_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+JOURNAL_PATH = ARGOGUI_DIR / "events.journal"
+
+TUNNEL_CREATED = "tunnel_created"
+TUNNEL_DELETED = "tunnel_deleted"
+DNS_ROUTE_ADDED = "dns_route_added"
+IP_ROUTE_ADDED = "ip_route_added"
+SERVICE_STATE_CHANGED = "service_state_changed"
+CONNECTOR_STARTED = "connector_started"
+CONNECTOR_STOPPED = "connector_stopped"
+CONNECTOR_CRASHED = "connector_crashed"
+
+KINDS = (TUNNEL_CREATED, TUNNEL_DELETED, DNS_ROUTE_ADDED, IP_ROUTE_ADDED, SERVICE_STATE_CHANGED,
+         CONNECTOR_STARTED, CONNECTOR_STOPPED, CONNECTOR_CRASHED)
+
+
+class Event:
+    __slots__ = ("seq", "kind", "ts", "data")
+
+    def __init__(self, seq, kind, ts, data):
+        self.seq = seq
+        self.kind = kind
+        self.ts = ts
+        self.data = data
+
+    def encode(self):
+        return (json.dumps({"s": self.seq, "k": self.kind, "t": round(self.ts, 3), "d": self.data},
+                           separators=(",", ":")) + "\n").encode()
+
+    @classmethod
+    def decode(cls, line):
+        record = json.loads(line)
+        return cls(record["s"], record["k"], record["t"], record.get("d") or {})
+
+    def __repr__(self):
+        return f"Event({self.seq}, {self.kind!r}, {self.data!r})"
+
+
+class Journal:
+    """
+    Append-only event log, one compact JSON line per event. Several ArgoGUI
+    processes may share it: appends take an exclusive lock on a side file and
+    sequence numbers stay global. Once it grows past max_bytes only the last
+    keep events are retained.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, max_bytes=4 * 1024 * 1024, keep=10000):
+        self.path = str(path)
+        self.lock_path = self.path + ".lock"
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.offset = 0
+        self.inode = None
+        self.last_seq = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock, self._locked(), open(self.path, "a+b") as f:
+            self._read_new(f)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock across processes, on a side file that compaction never replaces"""
+        with open(self.lock_path, "a+b") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_new(self, f):
+        """Events appended since our last read, by this or any other process"""
+        stat = os.fstat(f.fileno())
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # Compacted by another process: rescan, sequence numbers tell what is new
+            self.inode = stat.st_ino
+            self.offset = 0
+        f.seek(self.offset)
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        events = []
+        for line in data[:end].splitlines():
+            try:
+                event = Event.decode(line)
+            except (ValueError, KeyError):
+                continue
+            if event.seq > self.last_seq:
+                self.last_seq = event.seq
+                events.append(event)
+        return events
+
+    def append(self, kind, data):
+        """Append an event; returns (event, events other processes appended meanwhile)"""
+        with self.lock, self._locked(), open(self.path, "a+b") as f:
+            foreign = self._read_new(f)
+            f.seek(0, os.SEEK_END)
+            if f.tell() > self.offset:
+                f.write(b"\n")  # terminate a line torn by a crashed writer
+            event = Event(self.last_seq + 1, kind, time.time(), data)
+            f.write(event.encode())
+            f.flush()
+            self.offset = f.tell()
+            self.last_seq = event.seq
+            if self.offset > self.max_bytes:
+                self._compact()
+        return event, foreign
+
+    def poll(self):
+        """Events other processes appended since the last call"""
+        with self.lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return []
+            if stat.st_ino == self.inode and stat.st_size == self.offset:
+                return []
+            with open(self.path, "rb") as f:
+                return self._read_new(f)
+
+    def _compact(self):
+        with open(self.path, "rb") as f:
+            lines = f.read().splitlines(keepends=True)[-self.keep:]
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.writelines(lines)
+        os.replace(tmp, self.path)
+        stat = os.stat(self.path)
+        self.inode, self.offset = stat.st_ino, stat.st_size
+
+    def read_since(self, seq=0, kinds=None):
+        """Journaled events with a sequence number above seq"""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    event = Event.decode(line)
+                except (ValueError, KeyError):
+                    continue
+                if event.seq > seq and (kinds is None or event.kind in kinds):
+                    yield event
+
+
+class EventBus:
+    """
+    Typed state-change events. publish() journals the event and calls every
+    matching subscriber synchronously on the publishing thread; use the Qt or
+    asyncio adapters to hop to a UI thread or an event loop. sync() delivers
+    events published by other processes sharing the journal.
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.subscribers = []
+        self.lock = threading.RLock()
+        self.memory_seq = 0
+
+    @property
+    def last_seq(self):
+        return self.journal.last_seq if self.journal else self.memory_seq
+
+    def subscribe(self, callback, kinds=None, since=None):
+        """
+        Call callback(event) for each event (of the given kinds). With since, journaled
+        events after that sequence number are replayed first, without gaps.
+        Returns a function that unsubscribes.
+        """
+        # [callback, kinds, last delivered seq]; the seq keeps replayed events from being delivered twice
+        entry = [callback, set(kinds) if kinds else None, 0]
+        with self.lock:
+            if since is not None:
+                for event in self.replay(since, kinds):
+                    self._call(entry, event)
+            self.subscribers.append(entry)
+
+        def unsubscribe():
+            with self.lock:
+                if entry in self.subscribers:
+                    self.subscribers.remove(entry)
+        return unsubscribe
+
+    def publish(self, kind, **data):
+        with self.lock:
+            if self.journal:
+                event, foreign = self.journal.append(kind, data)
+            else:
+                self.memory_seq += 1
+                event, foreign = Event(self.memory_seq, kind, time.time(), data), []
+            for pending in foreign + [event]:
+                self._dispatch(pending)
+        return event
+
+    def sync(self):
+        """Deliver events appended to the journal by other processes"""
+        if not self.journal:
+            return []
+        with self.lock:
+            events = self.journal.poll()
+            for event in events:
+                self._dispatch(event)
+        return events
+
+    def replay(self, since=0, kinds=None):
+        if not self.journal:
+            return iter(())
+        return self.journal.read_since(since, set(kinds) if kinds else None)
+
+    def _dispatch(self, event):
+        for entry in list(self.subscribers):
+            self._call(entry, event)
+
+    def _call(self, entry, event):
+        callback, kinds, delivered = entry
+        if event.seq <= delivered:
+            return
+        entry[2] = event.seq
+        if kinds is None or event.kind in kinds:
+            try:
+                callback(event)
+            except Exception:
+                pass  # a broken subscriber must not break the publisher
+
+    def stream(self, kinds=None, since=None):
+        """Async iterator of events, for use inside a running asyncio loop"""
+        return AsyncSubscription(self, kinds, since)
+
+
+class AsyncSubscription:
+    """async for event in bus.stream(): ... ; events are handed over with call_soon_threadsafe"""
+
+    def __init__(self, bus, kinds=None, since=None):
+        import asyncio
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.unsubscribe = bus.subscribe(
+            lambda event: self.loop.call_soon_threadsafe(self.queue.put_nowait, event), kinds, since)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.unsubscribe()
+
+
+def qt_bridge(bus, kinds=None, since=None, parent=None):
+    """
+    A QObject with an `event` signal emitted for each bus event. Connect slots to
+    bridge.event; Qt queues the call onto the receiver's thread.
+    """
+    from PyQt6.QtCore import QObject, pyqtSignal
+
+    class EventBridge(QObject):
+        event = pyqtSignal(object)
+
+    bridge = EventBridge(parent)
+    bridge.unsubscribe = bus.subscribe(bridge.event.emit, kinds, since)
+    return bridge
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    """The process-wide bus, journaled to ~/.argogui/events.journal"""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            try:
+                _bus = EventBus(Journal())
+            except OSError:
+                _bus = EventBus()
+        return _bus
+
+
+def publish(kind, **data):
+    """Publish on the process-wide bus; never raises, state changes must not fail because of it"""
+    try:
+        return get_bus().publish(kind, **data)
+    except Exception:
+        return None
+
+
+def apply_to_snapshot(state, event):
+    """Update a StateStore snapshot from an event instead of refetching everything"""
+    data = event.data
+    if event.kind == TUNNEL_CREATED:
+        tunnels, _ = state.get("tunnels")
+        if tunnels is not None and data.get("tunnel"):
+            tunnels = [t for t in tunnels if t.get("id") != data["tunnel"].get("id")]
+            state.put("tunnels", tunnels + [data["tunnel"]])
+        else:
+            state.delete("tunnels")
+    elif event.kind == TUNNEL_DELETED:
+        tunnels, _ = state.get("tunnels")
+        if tunnels is not None:
+            ref = data.get("tunnel_id")
+            state.put("tunnels", [t for t in tunnels if ref not in (t.get("id"), t.get("name"))])
+    elif event.kind == DNS_ROUTE_ADDED:
+        # Route records carry fields only cloudflared knows, refetch on next use
+        state.delete("dns_routes")
+    elif event.kind == IP_ROUTE_ADDED:
+        state.delete("ip_routes")
+    elif event.kind == SERVICE_STATE_CHANGED and "running" in data:
+        state.put("service_running", data["running"])
+    state.put("event_seq", event.seq)
+
+
+def track_snapshot(state, bus=None):
+    """
+    Keep a StateStore in step with the bus, catching up on events journaled since
+    the snapshot last applied one (e.g. by another front-end). Returns unsubscribe.
+    """
+    bus = bus or get_bus()
+    since, _ = state.get("event_seq")
+    return bus.subscribe(lambda event: apply_to_snapshot(state, event),
+                         since=bus.last_seq if since is None else since)
+
+
+def describe(event):
+    data = event.data
+    if event.kind == TUNNEL_CREATED:
+        return f"Tunnel {data.get('name')} created"
+    if event.kind == TUNNEL_DELETED:
+        return f"Tunnel {data.get('tunnel_id')} deleted"
+    if event.kind == DNS_ROUTE_ADDED:
+        return f"DNS route {data.get('hostname')} -> {data.get('tunnel')} added"
+    if event.kind == IP_ROUTE_ADDED:
+        return f"IP route {data.get('network')} -> {data.get('tunnel')} added"
+    if event.kind == SERVICE_STATE_CHANGED:
+        if data.get("tunnel"):
+            return f"Service cloudflared@{data['tunnel']} {data.get('action')}"
+        return f"Service {data.get('action')}"
+    if event.kind == CONNECTOR_CRASHED:
+        return (f"Connector {data.get('tunnel_id')} #{data.get('replica')} (PID {data.get('pid')}) "
+                f"exited with code {data.get('returncode')}")
+    if event.kind in (CONNECTOR_STARTED, CONNECTOR_STOPPED):
+        state = "started" if event.kind == CONNECTOR_STARTED else "stopped"
+        return f"Connector {data.get('tunnel_id')} #{data.get('replica')} (PID {data.get('pid')}) {state}"
+    return f"{event.kind} {data}"
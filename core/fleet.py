@@ -0,0 +1,277 @@
+import hmac
+import ipaddress
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 7844
+TOKEN_ENV = "ARGOGUI_FLEET_TOKEN"
+
+
+class LocalConnectors:
+    """cloudflared connectors started by this agent, keyed by tunnel id"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processes = {}
+        self.metrics = {}  # tunnel id -> loopback metrics address of its connector
+
+    def start(self, tunnel_id):
+        from core.replicas import free_port
+        with self.lock:
+            process = self.processes.get(tunnel_id)
+            if process and process.poll() is None:
+                return process.pid
+            metrics = f"127.0.0.1:{free_port()}"
+            process = subprocess.Popen(["cloudflared", "tunnel", "--metrics", metrics, "run", tunnel_id],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.processes[tunnel_id] = process
+            self.metrics[tunnel_id] = metrics
+            return process.pid
+
+    def stop(self, tunnel_id):
+        with self.lock:
+            process = self.processes.pop(tunnel_id, None)
+            self.metrics.pop(tunnel_id, None)
+        if not process:
+            return False
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        return True
+
+    def restart(self, tunnel_id):
+        self.stop(tunnel_id)
+        return self.start(tunnel_id)
+
+    def list(self):
+        with self.lock:
+            return {tid: {"pid": p.pid, "running": p.poll() is None, "metrics": self.metrics.get(tid)}
+                    for tid, p in self.processes.items()}
+
+    def metrics_address(self, tunnel_id):
+        with self.lock:
+            address = self.metrics.get(tunnel_id)
+        if address is None:
+            raise ValueError(f"No connector for tunnel {tunnel_id} was started by this agent")
+        return address
+
+
+def _read_service_config():
+    from core import manager
+    path = os.path.join(manager.get_service_config_dir(), "config.yml")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _config_tunnel(text):
+    """The `tunnel` key of a config.yml's text, None if it has none or doesn't parse"""
+    import yaml
+    try:
+        config = yaml.safe_load(text or "")
+    except yaml.YAMLError:
+        return None
+    return str(config["tunnel"]) if isinstance(config, dict) and config.get("tunnel") else None
+
+
+def _metrics(connectors, tunnel_id):
+    """Prometheus metrics of a connector this agent started; other addresses can't be asked for"""
+    address = connectors.metrics_address(tunnel_id)
+    with urllib.request.urlopen(f"http://{address}/metrics", timeout=5) as resp:
+        return resp.read().decode()
+
+
+def _status(connectors):
+    from core import manager
+    return {
+        "host": platform.node(),
+        "service_running": manager.is_service_running(),
+        "connectors": connectors.list(),
+    }
+
+
+def build_methods(connectors):
+    """The subset of core.manager exposed to controllers"""
+    from core import manager
+
+    def restart_tunnel(tunnel_id):
+        # Restart local connectors for the tunnel, and its own unit or else the service if it serves it
+        restarted = []
+        if tunnel_id in connectors.list():
+            connectors.restart(tunnel_id)
+            restarted.append("connector")
+        try:
+            template_units = manager.tunnel_units()
+        except RuntimeError:
+            template_units = None
+        # Units are named by tunnel ID or name, so match on the tunnel their config runs
+        unit = None
+        for instance in template_units.instances() if template_units else []:
+            if instance == tunnel_id:
+                unit = instance
+                break
+            try:
+                with open(template_units.config_path(instance), "r") as f:
+                    if _config_tunnel(f.read()) == tunnel_id:
+                        unit = instance
+                        break
+            except OSError:
+                continue
+        if unit:
+            manager.restart_tunnel_service(unit)
+            restarted.append("unit")
+        elif _config_tunnel(_read_service_config()) == tunnel_id:
+            manager.restart_service()
+            restarted.append("service")
+        return restarted
+
+    return {
+        "status": lambda: _status(connectors),
+        "is_service_running": manager.is_service_running,
+        "start_service": manager.start_service,
+        "stop_service": manager.stop_service,
+        "restart_service": manager.restart_service,
+        "tunnel_services_status": manager.tunnel_services_status,
+        "start_tunnel_service": manager.start_tunnel_service,
+        "stop_tunnel_service": manager.stop_tunnel_service,
+        "restart_tunnel_service": manager.restart_tunnel_service,
+        "list_tunnels": manager.list_tunnels,
+        "diagnose_service_config": manager.diagnose_service_config,
+        "service_config": _read_service_config,
+        "metrics": lambda tunnel_id: _metrics(connectors, tunnel_id),
+        "connectors": connectors.list,
+        "start_connector": connectors.start,
+        "stop_connector": connectors.stop,
+        "restart_connector": connectors.restart,
+        "restart_tunnel": restart_tunnel,
+    }
+
+
+class AgentHandler(BaseHTTPRequestHandler):
+    """POST /rpc {"method": ..., "args": [...]} with a bearer token"""
+
+    def do_POST(self):
+        if self.path != "/rpc":
+            return self._reply(404, {"ok": False, "error": "not found"})
+        auth = self.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth.encode(), f"Bearer {self.server.token}".encode()):
+            return self._reply(401, {"ok": False, "error": "unauthorized"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            method = self.server.methods[request["method"]]
+        except (KeyError, ValueError) as e:
+            return self._reply(400, {"ok": False, "error": f"bad request: {e}"})
+        try:
+            result = method(*request.get("args", []), **request.get("kwargs", {}))
+            self._reply(200, {"ok": True, "result": result})
+        except Exception as e:
+            self._reply(200, {"ok": False, "error": str(e)})
+
+    def _reply(self, code, payload):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def create_agent(host="127.0.0.1", port=DEFAULT_PORT, token=None, methods=None):
+    """
+    Create (but don't start) an agent server. token defaults to $ARGOGUI_FLEET_TOKEN.
+    The agent speaks plain HTTP, so it only binds to loopback: controllers reach
+    it through an SSH tunnel, which keeps the token off the network.
+    """
+    token = token or os.environ.get(TOKEN_ENV)
+    if not token:
+        raise ValueError(f"An agent token is required (set {TOKEN_ENV})")
+    if not _is_loopback(host):
+        raise ValueError(f"The agent sends its token in cleartext and won't listen on {host}; "
+                         f"bind it to 127.0.0.1 and forward a port with `ssh -L`")
+    server = ThreadingHTTPServer((host, port), AgentHandler)
+    server.daemon_threads = True
+    server.token = token
+    server.methods = methods if methods is not None else build_methods(LocalConnectors())
+    return server
+
+
+def run_agent(host="127.0.0.1", port=DEFAULT_PORT, token=None):
+    server = create_agent(host, port, token)
+    print(f"ArgoGUI agent listening on {host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def call(address, method, args=(), kwargs=None, token=None, timeout=10):
+    """Call one agent. Raises RuntimeError with the agent's error message on failure."""
+    token = token or os.environ.get(TOKEN_ENV, "")
+    body = json.dumps({"method": method, "args": list(args), "kwargs": kwargs or {}}).encode()
+    req = urllib.request.Request(f"http://{address}/rpc", data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {token}",
+    })
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            reply = json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        reply = json.loads(e.read() or b"{}")
+    if not reply.get("ok"):
+        raise RuntimeError(reply.get("error", "unknown error"))
+    return reply.get("result")
+
+
+def fan_out(addresses, method, args=(), kwargs=None, token=None, timeout=10, max_workers=32):
+    """
+    Call method on every agent concurrently, yielding (address, ok, result_or_error,
+    elapsed_seconds) as each host answers, so callers can show partial results.
+    """
+    def one(address):
+        start = time.monotonic()
+        try:
+            result = call(address, method, args, kwargs, token, timeout)
+            return address, True, result, time.monotonic() - start
+        except Exception as e:
+            return address, False, str(e), time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, max(1, len(addresses)))) as pool:
+        futures = [pool.submit(one, address) for address in addresses]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def load_hosts(spec):
+    """Hosts from a comma separated list or a file with one host[:port] per line"""
+    if os.path.exists(spec):
+        with open(spec, "r") as f:
+            entries = [line.split("#", 1)[0].strip() for line in f]
+    else:
+        entries = [entry.strip() for entry in spec.split(",")]
+    return [e if ":" in e else f"{e}:{DEFAULT_PORT}" for e in entries if e]
@@ -0,0 +1,245 @@
+import ipaddress
+import socket
+from bisect import bisect_right
+
+from core.records import IpRoute
+
+
+class _Node:
+    __slots__ = ("value", "length", "mask", "routes", "children")
+
+    def __init__(self, value, length, width):
+        self.value = value
+        self.length = length
+        self.mask = ((1 << length) - 1) << (width - length) if length else 0
+        self.routes = None
+        self.children = [None, None]
+
+
+class PrefixTrie:
+    """
+    Path-compressed binary (Patricia) trie of prefixes for one address family.
+    Keys are integers left-aligned in width bits.
+
+    Longest-prefix lookups don't walk the trie: it is flattened into sorted,
+    disjoint address ranges (rebuilt after inserts), so a lookup is a single
+    bisect in C.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self.root = _Node(0, 0, width)
+        self.size = 0
+        self.starts = None
+        self.range_routes = None
+
+    def _bit(self, value, position):
+        return (value >> (self.width - 1 - position)) & 1
+
+    def insert(self, value, length, route):
+        self.starts = None
+        width = self.width
+        node = self.root
+        while True:
+            if length == node.length:
+                if node.routes is None:
+                    node.routes = []
+                    self.size += 1
+                node.routes.append(route)
+                return
+            bit = self._bit(value, node.length)
+            child = node.children[bit]
+            if child is None:
+                leaf = _Node(value, length, width)
+                leaf.routes = [route]
+                node.children[bit] = leaf
+                self.size += 1
+                return
+            limit = min(length, child.length)
+            diff = (value ^ child.value) >> (width - limit) if limit else 0
+            common = limit - diff.bit_length()
+            if common == child.length:
+                node = child
+                continue
+            if common == length:
+                # The new prefix sits between node and child
+                middle = _Node(value, length, width)
+                middle.routes = [route]
+                middle.children[self._bit(child.value, length)] = child
+                node.children[bit] = middle
+                self.size += 1
+                return
+            branch_value = value & (((1 << common) - 1) << (width - common)) if common else 0
+            branch = _Node(branch_value, common, width)
+            branch.children[self._bit(child.value, common)] = child
+            leaf = _Node(value, length, width)
+            leaf.routes = [route]
+            branch.children[self._bit(value, common)] = leaf
+            node.children[bit] = branch
+            self.size += 1
+            return
+
+    def prefixes(self):
+        """(value, length, routes) in address order, broader prefixes first"""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.routes is not None:
+                yield node.value, node.length, node.routes
+            for child in (node.children[1], node.children[0]):
+                if child is not None:
+                    stack.append(child)
+
+    def _flatten(self):
+        starts = []
+        range_routes = []
+
+        def emit(position, routes):
+            if starts and starts[-1] == position:
+                range_routes[-1] = routes
+            elif not range_routes or range_routes[-1] is not routes:
+                starts.append(position)
+                range_routes.append(routes)
+
+        active = []  # (last address, routes) of enclosing prefixes
+        for value, length, routes in self.prefixes():
+            while active and active[-1][0] < value:
+                end, _ = active.pop()
+                emit(end + 1, active[-1][1] if active else None)
+            emit(value, routes)
+            active.append((value | ((1 << (self.width - length)) - 1), routes))
+        while active:
+            end, _ = active.pop()
+            emit(end + 1, active[-1][1] if active else None)
+        self.starts = starts
+        self.range_routes = range_routes
+
+    def longest_match(self, address):
+        """Routes of the most specific prefix containing address, or None"""
+        if self.starts is None:
+            self._flatten()
+        i = bisect_right(self.starts, address) - 1
+        return self.range_routes[i] if i >= 0 else None
+
+    def covering(self, value, length):
+        """(length, routes) for every stored prefix that contains value/length, broadest first"""
+        found = []
+        node = self.root
+        while node is not None and node.length <= length and (value & node.mask) == node.value:
+            if node.routes is not None:
+                found.append((node.length, node.routes))
+            if node.length == length:
+                break
+            node = node.children[self._bit(value, node.length)]
+        return found
+
+    def covered(self, value, length):
+        """(value, length, routes) for every stored prefix strictly inside value/length"""
+        mask = ((1 << length) - 1) << (self.width - length) if length else 0
+        node = self.root
+        while node.length < length:
+            child = node.children[self._bit(value, node.length)]
+            if child is None:
+                return []
+            if child.length >= length:
+                if (child.value & mask) != value:
+                    return []
+                node = child
+                break
+            if (value & child.mask) != child.value:
+                return []
+            node = child
+        found = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.length > length and current.routes is not None:
+                found.append((current.value, current.length, current.routes))
+            stack.extend(c for c in current.children if c is not None)
+        return found
+
+
+class RouteIndex:
+    """
+    IPv4 and IPv6 tunnel routes with longest-prefix-match lookup and
+    overlap/shadowing checks for new CIDRs.
+    """
+
+    def __init__(self):
+        self.tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+
+    def __len__(self):
+        return self.tries[4].size + self.tries[6].size
+
+    def add(self, cidr, tunnel_id, **meta):
+        network = ipaddress.ip_network(cidr, strict=False)
+        route = IpRoute(**dict(meta, network=str(network), tunnel_id=tunnel_id))
+        self.tries[network.version].insert(int(network.network_address), network.prefixlen, route)
+        return route
+
+    def lookup(self, ip):
+        """The route serving ip (most specific prefix), or None"""
+        # inet_pton is several times faster than ipaddress, which stays as the fallback for
+        # forms it rejects (e.g. scoped IPv6) and for the error message
+        version = 6 if ":" in ip else 4
+        try:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET6 if version == 6 else socket.AF_INET, ip), "big")
+        except OSError:
+            address = ipaddress.ip_address(ip)
+            version, value = address.version, int(address)
+        return self.lookup_int(value, version)
+
+    def lookup_int(self, value, version=4):
+        """lookup() of an address already held as an integer, skipping parsing altogether"""
+        routes = self.tries[version].longest_match(value)
+        return routes[0] if routes else None
+
+    def check(self, cidr, tunnel_id=None):
+        """
+        Problems adding cidr would cause, as a list of dicts with kind and route:
+        "duplicate"   - the same prefix is already routed
+        "shadows"     - cidr is inside a broader route and takes part of its traffic
+        "shadowed_by" - a more specific existing route keeps part of cidr's traffic
+        """
+        network = ipaddress.ip_network(cidr, strict=False)
+        trie = self.tries[network.version]
+        value, length = int(network.network_address), network.prefixlen
+        findings = []
+        for prefix_length, routes in trie.covering(value, length):
+            kind = "duplicate" if prefix_length == length else "shadows"
+            for route in routes:
+                if kind == "shadows" and tunnel_id and route.tunnel_id == tunnel_id:
+                    continue  # a more specific route to the same tunnel changes nothing
+                findings.append({"kind": kind, "route": route})
+        for _, _, routes in trie.covered(value, length):
+            for route in routes:
+                if tunnel_id and route.tunnel_id == tunnel_id:
+                    continue
+                findings.append({"kind": "shadowed_by", "route": route})
+        return findings
+
+
+def describe_finding(cidr, finding):
+    route = finding["route"]
+    if finding["kind"] == "duplicate":
+        return f"{cidr} is already routed to tunnel {route.target}"
+    if finding["kind"] == "shadows":
+        return f"{cidr} takes over part of {route.network} (tunnel {route.target})"
+    return f"{route.network} (tunnel {route.target}) stays more specific than {cidr}"
+
+
+def build_index(routes=None):
+    """
+    Build a RouteIndex from `cloudflared tunnel route ip show` JSON (fetched if
+    not given). A failed listing raises: an empty index would pass every check.
+    """
+    from core import manager
+    if routes is None:
+        routes = manager.list_ip_routes()
+    index = RouteIndex()
+    for route in IpRoute.parse_many(routes):
+        if not route.network:
+            continue
+        index.add(route.network, route.tunnel_id, tunnel_name=route.tunnel_name,
+                  virtual_network_id=route.virtual_network_id, comment=route.comment)
+    return index
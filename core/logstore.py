@@ -0,0 +1,309 @@
+import json
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+from core.config import ARGOGUI_DIR
+
+LOG_DB_PATH = ARGOGUI_DIR / "logs.db"
+
+# cloudflared text logs use three letter levels ("2024-05-01T10:00:00Z INF ...")
+LEVELS = {
+    "DBG": "debug", "INF": "info", "WRN": "warn", "ERR": "error", "FTL": "fatal",
+    "debug": "debug", "info": "info", "warn": "warn", "warning": "warn",
+    "error": "error", "fatal": "fatal", "panic": "fatal",
+}
+
+_TEXT_LINE = re.compile(r"^(?P<ts>\d{4}-\d{2}-\d{2}T\S+)\s+(?P<level>[A-Z]{3})\s+(?P<rest>.*)$")
+_FIELD = re.compile(r'(\w+)=("(?:[^"\\]|\\.)*"|\S+)')
+
+PARTITION_SECONDS = 86400
+
+
+def parse_timestamp(value):
+    """Parse an RFC3339 timestamp into epoch seconds"""
+    if not value:
+        return time.time()
+    value = value.replace("Z", "+00:00")
+    # Go emits nanoseconds, datetime only accepts microseconds
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value)
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return time.time()
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def parse_line(line, tunnel_id=None):
+    """
+    Parse one cloudflared log line (text or JSON format) into a record dict with
+    ts, level, connector_id, tunnel_id, event and fields. Returns None for blank lines.
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    if line.startswith("{"):
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            ts = parse_timestamp(data.pop("time", None))
+            level = LEVELS.get(str(data.pop("level", "info")).lower(), "info")
+            event = str(data.pop("message", data.pop("msg", "")))
+            fields = {k: str(v) for k, v in data.items()}
+            return _make_record(ts, level, event, fields, tunnel_id)
+
+    match = _TEXT_LINE.match(line)
+    if not match:
+        return _make_record(time.time(), "info", line, {}, tunnel_id)
+
+    rest = match.group("rest")
+    fields = {}
+    first_field = None
+    for field in _FIELD.finditer(rest):
+        if first_field is None:
+            first_field = field.start()
+        value = field.group(2)
+        if value.startswith('"') and value.endswith('"'):
+            value = value[1:-1]
+        fields[field.group(1)] = value
+    event = rest[:first_field].strip() if first_field is not None else rest.strip()
+    return _make_record(parse_timestamp(match.group("ts")),
+                        LEVELS.get(match.group("level"), "info"), event, fields, tunnel_id)
+
+
+_JSON_LEVEL = re.compile(r'"level"\s*:\s*"(\w+)"')
+
+
+def line_level(line, default="info"):
+    """Cheap level detection for display, without parsing the whole line"""
+    match = _TEXT_LINE.match(line)
+    if match:
+        return LEVELS.get(match.group("level"), default)
+    match = _JSON_LEVEL.search(line) if line.lstrip().startswith("{") else None
+    if match:
+        return LEVELS.get(match.group(1).lower(), default)
+    return default
+
+
+def _make_record(ts, level, event, fields, tunnel_id):
+    connector_id = fields.get("connectorID") or fields.get("connection")
+    tunnel_id = fields.get("tunnelID") or fields.get("tunnel") or tunnel_id
+    return {
+        "ts": ts,
+        "level": level,
+        "connector_id": connector_id,
+        "tunnel_id": tunnel_id,
+        "event": event,
+        "fields": fields,
+    }
+
+
+class LogStore:
+    """
+    SQLite log index. Records are stored in one table per day (plus a matching
+    FTS5 index), so time-bounded queries only touch the relevant partitions and
+    retention is a cheap DROP TABLE instead of a DELETE over millions of rows.
+    """
+
+    def __init__(self, path=LOG_DB_PATH, retention_days=14, batch_size=500):
+        self.path = str(path)
+        if self.path != ":memory:":
+            ARGOGUI_DIR.mkdir(parents=True, exist_ok=True)
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS partitions (day INTEGER PRIMARY KEY)")
+        self.partitions = {row[0] for row in self.conn.execute("SELECT day FROM partitions")}
+        self.apply_retention()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _create_partition(self, day):
+        """
+        Create a day's tables inside the caller's transaction. Separate execute()
+        calls, since executescript() would commit whatever the transaction holds.
+        """
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS logs_{day} (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                level TEXT,
+                connector_id TEXT,
+                tunnel_id TEXT,
+                event TEXT,
+                fields TEXT
+            )""")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS logs_{day}_tunnel ON logs_{day} (tunnel_id, ts)")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS logs_{day}_level ON logs_{day} (level, ts)")
+        self.conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS logs_{day}_fts USING fts5(event, fields, content='')")
+        self.conn.execute("INSERT OR IGNORE INTO partitions (day) VALUES (?)", (day,))
+
+    def insert(self, records):
+        """Batch insert parsed records, grouped by day partition"""
+        by_day = {}
+        for record in records:
+            by_day.setdefault(int(record["ts"] // PARTITION_SECONDS), []).append(record)
+        with self.lock:
+            new_days = [day for day in by_day if day not in self.partitions]
+            with self.conn:
+                # sqlite3 only opens a transaction implicitly before DML, so DDL
+                # would autocommit: begin explicitly to keep schema and rows together
+                self.conn.execute("BEGIN")
+                for day in new_days:
+                    self._create_partition(day)
+                for day, rows in by_day.items():
+                    cur = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM logs_{day}")
+                    next_id = cur.fetchone()[0] + 1
+                    log_rows = []
+                    fts_rows = []
+                    for offset, r in enumerate(rows):
+                        fields = json.dumps(r["fields"], separators=(",", ":"))
+                        log_rows.append((next_id + offset, r["ts"], r["level"], r["connector_id"],
+                                         r["tunnel_id"], r["event"], fields))
+                        fts_rows.append((next_id + offset, r["event"], " ".join(
+                            f"{k} {v}" for k, v in r["fields"].items())))
+                    self.conn.executemany(f"INSERT INTO logs_{day} VALUES (?, ?, ?, ?, ?, ?, ?)", log_rows)
+                    self.conn.executemany(f"INSERT INTO logs_{day}_fts (rowid, event, fields) VALUES (?, ?, ?)",
+                                          fts_rows)
+            # Only known once the transaction committed
+            self.partitions.update(new_days)
+        return len(records)
+
+    def ingest(self, lines, tunnel_id=None):
+        """Parse and insert an iterable of log lines in batches. Returns the number stored."""
+        batch = []
+        total = 0
+        for line in lines:
+            record = parse_line(line, tunnel_id)
+            if record is None:
+                continue
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                total += self.insert(batch)
+                batch = []
+        if batch:
+            total += self.insert(batch)
+        return total
+
+    def ingest_file(self, path, tunnel_id=None):
+        with open(path, "r", errors="replace") as f:
+            return self.ingest(f, tunnel_id)
+
+    def query(self, text=None, level=None, tunnel_id=None, connector_id=None,
+              since=None, until=None, limit=200):
+        """
+        Search stored records, newest first. since/until are epoch seconds;
+        text is an FTS5 match expression over the event and its fields.
+        """
+        until = until if until is not None else time.time()
+        days = sorted(self.partitions, reverse=True)
+        if since is not None:
+            days = [d for d in days if d >= int(since // PARTITION_SECONDS)]
+        days = [d for d in days if d <= int(until // PARTITION_SECONDS)]
+
+        results = []
+        with self.lock:
+            for day in days:
+                where = ["l.ts <= ?"]
+                params = [until]
+                if since is not None:
+                    where.append("l.ts >= ?")
+                    params.append(since)
+                if level:
+                    where.append("l.level = ?")
+                    params.append(LEVELS.get(level, level))
+                if tunnel_id:
+                    where.append("l.tunnel_id = ?")
+                    params.append(tunnel_id)
+                if connector_id:
+                    where.append("l.connector_id = ?")
+                    params.append(connector_id)
+                source = f"logs_{day} l"
+                if text:
+                    source = f"logs_{day}_fts f JOIN logs_{day} l ON l.id = f.rowid"
+                    where.append(f"logs_{day}_fts MATCH ?")
+                    params.append(text)
+                sql = (f"SELECT l.ts, l.level, l.connector_id, l.tunnel_id, l.event, l.fields "
+                       f"FROM {source} WHERE {' AND '.join(where)} ORDER BY l.ts DESC LIMIT ?")
+                params.append(limit - len(results))
+                for ts, lvl, conn_id, tun_id, event, fields in self.conn.execute(sql, params):
+                    results.append({
+                        "ts": ts, "level": lvl, "connector_id": conn_id, "tunnel_id": tun_id,
+                        "event": event, "fields": json.loads(fields or "{}"),
+                    })
+                if len(results) >= limit:
+                    break
+        return results
+
+    def apply_retention(self, now=None):
+        """Drop partitions older than retention_days. Returns the dropped days."""
+        now = now if now is not None else time.time()
+        cutoff = int(now // PARTITION_SECONDS) - self.retention_days
+        dropped = [d for d in self.partitions if d < cutoff]
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                for day in dropped:
+                    self.conn.execute(f"DROP TABLE IF EXISTS logs_{day}_fts")
+                    self.conn.execute(f"DROP TABLE IF EXISTS logs_{day}")
+                    self.conn.execute("DELETE FROM partitions WHERE day = ?", (day,))
+            self.partitions.difference_update(dropped)
+        return dropped
+
+
+def format_record(record):
+    """Render a stored record as a single cloudflared-like text line"""
+    ts = datetime.fromtimestamp(record["ts"], tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    fields = " ".join(f"{k}={v}" for k, v in record["fields"].items())
+    return f"{ts} {record['level'].upper():5} {record['event']} {fields}".rstrip()
+
+
+def follow_stream(stream, store, tunnel_id=None, flush_interval=1.0, on_line=None):
+    """
+    Ingest lines from a pipe (e.g. a connector's stderr) in a background thread,
+    flushing a batch every batch_size lines or flush_interval seconds.
+    """
+    def pump():
+        batch = []
+        last_flush = time.monotonic()
+        for line in iter(stream.readline, ""):
+            if on_line:
+                on_line(line.rstrip("\n"))
+            record = parse_line(line, tunnel_id)
+            if record is not None:
+                batch.append(record)
+            if batch and (len(batch) >= store.batch_size or time.monotonic() - last_flush >= flush_interval):
+                store.insert(batch)
+                batch = []
+                last_flush = time.monotonic()
+        if batch:
+            store.insert(batch)
+
+    thread = threading.Thread(target=pump, daemon=True)
+    thread.start()
+    return thread
+
+
+def ingest_service_logs(store, since_minutes=60):
+    """Import recent logs of the cloudflared systemd service via journalctl"""
+    try:
+        result = subprocess.run(
+            ["journalctl", "-u", "cloudflared", "-o", "cat", "--no-pager",
+             "--since", f"-{int(since_minutes)}min"],
+            capture_output=True, text=True)
+    except FileNotFoundError:
+        return 0
+    return store.ingest(result.stdout.splitlines())
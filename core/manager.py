@@ -6,19 +6,123 @@ import shutil
 import platform
 import sys
 import ctypes
+import json
+from core import events, scheduler
 
 CONFIG_PATH = Path.home() / ".cloudflared" / "config.yml"
 
-def list_tunnels():
-    result = subprocess.run(["cloudflared", "tunnel", "list", "--output", "json"],
-                            capture_output=True, text=True)
+def _tunnel_list_args(name=None, name_prefix=None, tunnel_id=None, include_deleted=False):
+    """cloudflared tunnel list arguments, with filters applied by cloudflared itself"""
+    args = ["cloudflared", "tunnel", "list", "--output", "json"]
+    if name:
+        args += ["--name", name]
+    if name_prefix:
+        args += ["--name-prefix", name_prefix]
+    if tunnel_id:
+        args += ["--id", tunnel_id]
+    if include_deleted:
+        args.append("--show-deleted")
+    return args
+
+def list_tunnels(**filters):
+    """Tunnels as a JSON string. Accepts the same filters as iter_tunnels."""
+    if filters.get("created_after"):
+        return json.dumps(list(iter_tunnels(**filters)))
+    result = scheduler.run(_tunnel_list_args(**filters), retries=2, capture_output=True, text=True)
     return result.stdout
 
-def create_tunnel(name: str):
-    subprocess.run(["cloudflared", "tunnel", "create", name])
+def iter_json_array(stream, chunk_size=65536):
+    """Yield the elements of a JSON array read incrementally from a text stream"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        # Skip separators before the next element
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                pos = end
+                continue
+        elif eof:
+            return
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def iter_tunnels(name=None, name_prefix=None, tunnel_id=None, include_deleted=False, created_after=None):
+    """
+    Yield tunnel records as they are parsed from cloudflared's output, so memory
+    stays flat regardless of account size. Filters are passed to cloudflared,
+    except created_after (an RFC 3339 timestamp), which cloudflared has no flag
+    for. Raises RuntimeError if cloudflared fails once the list was read.
+    """
+    import tempfile
+    from core.cleanup import parse_time
+    after = parse_time(created_after) if created_after else None
+    if created_after and after is None:
+        raise ValueError(f"created_after is not an RFC 3339 timestamp: {created_after!r}")
+    # A file rather than a pipe, so a chatty stderr can't block cloudflared while stdout is read
+    with tempfile.TemporaryFile("w+") as stderr:
+        proc = scheduler.popen(_tunnel_list_args(name, name_prefix, tunnel_id, include_deleted),
+                               stdout=subprocess.PIPE, stderr=stderr, text=True)
+        finished = False
+        try:
+            for tunnel in iter_json_array(proc.stdout):
+                # --name is an exact match in cloudflared, keep it exact with older versions too
+                if name and tunnel.get('name') != name:
+                    continue
+                if after is not None and (parse_time(tunnel.get('created_at')) or 0) <= after:
+                    continue
+                yield tunnel
+            finished = True
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None and not finished:
+                proc.kill()
+            proc.wait()
+        # Callers that stop early get what they asked for; a full read must not hide a failure
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(stderr.read().strip() or f"cloudflared tunnel list failed with exit code {proc.returncode}")
+
+def find_tunnel(name):
+    """The tunnel record with this exact name, or None"""
+    return next(iter_tunnels(name=name), None)
 
-def delete_tunnel(tunnel_id: str):
-    subprocess.run(["cloudflared", "tunnel", "delete", tunnel_id])
+def create_tunnel(name: str):
+    """Create a tunnel and return its record (None if it could not be found afterwards)"""
+    result = scheduler.run(["cloudflared", "tunnel", "create", name])
+    if result.returncode != 0:
+        return None
+    tunnel = find_tunnel(name)
+    events.publish(events.TUNNEL_CREATED, name=name, tunnel=tunnel)
+    return tunnel
+
+def delete_tunnel(tunnel_id: str, capture_output=False):
+    result = scheduler.run(["cloudflared", "tunnel", "delete", tunnel_id],
+                           capture_output=capture_output, text=True)
+    if result.returncode == 0:
+        events.publish(events.TUNNEL_DELETED, tunnel_id=tunnel_id)
+    return result
 
 def get_service_config_dir():
     import platform
@@ -34,6 +138,8 @@ def get_service_config_dir():
 def update_service_config(tunnel_uuid=None, credentials_file=None, url=None):
     """Update service config and restart if needed"""
     import yaml, os, shutil
+    from core.snapshots import snapshot_before
+    snapshot_before("update_service_config")
     service_dir = get_service_config_dir()
     config_path = os.path.join(service_dir, "config.yml")
     os.makedirs(service_dir, exist_ok=True)
@@ -61,6 +167,8 @@ def update_service_config(tunnel_uuid=None, credentials_file=None, url=None):
     # Write updated config
     with open(config_path, 'w') as f:
         yaml.safe_dump(cfg, f)
+    from core.config import invalidate
+    invalidate(config_path)
 
     return config_path
 
@@ -130,6 +238,8 @@ def copy_or_symlink_config_and_creds(src_config, src_creds):
             shutil.copy2(src, dst)
     _safe_link_or_copy(src_config, config_dest)
     _safe_link_or_copy(src_creds, creds_dest)
+    from core.config import invalidate
+    invalidate(config_dest)
     return config_dest, creds_dest
 
 def verify_service_config(tunnel_uuid, creds_file, url=None):
@@ -167,6 +277,8 @@ def verify_service_config(tunnel_uuid, creds_file, url=None):
 
 def fix_service_config(tunnel_uuid, creds_file, url=None):
     import yaml, os
+    from core.snapshots import snapshot_before
+    snapshot_before("fix_service_config")
     config_path = get_service_config_dir() + "/config.yml"
     cfg = {
         'tunnel': tunnel_uuid,
@@ -176,6 +288,8 @@ def fix_service_config(tunnel_uuid, creds_file, url=None):
         cfg['url'] = url
     with open(config_path, 'w') as f:
         yaml.safe_dump(cfg, f)
+    from core.config import invalidate
+    invalidate(config_path)
     return config_path
 
 def diagnose_service_config():
@@ -190,6 +304,11 @@ def diagnose_service_config():
             cfg = yaml.safe_load(f)
         except Exception as e:
             return f"Config file not valid YAML: {e}"
+    # The API call is the slow part, let it run while the local checks happen
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=1)
+    info_future = pool.submit(tunnel_info, cfg.get('tunnel'), capture_output=True)
+    pool.shutdown(wait=False)
     output.append(f"Config file: {config_path}")
     output.append(f"tunnel: {cfg.get('tunnel')}")
     output.append(f"credentials-file: {cfg.get('credentials-file')}")
@@ -200,15 +319,32 @@ def diagnose_service_config():
         output.append(f"Credentials file missing: {creds_file}")
     else:
         output.append(f"Credentials file found: {creds_file}")
-    # Optionally: check tunnel status
+    # Recent errors from the local log index, if any were collected
+    try:
+        import time
+        from core.logstore import LogStore, format_record
+        store = LogStore()
+        errors = store.query(level="error", tunnel_id=cfg.get('tunnel'), since=time.time() - 86400, limit=10)
+        store.close()
+        if errors:
+            output.append("Recent errors (last 24h):")
+            output.extend("  " + format_record(r) for r in errors)
+    except Exception as e:
+        output.append(f"Could not read log index: {e}")
     try:
-        info = tunnel_info(cfg.get('tunnel'))
-        output.append(f"Tunnel info: {info}")
+        output.append("Tunnel info:")
+        output.append(info_future.result().stdout.rstrip())
+    except subprocess.CalledProcessError as e:
+        output.append(f"Could not get tunnel info: {(e.stderr or str(e)).strip()}")
     except Exception as e:
         output.append(f"Could not get tunnel info: {e}")
     return '\n'.join(output)
 
 
+def _publish_service_state(action):
+    """Publish the state the service ended up in, not the one the action asked for"""
+    events.publish(events.SERVICE_STATE_CHANGED, action=action, running=is_service_running())
+
 def start_service():
     import platform
     import subprocess
@@ -231,9 +367,12 @@ def start_service():
             subprocess.run(["sudo", "systemctl", "start", "cloudflared"])
         else:
             subprocess.run(["systemctl", "start", "cloudflared"])
+    _publish_service_state("start")
 
 def uninstall_service():
     """Uninstall the cloudflared service"""
+    from core.snapshots import snapshot_before
+    snapshot_before("uninstall_service")
     system = platform.system().lower()
     if system == "windows":
         import ctypes
@@ -270,8 +409,10 @@ def clean_service_files():
     """Remove all service config files"""
     import os
     import shutil
+    from core.snapshots import snapshot_before
     service_dir = get_service_config_dir()
     if os.path.exists(service_dir):
+        snapshot_before("clean_service_files")
         try:
             shutil.rmtree(service_dir)
             print(f"Removed service config directory: {service_dir}")
@@ -300,6 +441,7 @@ def stop_service():
             subprocess.run(["sudo", "systemctl", "stop", "cloudflared"])
         else:
             subprocess.run(["systemctl", "stop", "cloudflared"])
+    _publish_service_state("stop")
 
 def restart_service():
     import platform
@@ -325,6 +467,45 @@ def restart_service():
             subprocess.run(["sudo", "systemctl", "restart", "cloudflared"])
         else:
             subprocess.run(["systemctl", "restart", "cloudflared"])
+    _publish_service_state("restart")
+
+def tunnel_units():
+    """Per-tunnel cloudflared@<tunnel>.service units (systemd only)"""
+    if platform.system().lower() != "linux":
+        raise RuntimeError("Per-tunnel services need systemd")
+    from core.units import TemplateUnits
+    return TemplateUnits()
+
+def install_tunnel_service(tunnel_id, credentials_file=None, url=None, tunnel=None, on_written=None):
+    """Run one tunnel as its own cloudflared@<tunnel>.service with its own config"""
+    from core.snapshots import snapshot_before
+    snapshot_before("install_tunnel_service")
+    credentials_file = credentials_file or os.path.expanduser(f"~/.cloudflared/{tunnel_id}.json")
+    unit = tunnel_units().install(tunnel or tunnel_id, tunnel_id, credentials_file, url, on_written=on_written)
+    events.publish(events.SERVICE_STATE_CHANGED, action="install", unit=unit, tunnel=tunnel or tunnel_id)
+    return unit
+
+def uninstall_tunnel_service(tunnel):
+    from core.snapshots import snapshot_before
+    snapshot_before("uninstall_tunnel_service")
+    tunnel_units().uninstall(tunnel)
+    events.publish(events.SERVICE_STATE_CHANGED, action="uninstall", tunnel=tunnel)
+
+def start_tunnel_service(tunnel):
+    tunnel_units().start(tunnel)
+    events.publish(events.SERVICE_STATE_CHANGED, action="start", tunnel=tunnel)
+
+def stop_tunnel_service(tunnel):
+    tunnel_units().stop(tunnel)
+    events.publish(events.SERVICE_STATE_CHANGED, action="stop", tunnel=tunnel)
+
+def restart_tunnel_service(tunnel):
+    tunnel_units().restart(tunnel)
+    events.publish(events.SERVICE_STATE_CHANGED, action="restart", tunnel=tunnel)
+
+def tunnel_services_status(tunnels=None):
+    """{tunnel: status} of per-tunnel units, from one batched systemctl show"""
+    return tunnel_units().status(tunnels)
 
 def is_service_running():
     import platform
@@ -346,7 +527,8 @@ def is_service_running():
     else:
         try:
             result = subprocess.run(["systemctl", "is-active", "cloudflared"], capture_output=True, text=True)
-            return "active" in result.stdout
+            # "inactive" and "activating" contain "active" too
+            return result.stdout.strip() == "active"
         except Exception:
             return False
 
@@ -381,16 +563,38 @@ def create_config_file(tunnel_uuid, credentials_file, url=None, warp_routing=Fal
     config_path.parent.mkdir(parents=True, exist_ok=True)
     with open(config_path, 'w') as f:
         yaml.safe_dump(config, f)
+    from core.config import invalidate
+    invalidate(config_path)
     return str(config_path)
 
-def add_dns_route(tunnel, hostname):
+def add_dns_route(tunnel, hostname, capture_output=False):
     import platform
     import shutil
     import subprocess
     system = platform.system().lower()
     exe = shutil.which("cloudflared.exe") if system == "windows" else shutil.which("cloudflared")
     exe = exe or ("cloudflared.exe" if system == "windows" else "cloudflared")
-    return subprocess.run([exe, "tunnel", "route", "dns", tunnel, hostname], check=True)
+    result = scheduler.run([exe, "tunnel", "route", "dns", tunnel, hostname], check=True,
+                           capture_output=capture_output, text=True)
+    events.publish(events.DNS_ROUTE_ADDED, tunnel=tunnel, hostname=hostname)
+    return result
+
+def _read_json(args):
+    """
+    Parsed JSON output of a cloudflared read. Raises RuntimeError with its stderr
+    rather than returning an empty list, which would look like "nothing there".
+    """
+    result = scheduler.run(args, retries=2, capture_output=True, text=True)
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(result.stderr.strip() or f"{' '.join(args)} failed")
+    try:
+        return json.loads(result.stdout) or []
+    except ValueError as e:
+        raise RuntimeError(f"Unreadable output of {' '.join(args)}: {e}") from e
+
+def list_dns_routes():
+    """DNS route records; raises RuntimeError if cloudflared can't list them"""
+    return _read_json(["cloudflared", "tunnel", "route", "dns", "list", "--output", "json"])
 
 def add_ip_route(ip_cidr, tunnel):
     import platform
@@ -399,7 +603,9 @@ def add_ip_route(ip_cidr, tunnel):
     system = platform.system().lower()
     exe = shutil.which("cloudflared.exe") if system == "windows" else shutil.which("cloudflared")
     exe = exe or ("cloudflared.exe" if system == "windows" else "cloudflared")
-    return subprocess.run([exe, "tunnel", "route", "ip", "add", ip_cidr, tunnel], check=True)
+    result = scheduler.run([exe, "tunnel", "route", "ip", "add", ip_cidr, tunnel], check=True)
+    events.publish(events.IP_ROUTE_ADDED, tunnel=tunnel, network=ip_cidr)
+    return result
 
 def show_ip_routes():
     import platform
@@ -408,7 +614,12 @@ def show_ip_routes():
     system = platform.system().lower()
     exe = shutil.which("cloudflared.exe") if system == "windows" else shutil.which("cloudflared")
     exe = exe or ("cloudflared.exe" if system == "windows" else "cloudflared")
-    return subprocess.run([exe, "tunnel", "route", "ip", "show"], check=True)
+    return scheduler.run([exe, "tunnel", "route", "ip", "show"], retries=2, check=True,
+                         capture_output=True, text=True).stdout
+
+def list_ip_routes():
+    """IP route records; raises RuntimeError if cloudflared can't list them"""
+    return _read_json(["cloudflared", "tunnel", "route", "ip", "show", "--output", "json"])
 
 def run_tunnel(tunnel):
     import platform
@@ -419,11 +630,12 @@ def run_tunnel(tunnel):
     exe = exe or ("cloudflared.exe" if system == "windows" else "cloudflared")
     return subprocess.run([exe, "tunnel", "run", tunnel], check=True)
 
-def tunnel_info(tunnel):
+def tunnel_info(tunnel, capture_output=False):
     import platform
     import shutil
     import subprocess
     system = platform.system().lower()
     exe = shutil.which("cloudflared.exe") if system == "windows" else shutil.which("cloudflared")
     exe = exe or ("cloudflared.exe" if system == "windows" else "cloudflared")
-    return subprocess.run([exe, "tunnel", "info", tunnel], check=True)
+    return scheduler.run([exe, "tunnel", "info", tunnel], retries=2, check=True,
+                         capture_output=capture_output, text=True)
@@ -0,0 +1,253 @@
+import os
+import subprocess
+import threading
+import time
+from array import array
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Metrics kept per process, in rolling buffers of the same length
+METRICS = ("cpu_percent", "rss_bytes", "fds", "read_bps", "write_bps")
+
+DEFAULT_THRESHOLDS = {
+    "cpu_percent": 90.0,
+    "rss_bytes": 512 * 1024 * 1024,
+    "fds": 4096,
+}
+
+# How often the service's main PID is looked up again, in seconds
+SERVICE_PID_TTL = 30
+
+
+def _read(path):
+    # os.open/os.read avoids the buffered file object, which dominates the cost for tiny /proc files
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return os.read(fd, 4096)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def read_sample(pid):
+    """
+    Raw counters of one process from /proc: (cpu_ticks, rss_bytes, fds,
+    read_bytes, write_bytes, threads). Returns None if the process is gone;
+    fds and I/O are None when not readable (e.g. a root service seen by a user).
+    """
+    stat = _read(f"/proc/{pid}/stat")
+    if not stat:
+        return None
+    # comm may contain spaces and parentheses, fields start after the last ")"
+    fields = stat[stat.rindex(b")") + 2:].split()
+    cpu_ticks = int(fields[11]) + int(fields[12])
+    threads = int(fields[17])
+    rss_bytes = int(fields[21]) * PAGE_SIZE
+
+    status = _read(f"/proc/{pid}/status")
+    if status:
+        start = status.find(b"VmRSS:")
+        if start >= 0:
+            rss_bytes = int(status[start + 6:status.index(b"kB", start)]) * 1024
+
+    read_bytes = write_bytes = None
+    io = _read(f"/proc/{pid}/io")
+    if io:
+        for line in io.split(b"\n"):
+            if line.startswith(b"read_bytes:"):
+                read_bytes = int(line[11:])
+            elif line.startswith(b"write_bytes:"):
+                write_bytes = int(line[12:])
+
+    try:
+        fds = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        fds = None
+    return cpu_ticks, rss_bytes, fds, read_bytes, write_bytes, threads
+
+
+def service_main_pids():
+    """{main PID: label} of the cloudflared service and its cloudflared@<tunnel> units, from one systemctl call"""
+    from core.units import TemplateUnits
+    try:
+        return TemplateUnits(use_sudo=False).main_pids()
+    except (OSError, subprocess.SubprocessError):
+        return {}
+
+
+class ProcessHistory:
+    """Rolling buffers of derived metrics for one process"""
+
+    def __init__(self, pid, label, size):
+        self.pid = pid
+        self.label = label
+        self.size = size
+        self.count = 0
+        self.buffers = {name: array("d", bytes(8 * size)) for name in METRICS}
+        self.last_raw = None
+        self.last_time = None
+        self.alerting = set()
+
+    def add(self, raw, now):
+        """Derive rates from the previous raw sample and store them"""
+        cpu_ticks, rss_bytes, fds, read_bytes, write_bytes, _ = raw
+        elapsed = now - self.last_time if self.last_time else 0.0
+        values = {"rss_bytes": rss_bytes, "fds": -1 if fds is None else fds,
+                  "cpu_percent": 0.0, "read_bps": 0.0, "write_bps": 0.0}
+        if self.last_raw and elapsed > 0:
+            values["cpu_percent"] = (cpu_ticks - self.last_raw[0]) / CLOCK_TICKS / elapsed * 100
+            if read_bytes is not None and self.last_raw[3] is not None:
+                values["read_bps"] = max(0, read_bytes - self.last_raw[3]) / elapsed
+            if write_bytes is not None and self.last_raw[4] is not None:
+                values["write_bps"] = max(0, write_bytes - self.last_raw[4]) / elapsed
+        slot = self.count % self.size
+        for name, value in values.items():
+            self.buffers[name][slot] = value
+        self.count += 1
+        self.last_raw = raw
+        self.last_time = now
+        return values
+
+    def series(self, metric):
+        """Stored values of metric, oldest first"""
+        buffer = self.buffers[metric]
+        if self.count <= self.size:
+            return list(buffer[:self.count])
+        slot = self.count % self.size
+        return list(buffer[slot:]) + list(buffer[:slot])
+
+    def latest(self):
+        if not self.count:
+            return None
+        slot = (self.count - 1) % self.size
+        values = {name: self.buffers[name][slot] for name in METRICS}
+        values["rss_bytes"] = int(values["rss_bytes"])
+        values["fds"] = None if values["fds"] < 0 else int(values["fds"])
+        values["threads"] = self.last_raw[5]
+        return dict(values, pid=self.pid, label=self.label)
+
+
+class ResourceMonitor:
+    """
+    Samples CPU%, RSS, FD count and I/O rates of connector processes from /proc.
+
+    sources() returns {pid: label} for the processes to watch and is called on
+    every sweep; the main PIDs of the cloudflared service and its per-tunnel
+    units are added automatically.
+    on_sample(rows) receives the latest values per process after each sweep and
+    on_alert(row, metric, value, limit) is called once when a metric crosses its
+    threshold (again only after it has recovered).
+    """
+
+    def __init__(self, sources=None, interval=2.0, history=300, thresholds=None,
+                 include_service=True, on_sample=None, on_alert=None):
+        self.sources = sources or dict
+        self.interval = interval
+        self.history_size = history
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+        self.include_service = include_service
+        self.on_sample = on_sample
+        self.on_alert = on_alert
+        self.histories = {}
+        self.lock = threading.Lock()
+        self.service_pids = {}
+        self.service_checked = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def targets(self):
+        targets = dict(self.sources())
+        if self.include_service:
+            now = time.monotonic()
+            if now - self.service_checked > SERVICE_PID_TTL:
+                self.service_pids = service_main_pids()
+                self.service_checked = now
+            for pid, label in self.service_pids.items():
+                targets.setdefault(pid, label)
+        return targets
+
+    def sample_once(self):
+        """Take one sample of every target and return the latest rows"""
+        targets = self.targets()
+        now = time.monotonic()
+        rows = []
+        with self.lock:
+            for pid in list(self.histories):
+                if pid not in targets:
+                    del self.histories[pid]
+            for pid, label in targets.items():
+                raw = read_sample(pid)
+                if raw is None:
+                    self.histories.pop(pid, None)
+                    continue
+                history = self.histories.get(pid)
+                if history is None:
+                    history = self.histories[pid] = ProcessHistory(pid, label, self.history_size)
+                history.add(raw, now)
+                row = history.latest()
+                rows.append(row)
+                self._check(history, row)
+        if self.on_sample:
+            self.on_sample(rows)
+        return rows
+
+    def _check(self, history, row):
+        for metric, limit in self.thresholds.items():
+            value = row.get(metric)
+            if value is None or limit is None:
+                continue
+            if value > limit:
+                if metric not in history.alerting:
+                    history.alerting.add(metric)
+                    if self.on_alert:
+                        self.on_alert(row, metric, value, limit)
+            else:
+                history.alerting.discard(metric)
+
+    def series(self, pid, metric):
+        with self.lock:
+            history = self.histories.get(pid)
+            return history.series(metric) if history else []
+
+    def run(self):
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.sample_once()
+            except Exception:
+                pass  # a sweep must never kill the monitor
+            self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        if not os.path.isdir("/proc"):
+            return self  # /proc is Linux only; the monitor stays idle elsewhere
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+
+def format_bytes(value):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(value) < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def describe_alert(row, metric, value, limit):
+    if metric in ("rss_bytes", "read_bps", "write_bps"):
+        value, limit = format_bytes(value), format_bytes(limit)
+    elif metric == "cpu_percent":
+        value, limit = f"{value:.0f}%", f"{limit:.0f}%"
+    return f"{row['label']} (PID {row['pid']}): {metric} {value} exceeds {limit}"
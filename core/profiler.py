@@ -0,0 +1,318 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from core.config import ARGOGUI_DIR
+
+PROFILE_DIR = ARGOGUI_DIR / "profiles"
+
+SAMPLING = "sampling"
+DETERMINISTIC = "deterministic"
+MODES = (SAMPLING, DETERMINISTIC)
+
+# Seconds between stack samples, and frames kept per sample
+SAMPLE_INTERVAL = 0.01
+MAX_DEPTH = 128
+
+# Frames recorded per allocation once tracemalloc is on
+TRACEMALLOC_FRAMES = 25
+
+# From 3.12 cProfile runs on sys.monitoring, which allows one active profiler per process
+PER_THREAD_CPROFILE = sys.version_info < (3, 12)
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampler: every interval it records the Python stack of every
+    thread, including QThreads, from sys._current_frames(). Stacks are kept
+    aggregated per thread, so memory stays bounded by the number of distinct
+    stacks rather than the run length.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, max_depth=MAX_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.frames = {}  # (file, function, first line) -> index
+        self.stacks = Counter()  # (thread name, (frame index, ...) root first) -> samples
+        self.thread_names = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started = None
+        self.elapsed = 0.0
+
+    def name_thread(self, ident, name):
+        """Label threads threading doesn't know about, e.g. QThreads"""
+        self.thread_names[ident] = name
+
+    def _frame_index(self, code):
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def sample_once(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(self._frame_index(frame.f_code))
+                frame = frame.f_back
+            name = self.thread_names.get(ident) or names.get(ident) or f"thread {ident}"
+            self.stacks[(name, tuple(reversed(stack)))] += 1
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample_once()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name="argogui-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def speedscope(self, name="ArgoGUI"):
+        """The samples as a speedscope file (https://www.speedscope.app), one profile per thread"""
+        frames = [None] * len(self.frames)
+        for (filename, function, line), index in self.frames.items():
+            frames[index] = {"name": function, "file": filename, "line": line}
+        profiles = {}
+        for (thread, stack), count in self.stacks.items():
+            profile = profiles.setdefault(thread, {
+                "type": "sampled", "name": thread, "unit": "seconds", "startValue": 0,
+                "endValue": 0, "samples": [], "weights": []})
+            profile["samples"].append(list(stack))
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json",
+                "shared": {"frames": frames}, "name": name, "exporter": "argogui",
+                "profiles": sorted(profiles.values(), key=lambda p: -p["endValue"])}
+
+    def top(self, limit=20):
+        """Text table of the functions with the most samples on top of the stack"""
+        own, total = Counter(), Counter()
+        for (_, stack), count in self.stacks.items():
+            if stack:
+                own[stack[-1]] += count
+            for index in set(stack):
+                total[index] += count
+        names = {index: f"{function} ({os.path.basename(filename)}:{line})"
+                 for (filename, function, line), index in self.frames.items()}
+        samples = sum(self.stacks.values()) or 1
+        lines = [f"{'own %':>7} {'total %':>8}  function"]
+        for index, count in own.most_common(limit):
+            lines.append(f"{count * 100 / samples:7.1f} {total[index] * 100 / samples:8.1f}  {names[index]}")
+        return "\n".join(lines)
+
+
+class _Snapshot:
+    """Already collected cProfile stats in the shape pstats.Stats() loads"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class DeterministicProfiler:
+    """
+    cProfile in every thread: the main thread, threads started through
+    threading after start(), and threads that run inside thread_scope().
+    """
+
+    def __init__(self):
+        if not PER_THREAD_CPROFILE:
+            raise ValueError("deterministic profiling needs one cProfile per thread, which Python 3.12 "
+                             "and later do not allow; use --profile=sampling")
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.main = None
+
+    def _new_profile(self):
+        import cProfile
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append((threading.get_ident(), profile))
+        return profile
+
+    def _thread_hook(self, *args):
+        # Called once in each new thread; enable() then replaces this hook
+        self._new_profile().enable()
+
+    def start(self):
+        self.main = self._new_profile()
+        threading.setprofile(self._thread_hook)
+        self.main.enable()
+
+    def enable_current_thread(self):
+        profile = self._new_profile()
+        profile.enable()
+        return profile
+
+    def stop(self):
+        import pstats
+        threading.setprofile(None)
+        own = threading.get_ident()
+        snapshots = []
+        with self.lock:
+            for ident, profile in self.profiles:
+                if ident == own:
+                    profile.disable()
+                # Profiles of threads still running are read, not disabled, which is safe under the GIL
+                profile.snapshot_stats()
+                snapshots.append(_Snapshot(profile.stats))
+        return pstats.Stats(*snapshots, stream=sys.stderr)
+
+
+class AllocationTracker:
+    """
+    On-demand tracemalloc snapshots, each reported against the previous one.
+    Tracing only starts at the first capture, so sessions that never take a
+    snapshot don't pay for it; that first report covers only what is still
+    allocated from then on, later ones show the growth since.
+    """
+
+    def __init__(self, directory, frames=TRACEMALLOC_FRAMES):
+        self.directory = str(directory)
+        self.frames = frames
+        self.previous = None
+
+    def capture(self, limit=25):
+        """Write the snapshot and a text report; returns the report's path"""
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(self.directory, f"{stamp}-{os.getpid()}-alloc")
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot.dump(f"{base}.tracemalloc")
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: {current / 1024:.1f} KB now, {peak / 1024:.1f} KB peak", "",
+                 f"Top {limit} allocation sites:"]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:limit]]
+        if self.previous is not None:
+            lines += ["", f"Top {limit} changes since the previous snapshot:"]
+            lines += [str(stat) for stat in snapshot.compare_to(self.previous, "lineno")[:limit]]
+        self.previous = snapshot
+        with open(f"{base}.txt", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return f"{base}.txt"
+
+
+class ProfileSession:
+    """
+    Profiles the whole process until stop() (or exit), then writes
+    <PROFILE_DIR>/<time>-<pid>.speedscope.json for sampling or .pstats for
+    deterministic mode. Allocation snapshots are taken with capture_allocations()
+    or by sending SIGUSR2.
+    """
+
+    def __init__(self, mode=SAMPLING, directory=PROFILE_DIR):
+        if mode not in MODES:
+            raise ValueError(f"unknown profile mode {mode!r}, use one of: {', '.join(MODES)}")
+        self.mode = mode
+        self.directory = str(directory)
+        self.profiler = SamplingProfiler() if mode == SAMPLING else DeterministicProfiler()
+        self.allocations = AllocationTracker(self.directory)
+        self.stopped = False
+
+    def start(self):
+        self.profiler.start()
+        atexit.register(self.stop)
+        try:
+            import signal
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.capture_allocations())
+        except (ImportError, AttributeError, ValueError):
+            pass  # no SIGUSR2 on Windows, or not the main thread
+        return self
+
+    def capture_allocations(self):
+        path = self.allocations.capture()
+        print(f"Allocation snapshot written to {path}", file=sys.stderr)
+        return path
+
+    @contextmanager
+    def thread_scope(self, name):
+        """Profile a thread threading doesn't start, such as a QThread, for the duration of the block"""
+        if isinstance(self.profiler, SamplingProfiler):
+            ident = threading.get_ident()
+            self.profiler.name_thread(ident, name)
+            try:
+                yield
+            finally:
+                # Thread idents are reused once a thread ends
+                self.profiler.thread_names.pop(ident, None)
+            return
+        profile = self.profiler.enable_current_thread()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def stop(self):
+        """Write the profile; returns its path"""
+        if self.stopped:
+            return None
+        self.stopped = True
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        if isinstance(self.profiler, SamplingProfiler):
+            self.profiler.stop()
+            path = f"{base}.speedscope.json"
+            with open(path, "w") as f:
+                json.dump(self.profiler.speedscope(" ".join(sys.argv)), f)
+            print(self.profiler.top(), file=sys.stderr)
+        else:
+            stats = self.profiler.stop()
+            path = f"{base}.pstats"
+            stats.dump_stats(path)
+            stats.sort_stats("cumulative").print_stats(20)
+        print(f"Profile written to {path}", file=sys.stderr)
+        return path
+
+
+_session = None
+
+
+def start(mode=SAMPLING, directory=PROFILE_DIR):
+    """Profile this process until it exits"""
+    global _session
+    _session = ProfileSession(mode, directory).start()
+    return _session
+
+
+def active():
+    return _session is not None and not _session.stopped
+
+
+def capture_allocations():
+    """Write an allocation snapshot if profiling is on; returns its report path or None"""
+    return _session.capture_allocations() if active() else None
+
+
+@contextmanager
+def thread_scope(name):
+    if active():
+        with _session.thread_scope(name):
+            yield
+    else:
+        yield
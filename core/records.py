@@ -0,0 +1,165 @@
+import json
+import sys
+import time
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+    """
+    Compact record with one slot per field instead of a dict. Fields listed in
+    INTERNED repeat across records (ids, names, colos) and are interned, so a
+    tunnel id shared by a tunnel, its routes and its connectors is stored once.
+    Keys not in __slots__ are dropped when parsing.
+    """
+
+    __slots__ = ()
+    INTERNED = ()
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            value = values.get(field)
+            setattr(self, field, _intern(value) if field in self.INTERNED else value)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    @classmethod
+    def parse_many(cls, data):
+        """Records from a JSON array string or an iterable of dicts; records pass through"""
+        if isinstance(data, (str, bytes)):
+            data = json.loads(data) if data.strip() else []
+        return [item if isinstance(item, cls) else cls.from_dict(item) for item in data or []]
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __hash__(self):
+        # Records aren't changed after parsing, so equal records can share set and dict slots
+        return hash((type(self), tuple(getattr(self, field) for field in self.__slots__)))
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__[:2])
+        return f"{type(self).__name__}({fields})"
+
+
+class Connection(Record):
+    """One edge connection from `cloudflared tunnel list`"""
+
+    __slots__ = ("id", "client_id", "client_version", "colo_name", "origin_ip", "opened_at",
+                 "is_pending_reconnect")
+    INTERNED = ("client_id", "client_version", "colo_name", "origin_ip")
+
+
+class Tunnel(Record):
+    __slots__ = ("id", "name", "created_at", "deleted_at", "connections")
+    INTERNED = ("id", "name")
+
+    @classmethod
+    def from_dict(cls, data):
+        tunnel = cls(**data)
+        tunnel.connections = tuple(Connection.from_dict(c) for c in data.get("connections") or ())
+        return tunnel
+
+    def to_dict(self):
+        data = super().to_dict()
+        data["connections"] = [c.to_dict() for c in self.connections]
+        return data
+
+
+class Connector(Record):
+    """One connector row of `cloudflared tunnel info`"""
+
+    __slots__ = ("id", "created", "architecture", "version", "origin_ip", "edge")
+    INTERNED = ("architecture", "version", "origin_ip")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**dict(data, id=data.get("id") or data.get("connector_id")))
+
+
+class DnsRoute(Record):
+    __slots__ = ("hostname", "tunnel_id", "tunnel_name", "cname")
+    INTERNED = ("tunnel_id", "tunnel_name")
+
+
+class IpRoute(Record):
+    __slots__ = ("network", "tunnel_id", "tunnel_name", "virtual_network_id", "comment")
+    INTERNED = ("tunnel_id", "tunnel_name", "virtual_network_id")
+
+    @property
+    def target(self):
+        return self.tunnel_name or self.tunnel_id
+
+
+def group_by_tunnel(routes):
+    """{tunnel_id: [route, ...]} of DNS or IP route records"""
+    grouped = {}
+    for route in routes:
+        grouped.setdefault(route.tunnel_id, []).append(route)
+    return grouped
+
+
+def _sample_tunnels(count, connections):
+    colos = ["ams01", "fra06", "lhr01", "sjc05", "iad03", "sin02"]
+    tunnels = []
+    for i in range(count):
+        client = f"{i:08x}-1111-2222-3333-444455556666"
+        tunnels.append({
+            "id": f"{i:08x}-aaaa-bbbb-cccc-ddddeeeeffff", "name": f"tunnel-{i}",
+            "created_at": "2024-01-01T00:00:00Z", "deleted_at": "0001-01-01T00:00:00Z",
+            "connections": [{"colo_name": colos[(i + j) % len(colos)], "id": f"{i:08x}-{j:04x}-0000-0000-000000000000",
+                             "is_pending_reconnect": False, "origin_ip": "203.0.113.10",
+                             "opened_at": "2024-01-01T00:00:00Z", "client_id": client,
+                             "client_version": "2024.1.5"} for j in range(connections)],
+        })
+    return json.dumps(tunnels)
+
+
+def benchmark(count=10000, connections=4):
+    """Retained memory and parse time of a `tunnel list` payload as dicts vs records"""
+    import gc
+    import io
+    import tracemalloc
+    from core.manager import iter_json_array
+
+    payload = _sample_tunnels(count, connections)
+    results = {"tunnels": count, "connections": connections, "payload_bytes": len(payload)}
+
+    def measure(name, parse):
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        value = parse()
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {"retained_bytes": retained, "peak_bytes": peak, "seconds": round(elapsed, 3)}
+        return value
+
+    measure("dicts", lambda: json.loads(payload))
+    # Streamed straight into records, so the dicts are never all alive at once
+    encoded = payload.encode()
+    measure("records", lambda: [Tunnel.from_dict(t) for t in
+                                iter_json_array(io.TextIOWrapper(io.BytesIO(encoded), encoding="utf-8"))])
+    results["reduction"] = round(1 - results["records"]["retained_bytes"] / results["dicts"]["retained_bytes"], 3)
+    return results
+
+
+def describe_benchmark(results):
+    lines = [f"{results['tunnels']} tunnels x {results['connections']} connections, "
+             f"{results['payload_bytes'] / 1024 / 1024:.1f} MB of JSON"]
+    for name in ("dicts", "records"):
+        r = results[name]
+        lines.append(f"{name:>8}: {r['retained_bytes'] / 1024 / 1024:7.1f} MB retained, "
+                     f"{r['peak_bytes'] / 1024 / 1024:7.1f} MB peak, {r['seconds']:.2f}s")
+    lines.append(f"Records retain {results['reduction'] * 100:.0f}% less memory")
+    return "\n".join(lines)
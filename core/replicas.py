@@ -0,0 +1,234 @@
+import json
+import os
+import platform
+import socket
+import subprocess
+import threading
+
+from core import events
+from core.config import ARGOGUI_DIR
+
+SETTINGS_PATH = ARGOGUI_DIR / "replicas.json"
+
+DEFAULT_SETTINGS = {"replicas": 1, "pin_cpus": False, "nice": 0}
+
+
+def load_settings(tunnel_id, path=SETTINGS_PATH):
+    """Replica settings of one tunnel: replicas, pin_cpus and nice"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(path, "r") as f:
+            settings.update(json.load(f).get(tunnel_id) or {})
+    except (OSError, ValueError):
+        pass
+    return settings
+
+
+def load_all_settings(path=SETTINGS_PATH):
+    """{tunnel_id: settings} of every tunnel with saved settings, from one read of the file"""
+    try:
+        with open(path, "r") as f:
+            return {tid: dict(DEFAULT_SETTINGS, **(settings or {})) for tid, settings in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_settings(tunnel_id, settings, path=SETTINGS_PATH):
+    ARGOGUI_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(path, "r") as f:
+            all_settings = json.load(f)
+    except (OSError, ValueError):
+        all_settings = {}
+    all_settings[tunnel_id] = dict(DEFAULT_SETTINGS, **settings)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(all_settings, f, indent=2)
+    os.replace(tmp, path)
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cpus(count, cpus=None):
+    """Partition cpus into count contiguous, non-overlapping sets (shared round robin if too few)"""
+    cpus = list(cpus or available_cpus())
+    if count <= 0:
+        return []
+    if count > len(cpus):
+        return [{cpus[i % len(cpus)]} for i in range(count)]
+    size, extra = divmod(len(cpus), count)
+    sets = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(set(cpus[start:end]))
+        start = end
+    return sets
+
+
+def free_port(host="127.0.0.1"):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def pin_threads(pid, cpus):
+    """Move every thread of a running process onto cpus; threads it starts later inherit the set"""
+    try:
+        tids = [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except OSError:
+        tids = [pid]
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except OSError:
+            pass  # thread exited meanwhile
+
+
+def launch(tunnel_id, metrics_host="127.0.0.1", cpus=None, nice=0, capture_stderr=True):
+    """Start one `cloudflared tunnel run` connector with its own metrics port; returns (process, metrics)"""
+    metrics = f"{metrics_host}:{free_port(metrics_host)}"
+
+    def prepare():
+        # Runs in the child before exec, so every thread cloudflared creates inherits it
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+        if nice:
+            os.nice(nice)
+
+    args = ["cloudflared", "tunnel", "--metrics", metrics, "run", tunnel_id]
+    # An undrained pipe would eventually block the connector
+    stderr = subprocess.PIPE if capture_stderr else subprocess.DEVNULL
+    if platform.system().lower() == "windows":
+        from subprocess import CREATE_NEW_CONSOLE
+        process = subprocess.Popen(args, creationflags=CREATE_NEW_CONSOLE,
+                                   stdout=subprocess.DEVNULL, stderr=stderr, text=True)
+    else:
+        process = subprocess.Popen(args, preexec_fn=prepare if (cpus or nice) else None,
+                                   stdout=subprocess.DEVNULL, stderr=stderr, text=True)
+    return process, metrics
+
+
+class Replica:
+    def __init__(self, index, process, metrics, cpus=None, nice=0):
+        self.index = index
+        self.process = process
+        self.metrics = metrics
+        self.cpus = cpus
+        self.nice = nice
+        self.stopping = False
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def running(self):
+        return self.process.poll() is None
+
+
+class ReplicaSet:
+    """
+    N `cloudflared tunnel run` connectors for one tunnel. Each replica gets its
+    own metrics port and log stream and, on Linux, optionally its own CPU set
+    and nice value. scale() only starts or stops the difference, so replicas
+    that are already running are never restarted.
+    """
+
+    def __init__(self, tunnel_id, pin_cpus=False, nice=0, metrics_host="127.0.0.1",
+                 log_store=None, on_line=None, max_replicas=None):
+        self.tunnel_id = tunnel_id
+        self.pin_cpus = pin_cpus
+        self.nice = nice
+        self.metrics_host = metrics_host
+        self.log_store = log_store
+        self.on_line = on_line
+        self.max_replicas = max_replicas or len(available_cpus())
+        self.lock = threading.Lock()
+        self.replicas = {}
+        self.count = 0  # replicas asked for by the last scale()
+
+    def _cpu_set(self, index):
+        # CPUs are split over the configured replica count, so each replica gets its full share
+        if not self.pin_cpus or not hasattr(os, "sched_setaffinity") or not self.count:
+            return None
+        return split_cpus(self.count)[index % self.count]
+
+    def _start(self, index):
+        cpus = self._cpu_set(index)
+        on_line = self.on_line
+        line_handler = (lambda line: on_line(index, line)) if on_line else None
+        process, metrics = launch(self.tunnel_id, self.metrics_host, cpus, self.nice,
+                                  capture_stderr=self.log_store is not None)
+        replica = Replica(index, process, metrics, cpus, self.nice)
+        if self.log_store is not None:
+            from core.logstore import follow_stream
+            follow_stream(process.stderr, self.log_store, self.tunnel_id, on_line=line_handler)
+        events.publish(events.CONNECTOR_STARTED, tunnel_id=self.tunnel_id, replica=index,
+                       pid=process.pid, metrics=metrics)
+        threading.Thread(target=self._wait, args=(replica,), daemon=True).start()
+        return replica
+
+    def _wait(self, replica):
+        """Report the replica's exit; one that wasn't asked to stop has crashed"""
+        returncode = replica.process.wait()
+        kind = events.CONNECTOR_STOPPED if replica.stopping else events.CONNECTOR_CRASHED
+        events.publish(kind, tunnel_id=self.tunnel_id, replica=replica.index,
+                       pid=replica.pid, returncode=returncode)
+
+    def _stop(self, replica, timeout=10):
+        replica.stopping = True
+        replica.process.terminate()
+        try:
+            replica.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            replica.process.kill()
+
+    def scale(self, count):
+        """Run exactly count replicas. Returns (started, stopped) replica indexes."""
+        count = max(0, min(count, self.max_replicas))
+        with self.lock:
+            self.count = count
+            # Replicas that exited on their own are replaced, not counted
+            for index in [i for i, r in self.replicas.items() if not r.running()]:
+                del self.replicas[index]
+            started = []
+            index = 0
+            while len(self.replicas) < count:
+                if index not in self.replicas:
+                    self.replicas[index] = self._start(index)
+                    started.append(index)
+                index += 1
+            extra = sorted(self.replicas, reverse=True)[:max(0, len(self.replicas) - count)]
+            stopping = [self.replicas.pop(index) for index in extra]
+            # Replicas that stay are moved onto their share of the new split
+            for replica in self.replicas.values():
+                cpus = self._cpu_set(replica.index)
+                if cpus and cpus != replica.cpus:
+                    pin_threads(replica.pid, cpus)
+                    replica.cpus = cpus
+        for replica in stopping:
+            self._stop(replica)
+        return started, extra
+
+    def stop_all(self):
+        return self.scale(0)[1]
+
+    def __len__(self):
+        with self.lock:
+            return sum(1 for r in self.replicas.values() if r.running())
+
+    def processes(self):
+        """{pid: label} of running replicas, e.g. for the resource monitor"""
+        with self.lock:
+            return {r.pid: f"tunnel {self.tunnel_id[:8]} #{r.index}"
+                    for r in self.replicas.values() if r.running()}
+
+    def list(self):
+        with self.lock:
+            return [{"index": r.index, "pid": r.pid, "running": r.running(), "metrics": r.metrics,
+                     "cpus": sorted(r.cpus) if r.cpus else None, "nice": r.nice}
+                    for r in sorted(self.replicas.values(), key=lambda r: r.index)]
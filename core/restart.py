@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger("argogui.restart")
+
+HASH_KEY = "service_config_hash"
+
+
+def effective_config_hash(service_dir=None, config_path=None):
+    """
+    Hash of the canonicalized service config.yml (or another config, e.g. a
+    per-tunnel one) plus the credentials file it references. Formatting and
+    key order changes don't change the hash.
+    """
+    if config_path is None:
+        from core import manager
+        service_dir = service_dir or manager.get_service_config_dir()
+        config_path = os.path.join(service_dir, "config.yml")
+    from core.config import load_config
+    digest = hashlib.sha256()
+    # Cached while a watcher vouches for the file, so debounced checks don't re-parse it
+    cfg = load_config(config_path)
+    digest.update(json.dumps(cfg, sort_keys=True, default=str).encode())
+    creds_file = cfg.get('credentials-file') if isinstance(cfg, dict) else None
+    if creds_file and os.path.exists(creds_file):
+        with open(creds_file, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class RestartScheduler:
+    """
+    Restarts the cloudflared service only when the effective config changed.
+    Requests within the debounce window are merged into a single restart.
+    Requests for a tunnel run as its own cloudflared@<tunnel> unit restart only
+    that unit, and only if that tunnel's config changed.
+    """
+
+    def __init__(self, debounce=2.0, restart_func=None, state=None, on_decision=None,
+                 tunnel_restart_func=None, tunnel_config_path=None):
+        from core import manager
+        from core.state import StateStore
+        self.debounce = debounce
+        self.restart_func = restart_func or manager.restart_service
+        self.tunnel_restart_func = tunnel_restart_func or manager.restart_tunnel_service
+        self.tunnel_config_path = tunnel_config_path or (lambda tunnel: manager.tunnel_units().config_path(tunnel))
+        self.state = state or StateStore()
+        self.on_decision = on_decision
+        self.lock = threading.Lock()
+        self.timer = None
+        self.pending_reasons = {}  # tunnel (None for the global service) -> reasons
+
+    def _decide(self, message):
+        logger.info(message)
+        if self.on_decision:
+            self.on_decision(message)
+        return message
+
+    def request(self, reason="config changed", tunnel=None):
+        """Ask for a restart of the service, or of one tunnel's unit; it happens debounce seconds after the last request"""
+        with self.lock:
+            self.pending_reasons.setdefault(tunnel, []).append(reason)
+            if self.timer:
+                self.timer.cancel()
+                pending = sum(len(reasons) for reasons in self.pending_reasons.values())
+                self._decide(f"Restart request merged ({pending} pending): {reason}")
+            self.timer = threading.Timer(self.debounce, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Apply pending requests now. Returns True if anything was restarted."""
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            pending = self.pending_reasons
+            self.pending_reasons = {}
+        restarted = False
+        for tunnel, reasons in pending.items():
+            restarted = self.restart_if_changed(", ".join(reasons), tunnel) or restarted
+        return restarted
+
+    def _hash(self, tunnel):
+        if tunnel is None:
+            return HASH_KEY, effective_config_hash()
+        return f"{HASH_KEY}:{tunnel}", effective_config_hash(config_path=self.tunnel_config_path(tunnel))
+
+    def restart_if_changed(self, reason="config changed", tunnel=None):
+        """Restart immediately if the effective config differs from the last applied one"""
+        key, current = self._hash(tunnel)
+        target = "service" if tunnel is None else f"tunnel {tunnel}"
+        applied, _ = self.state.get(key)
+        if current == applied:
+            self._decide(f"Restart of {target} skipped, effective config unchanged ({reason})")
+            return False
+        self._decide(f"Restarting {target}, effective config changed ({reason})")
+        if tunnel is None:
+            self.restart_func()
+        else:
+            self.tunnel_restart_func(tunnel)
+        self.state.put(key, current)
+        return True
+
+    def mark_applied(self, tunnel=None):
+        """Record the current config as running, e.g. after a manual restart"""
+        key, current = self._hash(tunnel)
+        self.state.put(key, current)
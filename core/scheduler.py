@@ -0,0 +1,206 @@
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# Sustained Cloudflare API calls per second and the burst allowed on top
+RATE = 4.0
+BURST = 8
+
+# Tokens background calls leave untouched, so a click never waits for a refill
+INTERACTIVE_RESERVE = 2
+
+# Pause after a throttled call, doubled while the API keeps refusing
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+# cloudflared relays API errors on stderr, e.g. "REST request failed: 429 Too Many Requests"
+_THROTTLED = re.compile(
+    r"(?:status|code|HTTP)\D{0,3}(?:429|5\d\d)\b"
+    r"|\b(?:429|5\d\d) (?:Too Many|Internal Server|Bad Gateway|Service Unavailable|Gateway Timeout)"
+    r"|too many requests|rate.?limit",
+    re.IGNORECASE)
+
+_priority = ContextVar("api_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    """Run API calls made inside the block (on this thread) at the given priority"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def background():
+    return priority(BACKGROUND)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def is_throttled(stderr):
+    return bool(stderr) and bool(_THROTTLED.search(stderr))
+
+
+class ApiScheduler:
+    """
+    Admission control for Cloudflare API-bound cloudflared commands. A token
+    bucket limits the call rate; waiting calls are served interactive first,
+    background only when no interactive call is queued and the reserve is
+    left. A throttled call (429/5xx on stderr) pauses all admissions with
+    exponential backoff.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, reserve=INTERACTIVE_RESERVE, max_backoff=MAX_BACKOFF):
+        self.rate = rate
+        self.burst = burst
+        self.reserve = min(reserve, burst - 1)
+        self.max_backoff = max_backoff
+        self.cond = threading.Condition()
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.backoff = 0.0
+        self.queues = {level: deque() for level in PRIORITIES}
+        self.calls = {level: 0 for level in PRIORITIES}
+        self.waits = {level: deque(maxlen=500) for level in PRIORITIES}
+        self.throttled = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _head(self):
+        for level in PRIORITIES:
+            if self.queues[level]:
+                return self.queues[level][0]
+        return None
+
+    def acquire(self, level=None):
+        """Block until a call at this priority may start; returns the seconds waited"""
+        level = level or current_priority()
+        ticket = object()
+        enqueued = time.monotonic()
+        with self.cond:
+            self.queues[level].append(ticket)
+            try:
+                while True:
+                    if self._head() is not ticket:
+                        self.cond.wait()
+                        continue
+                    now = time.monotonic()
+                    self._refill(now)
+                    needed = 1 + (self.reserve if level == BACKGROUND else 0)
+                    if now >= self.paused_until and self.tokens >= needed:
+                        self.tokens -= 1
+                        break
+                    self.cond.wait(max(self.paused_until - now, (needed - self.tokens) / self.rate, 0.001))
+            finally:
+                self.queues[level].remove(ticket)
+                self.cond.notify_all()
+            waited = time.monotonic() - enqueued
+            self.calls[level] += 1
+            self.waits[level].append(waited)
+        return waited
+
+    def report(self, stderr):
+        """Feed back a call's stderr; returns True if the API throttled it"""
+        throttled = is_throttled(stderr)
+        with self.cond:
+            if throttled:
+                self.throttled += 1
+                self.backoff = min(self.max_backoff, max(MIN_BACKOFF, self.backoff * 2))
+                self.paused_until = time.monotonic() + self.backoff
+                self.tokens = 0.0
+            elif self.backoff:
+                self.backoff = self.backoff / 2 if self.backoff > MIN_BACKOFF else 0.0
+            self.cond.notify_all()
+        return throttled
+
+    def run(self, args, level=None, retries=0, check=False, **kwargs):
+        """
+        subprocess.run() behind the scheduler. stderr is captured to detect
+        throttling and, if the caller didn't ask for it, echoed afterwards.
+        Throttled calls are retried up to retries times (use only for reads).
+        """
+        echo = not kwargs.get("capture_output") and "stderr" not in kwargs
+        if echo:
+            kwargs["stderr"] = subprocess.PIPE
+        while True:
+            self.acquire(level)
+            result = subprocess.run(args, **kwargs)
+            stderr = result.stderr
+            if isinstance(stderr, bytes):
+                stderr = stderr.decode(errors="replace")
+            if echo and stderr:
+                sys.stderr.write(stderr)
+            if not self.report(stderr) or retries <= 0:
+                break
+            retries -= 1
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, args, result.stdout, result.stderr)
+        return result
+
+    def popen(self, args, level=None, **kwargs):
+        """subprocess.Popen() behind the scheduler, for streamed output"""
+        self.acquire(level)
+        return subprocess.Popen(args, **kwargs)
+
+    def stats(self):
+        """Queue depths, wait times (ms) per priority and the current backoff"""
+        with self.cond:
+            self._refill(time.monotonic())
+            result = {"rate": self.rate, "tokens": round(self.tokens, 2), "backoff": self.backoff,
+                      "throttled": self.throttled, "queued": {}, "calls": dict(self.calls), "wait_ms": {}}
+            for level in PRIORITIES:
+                result["queued"][level] = len(self.queues[level])
+                waits = sorted(self.waits[level])
+                result["wait_ms"][level] = {
+                    "avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                    "p95": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+                    "max": round(waits[-1] * 1000, 1) if waits else 0.0,
+                }
+        return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ApiScheduler()
+        return _scheduler
+
+
+def run(args, **kwargs):
+    """Run an API-bound cloudflared command through the process-wide scheduler"""
+    return get_scheduler().run(args, **kwargs)
+
+
+def popen(args, **kwargs):
+    return get_scheduler().popen(args, **kwargs)
+
+
+def describe(stats):
+    lines = [f"Rate {stats['rate']}/s, {stats['tokens']} tokens available, "
+             f"{stats['throttled']} throttled calls, backoff {stats['backoff']:.0f}s"]
+    for level in PRIORITIES:
+        waits = stats["wait_ms"][level]
+        lines.append(f"{level}: {stats['calls'][level]} calls, {stats['queued'][level]} queued, "
+                     f"wait avg {waits['avg']}ms p95 {waits['p95']}ms max {waits['max']}ms")
+    return "\n".join(lines)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+import zlib
+
+from core.config import ARGOGUI_DIR
+
+SNAPSHOT_DIR = ARGOGUI_DIR / "snapshots"
+
+# Snapshots kept by prune() unless told otherwise
+KEEP = 30
+
+
+class SnapshotStore:
+    """
+    Content-addressed backups of .cloudflared directories. Each file is stored
+    once as a zlib-compressed blob named by its sha256; a snapshot is a small
+    JSON manifest of paths to blob hashes. A stat cache (size, mtime, inode)
+    means only files that changed since the last snapshot are read and hashed.
+    """
+
+    def __init__(self, path=SNAPSHOT_DIR):
+        self.path = str(path)
+        self.blob_dir = os.path.join(self.path, "blobs")
+        self.manifest_dir = os.path.join(self.path, "manifests")
+        self.index_path = os.path.join(self.path, "index.json")
+        self.lock = threading.Lock()
+        # Snapshots hold credentials files, so only the owner may read them
+        os.makedirs(self.blob_dir, mode=0o700, exist_ok=True)
+        os.makedirs(self.manifest_dir, mode=0o700, exist_ok=True)
+        os.chmod(self.path, 0o700)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _create(self, path, binary=False):
+        """A new file only the owner can read, whatever the umask"""
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        return os.fdopen(fd, "wb" if binary else "w")
+
+    def _write_json(self, path, data):
+        tmp = f"{path}.tmp"
+        with self._create(tmp) as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _store_blob(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        blob = self._blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), mode=0o700, exist_ok=True)
+            tmp = f"{blob}.{os.getpid()}.tmp"
+            with self._create(tmp, binary=True) as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(tmp, blob)
+        return digest
+
+    def read_blob(self, digest):
+        with open(self._blob_path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def _scan(self, root, index, stats):
+        """Manifest entries of one directory, hashing only files whose stat changed"""
+        entries = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, root)
+                st = os.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    entries[rel] = {"link": os.readlink(path)}
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                key = [st.st_size, st.st_mtime_ns, st.st_ino]
+                cached = index.get(path)
+                if cached and cached[:3] == key and os.path.exists(self._blob_path(cached[3])):
+                    digest = cached[3]
+                else:
+                    try:
+                        digest = self._store_blob(path)
+                    except OSError:
+                        continue  # e.g. a root-only file in the service dir
+                    stats["hashed"] += 1
+                index[path] = key + [digest]
+                entries[rel] = {"hash": digest, "mode": stat.S_IMODE(st.st_mode)}
+        return entries
+
+    def take(self, reason="manual", directories=None):
+        """Snapshot the directories (default: user and service .cloudflared); returns the manifest"""
+        from core.watcher import default_directories
+        directories = directories or default_directories()
+        with self.lock:
+            index = self._load_index()
+            stats = {"hashed": 0}
+            started = time.time()
+            roots = {}
+            for root in directories:
+                root = os.path.abspath(root)
+                if os.path.isdir(root):
+                    roots[root] = self._scan(root, index, stats)
+            snapshot_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(started)) + f"-{int(started * 1000) % 1000:03d}"
+            manifest = {"id": snapshot_id, "created": started, "reason": reason, "roots": roots,
+                        "files": sum(len(entries) for entries in roots.values()), "hashed": stats["hashed"]}
+            self._write_json(os.path.join(self.manifest_dir, f"{snapshot_id}.json"), manifest)
+            # Forget files that no longer exist so the index doesn't grow forever
+            seen = {os.path.join(root, rel) for root, entries in roots.items() for rel in entries}
+            self._write_json(self.index_path, {p: v for p, v in index.items() if p in seen})
+        return manifest
+
+    def list(self):
+        """Manifests, newest first"""
+        manifests = []
+        for name in sorted(os.listdir(self.manifest_dir), reverse=True):
+            if name.endswith(".json"):
+                try:
+                    manifests.append(self.load(name[:-5]))
+                except (OSError, ValueError):
+                    continue
+        return manifests
+
+    def load(self, snapshot_id):
+        with open(os.path.join(self.manifest_dir, f"{snapshot_id}.json"), "r") as f:
+            return json.load(f)
+
+    def restore(self, snapshot_id, directories=None, backup=True):
+        """
+        Restore directories from a snapshot. Each directory is rebuilt next to
+        the original and swapped in with renames, so a failed restore leaves the
+        current files untouched. The current state is snapshotted first.
+        """
+        manifest = self.load(snapshot_id)
+        roots = manifest["roots"]
+        if directories:
+            wanted = {os.path.abspath(d) for d in directories}
+            roots = {root: entries for root, entries in roots.items() if root in wanted}
+        if backup:
+            self.take(f"before restore of {snapshot_id}", list(roots))
+        for root, entries in roots.items():
+            self._restore_root(root, entries)
+        return list(roots)
+
+    def _restore_root(self, root, entries):
+        parent = os.path.dirname(root)
+        os.makedirs(parent, exist_ok=True)
+        staging = os.path.join(parent, f".{os.path.basename(root)}.restore-{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            os.makedirs(staging, mode=0o700)
+            for rel, entry in entries.items():
+                target = os.path.join(staging, rel)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if "link" in entry:
+                    os.symlink(entry["link"], target)
+                    continue
+                with open(target, "wb") as f:
+                    f.write(self.read_blob(entry["hash"]))
+                os.chmod(target, entry.get("mode", 0o600))
+            if os.path.exists(root):
+                shutil.copymode(root, staging)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        old = f"{staging}.old"
+        if os.path.exists(root):
+            os.rename(root, old)
+        try:
+            os.rename(staging, root)
+        except OSError:
+            if os.path.exists(old):
+                os.rename(old, root)
+            raise
+        shutil.rmtree(old, ignore_errors=True)
+
+    def prune(self, keep=KEEP):
+        """Drop all but the newest keep snapshots and the blobs only they used"""
+        with self.lock:
+            manifests = self.list()
+            for manifest in manifests[keep:]:
+                os.remove(os.path.join(self.manifest_dir, f"{manifest['id']}.json"))
+            used = {entry["hash"] for manifest in manifests[:keep]
+                    for entries in manifest["roots"].values() for entry in entries.values() if "hash" in entry}
+            used.update(v[3] for v in self._load_index().values())
+            removed = 0
+            for dirpath, _, filenames in os.walk(self.blob_dir):
+                for name in filenames:
+                    if name not in used:
+                        os.remove(os.path.join(dirpath, name))
+                        removed += 1
+        return removed
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = SnapshotStore()
+    return _store
+
+
+def snapshot_before(operation, directories=None):
+    """Snapshot ahead of a destructive operation; never blocks the operation itself"""
+    try:
+        manifest = get_store().take(f"before {operation}", directories)
+        get_store().prune()
+        return manifest["id"]
+    except Exception as e:
+        print(f"Warning: could not snapshot .cloudflared before {operation}: {e}")
+        return None
+
+
+def describe(manifest):
+    created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(manifest["created"]))
+    return f"{manifest['id']}  {created}  {manifest['files']} files  {manifest['reason']}"
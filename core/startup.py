@@ -0,0 +1,88 @@
+import json
+import os
+import statistics
+import time
+
+from core.config import ARGOGUI_DIR
+
+HISTORY_PATH = ARGOGUI_DIR / "startup.json"
+
+# Absolute budgets in seconds; exceeding one is always reported
+BUDGETS = {"time_to_window": 0.5, "time_to_data": 5.0}
+
+# A run this much slower than the median of recent runs is a regression
+REGRESSION_FACTOR = 1.5
+HISTORY_SIZE = 20
+
+
+def process_start():
+    """perf_counter() value at which this process started, so import time is counted too"""
+    now = time.perf_counter()
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            stat = f.read()
+        with open("/proc/uptime", "rb") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError):
+        return now
+    start_ticks = int(stat[stat.rindex(b")") + 2:].split()[19])
+    return now - max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+class StartupTimeline:
+    """
+    Named milestones measured from process start (or from when the timeline
+    was created). finish() stores the run and reports budget overruns and
+    regressions against the median of previous runs.
+    """
+
+    def __init__(self, origin=None, history_path=HISTORY_PATH, budgets=None):
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.history_path = str(history_path)
+        self.budgets = dict(BUDGETS if budgets is None else budgets)
+        self.marks = {}
+        self.finished = False
+
+    def mark(self, name):
+        """Record a milestone once; later calls with the same name are ignored"""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.origin
+        return self.marks[name]
+
+    def has(self, *names):
+        return all(name in self.marks for name in names)
+
+    def _load_history(self):
+        try:
+            with open(self.history_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def finish(self):
+        """Persist this run; returns a list of warning strings (empty when all is well)"""
+        if self.finished:
+            return []
+        self.finished = True
+        history = self._load_history()
+        warnings = []
+        for name, value in self.marks.items():
+            budget = self.budgets.get(name)
+            if budget is not None and value > budget:
+                warnings.append(f"{name} {value * 1000:.0f}ms exceeds budget of {budget * 1000:.0f}ms")
+            previous = [run[name] for run in history if name in run]
+            if len(previous) >= 3:
+                median = statistics.median(previous)
+                if median > 0 and value > median * REGRESSION_FACTOR:
+                    warnings.append(f"{name} {value * 1000:.0f}ms regressed from a median of {median * 1000:.0f}ms")
+        history.append(dict(self.marks, at=time.time()))
+        try:
+            os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+            with open(self.history_path, "w") as f:
+                json.dump(history[-HISTORY_SIZE:], f)
+        except OSError:
+            pass
+        return warnings
+
+    def describe(self):
+        return ", ".join(f"{name} {value * 1000:.0f}ms" for name, value in sorted(self.marks.items(), key=lambda m: m[1]))
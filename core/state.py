@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import threading
+import time
+
+from core import scheduler
+from core.config import ARGOGUI_DIR
+
+STATE_DB_PATH = ARGOGUI_DIR / "state.db"
+
+# Snapshot entries older than this are shown but marked stale
+STALE_AFTER = 60
+
+
+class StateStore:
+    """
+    Local snapshot of the last known tunnels, routes, connector info and service
+    status, each stored with the time it was fetched. Front-ends render from it
+    on start and reconcile in the background.
+    """
+
+    def __init__(self, path=STATE_DB_PATH):
+        self.path = str(path)
+        if self.path != ":memory:":
+            ARGOGUI_DIR.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshot (key TEXT PRIMARY KEY, value TEXT, fetched_at REAL)")
+        self.conn.commit()
+
+    def put(self, key, value, fetched_at=None):
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        with self.lock:
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?)",
+                                  (key, json.dumps(value), fetched_at))
+
+    def get(self, key, default=None):
+        """Return (value, fetched_at), or (default, None) if never fetched"""
+        with self.lock:
+            row = self.conn.execute("SELECT value, fetched_at FROM snapshot WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default, None
+        return json.loads(row[0]), row[1]
+
+    def age(self, key):
+        _, fetched_at = self.get(key)
+        return None if fetched_at is None else time.time() - fetched_at
+
+    def is_stale(self, key, max_age=STALE_AFTER):
+        age = self.age(key)
+        return age is None or age > max_age
+
+    def delete(self, key):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM snapshot WHERE key = ?", (key,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def describe_age(fetched_at):
+    """Human readable age of a snapshot entry, e.g. '3m ago'"""
+    if fetched_at is None:
+        return "never"
+    age = max(0, time.time() - fetched_at)
+    if age < 60:
+        return f"{int(age)}s ago"
+    if age < 3600:
+        return f"{int(age // 60)}m ago"
+    if age < 86400:
+        return f"{int(age // 3600)}h ago"
+    return f"{int(age // 86400)}d ago"
+
+
+def _fetch_installed():
+    from core.utils import check_cloudflared_installed
+    return check_cloudflared_installed()
+
+
+def _fetch_service_status():
+    from core import manager
+    return manager.is_service_running()
+
+
+def _fetch_tunnels():
+    from core import manager
+    return list(manager.iter_tunnels())
+
+
+def _fetch_dns_routes():
+    from core import manager
+    return manager.list_dns_routes()
+
+
+def _fetch_ip_routes():
+    from core import manager
+    return manager.list_ip_routes()
+
+
+FETCHERS = {
+    "cloudflared_installed": _fetch_installed,
+    "service_running": _fetch_service_status,
+    "tunnels": _fetch_tunnels,
+    "dns_routes": _fetch_dns_routes,
+    "ip_routes": _fetch_ip_routes,
+}
+
+
+def refresh(store, keys=None, on_update=None, priority=scheduler.INTERACTIVE):
+    """
+    Fetch the given snapshot keys concurrently and store the results.
+    on_update(key, value, error) is called as each one completes.
+    """
+    keys = list(keys or FETCHERS)
+    threads = []
+
+    def fetch(key):
+        try:
+            with scheduler.priority(priority):
+                value = FETCHERS[key]()
+        except Exception as e:
+            if on_update:
+                on_update(key, None, str(e))
+            return
+        store.put(key, value)
+        if on_update:
+            on_update(key, value, None)
+
+    for key in keys:
+        thread = threading.Thread(target=fetch, args=(key,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+
+def refresh_in_background(store, keys=None, on_update=None):
+    """Run refresh() in a daemon thread and return it"""
+    thread = threading.Thread(target=refresh, args=(store, keys, on_update, scheduler.BACKGROUND), daemon=True)
+    thread.start()
+    return thread
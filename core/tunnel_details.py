@@ -0,0 +1,155 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import events, scheduler
+from core.records import Connector, DnsRoute, group_by_tunnel
+
+PARTS = ("info", "connectors", "dns_routes", "config")
+
+# Cached details younger than this are not prefetched again
+FRESH_FOR = 60
+
+# Forks running at once for detail fetches, and prefetches allowed to wait for one
+PREFETCH_WORKERS = 3
+PREFETCH_QUEUE = 8
+
+
+def parse_connectors(info_text):
+    """Connector rows of `cloudflared tunnel info` output as Connector records"""
+    connectors = []
+    columns = None
+    for line in info_text.splitlines():
+        if not line.strip():
+            continue
+        if "CONNECTOR ID" in line:
+            columns = [c.lower().replace(" ", "_") for c in re.split(r"\s{2,}", line.strip())]
+        elif columns:
+            connectors.append(Connector.from_dict(dict(zip(columns, re.split(r"\s{2,}", line.strip())))))
+    return connectors
+
+
+def read_config(tunnel_id):
+    """The local config.yml, or the tunnel's credentials file if there is no config"""
+    try:
+        config_path = os.path.expanduser("~/.cloudflared/config.yml")
+        if os.path.exists(config_path):
+            with open(config_path, "r") as f:
+                return f.read()
+        creds_path = os.path.expanduser(f"~/.cloudflared/{tunnel_id}.json")
+        if os.path.exists(creds_path):
+            with open(creds_path, "r") as f:
+                return f"Credentials file:\n{f.read()}"
+        return "No configuration found for this tunnel."
+    except Exception as e:
+        return f"Error reading configuration: {e}"
+
+
+class TunnelDetails:
+    """
+    Per-tunnel cache of info, connectors, DNS routes and config, so detail views
+    open from cached data and refresh in the background. Fetches run on a small
+    pool and identical fetches in flight are shared; DNS routes come from one
+    `route dns list` for all tunnels. on_update(tunnel_id, part, error) is called
+    from a worker thread after each fetch (tunnel_id is None for DNS routes,
+    which cover every tunnel).
+    """
+
+    def __init__(self, on_update=None, workers=PREFETCH_WORKERS, queue=PREFETCH_QUEUE, fresh_for=FRESH_FOR):
+        self.on_update = on_update
+        self.queue = queue
+        self.fresh_for = fresh_for
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="tunnel-details")
+        self.lock = threading.Lock()
+        self.cache = {}  # (tunnel_id, part) -> (value, fetched_at); DNS routes under (None, "dns_routes")
+        self.inflight = {}  # (tunnel_id, fetch) -> Future
+
+    def get(self, tunnel_id, part):
+        """Return (value, fetched_at), or (None, None) if not cached"""
+        with self.lock:
+            if part == "dns_routes":
+                routes, fetched_at = self.cache.get((None, part), (None, None))
+                return (None, None) if routes is None else (routes.get(tunnel_id, []), fetched_at)
+            return self.cache.get((tunnel_id, part), (None, None))
+
+    def is_fresh(self, tunnel_id, part):
+        _, fetched_at = self.get(tunnel_id, part)
+        return fetched_at is not None and time.time() - fetched_at < self.fresh_for
+
+    def refresh(self, tunnel_id, parts=PARTS, force=True):
+        """Fetch parts in the background; without force only stale parts, within the prefetch budget"""
+        # connectors are parsed from the info output, one fork serves both
+        fetches = {"info" if part == "connectors" else part for part in parts}
+        submitted = []
+        for fetch in sorted(fetches):
+            if not force and self.is_fresh(tunnel_id, fetch):
+                continue
+            key = (None if fetch == "dns_routes" else tunnel_id, fetch)
+            with self.lock:
+                if key in self.inflight:
+                    continue
+                if not force and len(self.inflight) >= self.queue:
+                    break
+                # Prefetches queue behind interactive API calls
+                self.inflight[key] = self.executor.submit(
+                    self._fetch, key, scheduler.INTERACTIVE if force else scheduler.BACKGROUND)
+            submitted.append(fetch)
+        return submitted
+
+    def prefetch(self, tunnel_ids, parts=PARTS):
+        """Warm the cache for tunnels likely to be opened next, e.g. visible or hovered rows"""
+        for tunnel_id in tunnel_ids:
+            self.refresh(tunnel_id, parts, force=False)
+
+    def _fetch(self, key, priority):
+        tunnel_id, fetch = key
+        error = None
+        try:
+            with scheduler.priority(priority):
+                self._fetch_part(tunnel_id, fetch)
+        except Exception as e:
+            error = getattr(e, "stderr", None) or str(e)
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+        if self.on_update:
+            self.on_update(tunnel_id, fetch, error)
+
+    def _fetch_part(self, tunnel_id, fetch):
+        if fetch == "info":
+            from core import manager
+            info = manager.tunnel_info(tunnel_id, capture_output=True).stdout
+            self._store(tunnel_id, info=info, connectors=parse_connectors(info))
+        elif fetch == "dns_routes":
+            from core import manager
+            self._store(None, dns_routes=group_by_tunnel(DnsRoute.parse_many(manager.list_dns_routes())))
+        elif fetch == "config":
+            self._store(tunnel_id, config=read_config(tunnel_id))
+
+    def _store(self, tunnel_id, **parts):
+        fetched_at = time.time()
+        with self.lock:
+            for part, value in parts.items():
+                self.cache[(tunnel_id, part)] = (value, fetched_at)
+
+    def invalidate(self, tunnel_id=None, parts=PARTS):
+        """Drop cached parts of one tunnel, or of every tunnel when tunnel_id is None"""
+        with self.lock:
+            for key in list(self.cache):
+                if key[1] in parts and (tunnel_id is None or key[0] in (tunnel_id, None)):
+                    del self.cache[key]
+
+    def apply_event(self, event):
+        """Drop what a state-change event made out of date"""
+        data = event.data
+        if event.kind == events.TUNNEL_DELETED:
+            self.invalidate(data.get("tunnel_id"))
+        elif event.kind == events.DNS_ROUTE_ADDED:
+            self.invalidate(parts=("dns_routes",))
+        elif event.kind in (events.CONNECTOR_STARTED, events.CONNECTOR_STOPPED, events.CONNECTOR_CRASHED):
+            self.invalidate(data.get("tunnel_id"), ("info", "connectors"))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,274 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+import yaml
+
+TEMPLATE = "cloudflared@.service"
+UNIT_DIR = "/etc/systemd/system"
+
+# The single service cloudflared's own `service install` creates
+GLOBAL_UNIT = "cloudflared.service"
+
+SHOW_PROPERTIES = ("Id", "LoadState", "ActiveState", "SubState", "MainPID", "NRestarts")
+
+# Units per `systemctl show` call, keeping the command line well under ARG_MAX
+SHOW_BATCH = 256
+
+_SAFE = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789:_.")
+
+
+def escape_instance(name):
+    """Instance string as `systemd-escape` produces it"""
+    escaped = []
+    for i, byte in enumerate(name.encode("utf-8")):
+        char = chr(byte)
+        if char == "/":
+            escaped.append("-")
+        elif char in _SAFE and not (i == 0 and char == "."):
+            escaped.append(char)
+        else:
+            escaped.append(f"\\x{byte:02x}")
+    return "".join(escaped)
+
+
+def unescape_instance(escaped):
+    data = bytearray()
+    i = 0
+    while i < len(escaped):
+        if escaped.startswith("\\x", i) and i + 4 <= len(escaped):
+            data.append(int(escaped[i + 2:i + 4], 16))
+            i += 4
+        else:
+            data += b"/" if escaped[i] == "-" else escaped[i].encode()
+            i += 1
+    return data.decode("utf-8", errors="replace")
+
+
+def unit_name(tunnel):
+    return f"cloudflared@{escape_instance(tunnel)}.service"
+
+
+def tunnel_of(unit):
+    """Tunnel of a cloudflared@<tunnel>.service name, None for any other unit"""
+    if not unit.startswith("cloudflared@") or not unit.endswith(".service"):
+        return None
+    return unescape_instance(unit[len("cloudflared@"):-len(".service")])
+
+
+def render_template(exe, config_dir):
+    """The cloudflared@.service template; %I is the unescaped tunnel, whose config is <config_dir>/<tunnel>.yml"""
+    return (
+        "[Unit]\n"
+        "Description=cloudflared tunnel %I\n"
+        "After=network-online.target\n"
+        "Wants=network-online.target\n"
+        "\n"
+        "[Service]\n"
+        "Type=notify\n"
+        f"ExecStart={exe} --no-autoupdate --config {config_dir}/%I.yml tunnel run\n"
+        "Restart=on-failure\n"
+        "RestartSec=5s\n"
+        "TimeoutStartSec=0\n"
+        "\n"
+        "[Install]\n"
+        "WantedBy=multi-user.target\n"
+    )
+
+
+def render_config(tunnel_id, credentials_file, url=None):
+    """Per-tunnel config, the same keys update_service_config() writes for the global service"""
+    config = {"tunnel": tunnel_id, "credentials-file": str(credentials_file)}
+    if url:
+        config["url"] = url
+    return yaml.safe_dump(config, sort_keys=False)
+
+
+def show_command(units, properties=SHOW_PROPERTIES):
+    return ["systemctl", "show", "--no-pager", f"--property={','.join(properties)}", *units]
+
+
+def parse_show(text):
+    """{unit: {property: value}} of `systemctl show` output for several units (blocks split by blank lines)"""
+    units = {}
+    for block in text.split("\n\n"):
+        properties = {}
+        for line in block.splitlines():
+            key, equals, value = line.partition("=")
+            if equals:
+                properties[key] = value
+        if properties.get("Id"):
+            units[properties["Id"]] = properties
+    return units
+
+
+def batches(items, size=SHOW_BATCH):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def describe_unit(properties):
+    """Status of one unit as a dict: unit, loaded, active, state, pid, restarts"""
+    pid = properties.get("MainPID", "0")
+    restarts = properties.get("NRestarts", "")
+    return {
+        "unit": properties.get("Id"),
+        "loaded": properties.get("LoadState") == "loaded",
+        "active": properties.get("ActiveState") == "active",
+        "state": f"{properties.get('ActiveState', 'unknown')}/{properties.get('SubState', 'unknown')}",
+        "pid": int(pid) if pid.isdigit() and pid != "0" else None,
+        "restarts": int(restarts) if restarts.isdigit() else None,
+    }
+
+
+def _run(args):
+    return subprocess.run(args, capture_output=True, text=True)
+
+
+class TemplateUnits:
+    """
+    cloudflared@<tunnel>.service instances of one template unit, each running
+    the tunnel's own config from config_dir, so tunnels start, stop and restart
+    independently. runner(args) runs a command and returns a CompletedProcess
+    with text output; pass a fake one to use this without systemd.
+    """
+
+    def __init__(self, runner=None, unit_dir=UNIT_DIR, config_dir=None, use_sudo=None):
+        if config_dir is None:
+            from core import manager
+            config_dir = os.path.join(manager.get_service_config_dir(), "tunnels")
+        self.runner = runner or _run
+        self.unit_dir = unit_dir
+        self.config_dir = config_dir
+        self.use_sudo = (hasattr(os, "geteuid") and os.geteuid() != 0) if use_sudo is None else use_sudo
+
+    def _root(self, args):
+        return (["sudo"] if self.use_sudo else []) + list(args)
+
+    def _check(self, args):
+        result = self.runner(self._root(args))
+        if result.returncode != 0:
+            raise RuntimeError((result.stderr or "").strip() or f"{' '.join(args)} failed")
+        return result
+
+    def _write(self, path, text):
+        """Write a root-owned file, through `sudo install` when not running as root"""
+        from core.config import invalidate
+        if not self.use_sudo:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            invalidate(path)
+            return
+        with tempfile.NamedTemporaryFile("w", suffix=".tmp", delete=False) as f:
+            f.write(text)
+        try:
+            self._check(["install", "-D", "-m", "644", f.name, path])
+        finally:
+            os.remove(f.name)
+        invalidate(path)
+
+    def config_path(self, tunnel):
+        return os.path.join(self.config_dir, f"{tunnel}.yml")
+
+    def template_path(self):
+        return os.path.join(self.unit_dir, TEMPLATE)
+
+    def install_template(self, exe=None):
+        """Write the template unit if it differs; returns True if systemd was reloaded"""
+        exe = exe or shutil.which("cloudflared") or "/usr/local/bin/cloudflared"
+        text = render_template(exe, self.config_dir)
+        try:
+            with open(self.template_path(), "r") as f:
+                if f.read() == text:
+                    return False
+        except OSError:
+            pass
+        self._write(self.template_path(), text)
+        self._check(["systemctl", "daemon-reload"])
+        return True
+
+    def install(self, tunnel, tunnel_id, credentials_file, url=None, start=True, on_written=None):
+        """
+        Write the tunnel's config and enable its unit; returns the unit name.
+        A unit that was already running is restarted only if its config changed.
+        on_written(tunnel) is called once the config is on disk, before the unit
+        (re)starts, e.g. to mark it applied so the file watcher doesn't restart it again.
+        """
+        self.install_template()
+        text = render_config(tunnel_id, credentials_file, url)
+        try:
+            with open(self.config_path(tunnel), "r") as f:
+                changed = f.read() != text
+        except OSError:
+            changed = True
+        was_active = start and changed and self.status([tunnel]).get(tunnel, {}).get("active", False)
+        if changed:
+            self._write(self.config_path(tunnel), text)
+        if on_written:
+            on_written(tunnel)
+        self._check(["systemctl", "enable", *(["--now"] if start else []), unit_name(tunnel)])
+        if was_active:
+            self.restart(tunnel)
+        return unit_name(tunnel)
+
+    def uninstall(self, tunnel):
+        self._check(["systemctl", "disable", "--now", unit_name(tunnel)])
+        path = self.config_path(tunnel)
+        if self.use_sudo:
+            self._check(["rm", "-f", path])
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def instances(self):
+        """Tunnels with a config in config_dir, i.e. the instances this template can run"""
+        try:
+            names = os.listdir(self.config_dir)
+        except OSError:
+            return []
+        return sorted(name[:-4] for name in names if name.endswith(".yml"))
+
+    def _control(self, action, tunnels):
+        # One systemctl call for any number of units
+        tunnels = [tunnels] if isinstance(tunnels, str) else list(tunnels)
+        if tunnels:
+            self._check(["systemctl", action, *(unit_name(t) for t in tunnels)])
+        return tunnels
+
+    def start(self, tunnels):
+        return self._control("start", tunnels)
+
+    def stop(self, tunnels):
+        return self._control("stop", tunnels)
+
+    def restart(self, tunnels):
+        """Restart only these tunnels' units; other tunnels keep running"""
+        return self._control("restart", tunnels)
+
+    def status(self, tunnels=None, include_global=False):
+        """
+        {tunnel: describe_unit() dict} for the given tunnels (default: every
+        instance) with one `systemctl show` per SHOW_BATCH units. The global
+        cloudflared.service is included under None if asked for.
+        """
+        tunnels = self.instances() if tunnels is None else list(tunnels)
+        units = [unit_name(t) for t in tunnels] + ([GLOBAL_UNIT] if include_global else [])
+        wanted = set(units)
+        statuses = {}
+        for batch in batches(units):
+            result = self.runner(show_command(batch))
+            for unit, properties in parse_show(result.stdout or "").items():
+                if unit in wanted:
+                    statuses[tunnel_of(unit)] = describe_unit(properties)
+        return statuses
+
+    def main_pids(self, include_global=True):
+        """{main PID: label} of running units, e.g. for the resource monitor"""
+        return {status["pid"]: "cloudflared service" if tunnel is None else status["unit"]
+                for tunnel, status in self.status(include_global=include_global).items() if status["pid"]}
+
+
+def describe_status(status):
+    return f"{status['unit']}: {status['state']}" + (f", PID {status['pid']}" if status["pid"] else "")
@@ -0,0 +1,222 @@
+import ctypes
+import ctypes.util
+import itertools
+import os
+import platform
+import select
+import struct
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+ChangeEvent = namedtuple("ChangeEvent", ["kind", "path"])
+
+# Event kinds
+CONFIG_CHANGED = "config_changed"
+CREDENTIALS_ADDED = "credentials_added"
+CREDENTIALS_REMOVED = "credentials_removed"
+CREDENTIALS_CHANGED = "credentials_changed"
+CERT_ROTATED = "cert_rotated"
+
+# inotify(7) flags
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def default_directories():
+    """The user and service .cloudflared directories, plus the per-tunnel unit configs"""
+    from core import manager
+    dirs = [str(Path.home() / ".cloudflared"), manager.get_service_config_dir(),
+            os.path.join(manager.get_service_config_dir(), "tunnels")]
+    return list(dict.fromkeys(os.path.abspath(d) for d in dirs))
+
+
+def is_tunnel_config(path):
+    """A per-tunnel config of a cloudflared@<tunnel> unit (<service dir>/tunnels/<tunnel>.yml)"""
+    return path.endswith(".yml") and os.path.basename(os.path.dirname(path)) == "tunnels"
+
+
+def classify(path, added=False, removed=False):
+    """Map a changed file to an event kind, or None for files we don't care about"""
+    name = os.path.basename(path)
+    if name in ("config.yml", "config.yaml"):
+        return CONFIG_CHANGED
+    if is_tunnel_config(path):
+        return CONFIG_CHANGED
+    if name == "cert.pem":
+        return CERT_ROTATED
+    if name.endswith(".json"):
+        if added:
+            return CREDENTIALS_ADDED
+        if removed:
+            return CREDENTIALS_REMOVED
+        return CREDENTIALS_CHANGED
+    return None
+
+
+class Watcher:
+    """
+    Watches .cloudflared directories and pushes ChangeEvents to subscribers from a
+    background thread. Uses inotify on Linux and falls back to polling directory
+    listings elsewhere. Bursts (editors writing temp files and renaming) are
+    coalesced into one event per file.
+    """
+
+    def __init__(self, directories=None, poll_interval=2.0, settle=0.1):
+        self.directories = [os.path.abspath(d) for d in directories] if directories else default_directories()
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.subscribers = []
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.backend = "inotify" if _libc() is not None else "polling"
+        self.watching = {}  # directory -> generation, only while an inotify watch is live on it
+        self._generations = itertools.count(1)
+
+    def subscribe(self, callback):
+        """callback(ChangeEvent) is called from the watcher thread"""
+        self.subscribers.append(callback)
+        return callback
+
+    def generation(self, directory):
+        """Generation of the live inotify watch on directory, None when it isn't watched.
+        A directory that lost its watch and got it back has a new generation."""
+        return self.watching.get(directory)
+
+    def start(self):
+        if self.thread:
+            return self
+        target = self._run_inotify if self.backend == "inotify" else self._run_polling
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _dispatch(self, events):
+        for event in events.values():
+            for callback in list(self.subscribers):
+                try:
+                    callback(event)
+                except Exception:
+                    pass
+
+    def _run_inotify(self):
+        libc = _libc()
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return self._run_polling()
+        watches = {}
+        pending = {}
+        last_event = 0.0
+        try:
+            while not self.stop_event.is_set():
+                # (Re)attach to directories that appear or were recreated
+                for directory in self.directories:
+                    if directory not in watches.values() and os.path.isdir(directory):
+                        wd = libc.inotify_add_watch(fd, directory.encode(), WATCH_MASK)
+                        if wd >= 0:
+                            watches[wd] = directory
+                            self.watching[directory] = next(self._generations)
+                ready, _, _ = select.select([fd], [], [], self.settle if pending else 1.0)
+                if ready:
+                    try:
+                        data = os.read(fd, 64 * 1024)
+                    except BlockingIOError:
+                        data = b""
+                    offset = 0
+                    while offset < len(data):
+                        wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                        offset += _EVENT_HEADER.size
+                        name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+                        offset += length
+                        if mask & (IN_IGNORED | IN_DELETE_SELF):
+                            # Changes are no longer reported until the directory is watched again
+                            directory = watches.pop(wd, None)
+                            if directory is not None:
+                                self.watching.pop(directory, None)
+                            continue
+                        if not name or wd not in watches:
+                            continue
+                        path = os.path.join(watches[wd], name)
+                        kind = classify(path, added=bool(mask & (IN_CREATE | IN_MOVED_TO)),
+                                        removed=bool(mask & (IN_DELETE | IN_MOVED_FROM)))
+                        if kind:
+                            # A create followed by its write is still an addition
+                            previous = pending.get(path)
+                            if not (previous and previous.kind == CREDENTIALS_ADDED and kind == CREDENTIALS_CHANGED):
+                                pending[path] = ChangeEvent(kind, path)
+                            last_event = time.monotonic()
+                if pending and time.monotonic() - last_event >= self.settle:
+                    self._dispatch(pending)
+                    pending = {}
+        finally:
+            self.watching.clear()
+            os.close(fd)
+
+    def _run_polling(self):
+        snapshots = {d: _listing(d) for d in self.directories}
+        while not self.stop_event.wait(self.poll_interval):
+            events = {}
+            for directory in self.directories:
+                before = snapshots[directory]
+                after = _listing(directory)
+                for name in after.keys() - before.keys():
+                    path = os.path.join(directory, name)
+                    kind = classify(path, added=True)
+                    if kind:
+                        events[path] = ChangeEvent(kind, path)
+                for name in before.keys() - after.keys():
+                    path = os.path.join(directory, name)
+                    kind = classify(path, removed=True)
+                    if kind:
+                        events[path] = ChangeEvent(kind, path)
+                for name in after.keys() & before.keys():
+                    if after[name] != before[name]:
+                        path = os.path.join(directory, name)
+                        kind = classify(path)
+                        if kind:
+                            events[path] = ChangeEvent(kind, path)
+                snapshots[directory] = after
+            if events:
+                self._dispatch(events)
+
+
+def _listing(directory):
+    try:
+        with os.scandir(directory) as entries:
+            return {e.name: (e.stat().st_mtime_ns, e.stat().st_size) for e in entries if e.is_file()}
+    except OSError:
+        return {}
+
+
+_LIBC = []
+
+
+def _libc():
+    """libc with inotify support, or None when unavailable"""
+    if not _LIBC:
+        lib = None
+        if platform.system().lower() == "linux":
+            try:
+                lib = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                lib.inotify_init1.argtypes = [ctypes.c_int]
+                lib.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            except (OSError, AttributeError):
+                lib = None
+        _LIBC.append(lib)
+    return _LIBC[0]
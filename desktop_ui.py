@@ -2,15 +2,27 @@ import sys
 import json
 import os
 import yaml
+from collections import deque
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-    QPushButton, QLabel, QLineEdit, QTextEdit, QTabWidget, 
+    QPushButton, QLabel, QLineEdit, QTextEdit, QPlainTextEdit, QTabWidget, 
     QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView, QComboBox,
-    QCheckBox, QGroupBox, QFormLayout, QDialog, QDialogButtonBox, QFileDialog
+    QCheckBox, QGroupBox, QFormLayout, QDialog, QDialogButtonBox, QFileDialog, QSpinBox
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from PyQt6.QtGui import QFont, QIcon
-from core import manager
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt6.QtGui import QFont, QIcon, QTextCursor
+from core import config, manager
+from core.logstore import LogStore, format_record, ingest_service_logs, line_level
+from core.state import StateStore, describe_age
+from core.restart import RestartScheduler
+from core.procmon import ResourceMonitor, describe_alert, format_bytes
+from core.startup import StartupTimeline, process_start
+from core import profiler
+from core.tunnel_details import TunnelDetails
+from core import cleanup, events, replicas
+from core.records import Tunnel
+from core.iproutes import build_index, describe_finding
+from core.watcher import Watcher, is_tunnel_config, CONFIG_CHANGED, CREDENTIALS_ADDED, CREDENTIALS_REMOVED, CREDENTIALS_CHANGED, CERT_ROTATED
 from core.utils import check_cloudflared_installed, download_and_install_cloudflared
 
 class CommandThread(QThread):
@@ -28,12 +40,106 @@ class CommandThread(QThread):
         
     def run(self):
         try:
-            result = self.command_func(*self.args, **self.kwargs)
+            with profiler.thread_scope(f"CommandThread {getattr(self.command_func, '__name__', 'task')}"):
+                result = self.command_func(*self.args, **self.kwargs)
             self.output_ready.emit(str(result))
             self.finished_with_status.emit(True, "")
         except Exception as e:
             self.finished_with_status.emit(False, str(e))
 
+class ConsoleWidget(QWidget):
+    """
+    Bounded log console. post() may be called from any thread; messages are
+    queued and appended in batches a few times per second, so a burst of output
+    costs one layout per flush instead of one per line.
+    """
+    MAX_LINES = 5000
+    FLUSH_HZ = 10
+    LEVELS = ["debug", "info", "warn", "error", "fatal"]
+    FILTERS = [("All", "debug"), ("Info and above", "info"), ("Warnings and errors", "warn"), ("Errors only", "error")]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # deque appends and pops are atomic, so producers never take a lock
+        self.pending = deque(maxlen=self.MAX_LINES)
+        self.history = deque(maxlen=self.MAX_LINES)
+        self.min_level = 0
+        
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        controls = QHBoxLayout()
+        self.level_combo = QComboBox()
+        self.level_combo.addItems([label for label, _ in self.FILTERS])
+        self.level_combo.currentIndexChanged.connect(self.set_level_filter)
+        controls.addWidget(self.level_combo)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search (Enter for next match)")
+        self.search_input.textChanged.connect(lambda text: self.search())
+        self.search_input.returnPressed.connect(lambda: self.search(next_match=True))
+        controls.addWidget(self.search_input)
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self.clear)
+        controls.addWidget(clear_btn)
+        layout.addLayout(controls)
+        
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        self.output.setMaximumBlockCount(self.MAX_LINES)
+        layout.addWidget(self.output)
+        self.setLayout(layout)
+        
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(1000 // self.FLUSH_HZ)
+
+    def post(self, message, level=None):
+        """Queue a message; safe to call from worker threads"""
+        if level is None:
+            level = "error" if message.lower().startswith("error") else line_level(message)
+        rank = self.LEVELS.index(level) if level in self.LEVELS else 1
+        for line in message.splitlines() or [""]:
+            self.pending.append((rank, line))
+
+    def flush(self):
+        lines = []
+        while self.pending:
+            try:
+                rank, line = self.pending.popleft()
+            except IndexError:
+                break
+            self.history.append((rank, line))
+            if rank >= self.min_level:
+                lines.append(line)
+        if lines:
+            # One append per batch; the block limit trims the oldest lines
+            self.output.appendPlainText("\n".join(lines[-self.MAX_LINES:]))
+
+    def set_level_filter(self, index):
+        self.min_level = self.LEVELS.index(self.FILTERS[index][1])
+        self.flush()
+        self.output.setPlainText("\n".join(line for rank, line in self.history if rank >= self.min_level))
+        self.output.moveCursor(QTextCursor.MoveOperation.End)
+        self.search()
+
+    def search(self, next_match=False):
+        """Incremental search: refine the current match as the text changes, wrap around at the end"""
+        text = self.search_input.text()
+        cursor = self.output.textCursor()
+        if not next_match:
+            cursor.setPosition(cursor.selectionStart())
+            self.output.setTextCursor(cursor)
+        found = not text or self.output.find(text)
+        if text and not found:
+            cursor.movePosition(QTextCursor.MoveOperation.Start)
+            self.output.setTextCursor(cursor)
+            found = self.output.find(text)
+        self.search_input.setStyleSheet("" if found else "color: red;")
+
+    def clear(self):
+        self.pending.clear()
+        self.history.clear()
+        self.output.clear()
+
 class TunnelInfoDialog(QDialog):
     def __init__(self, parent=None, tunnel_id=None, tunnel_info=None):
         super().__init__(parent)
@@ -255,19 +361,66 @@ class CreateTunnelDialog(QDialog):
         self.status_output.append(text)
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # Emitted from background threads, delivered on the UI thread
+    restart_decision = pyqtSignal(str)
+    fs_changed = pyqtSignal(str, str)
+    resources_sampled = pyqtSignal(object)
+    resource_alert = pyqtSignal(str)
+    tunnel_detail_ready = pyqtSignal(object, str, object)
+    cleanup_planned = pyqtSignal(object)
+    cleanup_result = pyqtSignal(object, str, object)
+    
+    def __init__(self, timeline=None):
         super().__init__()
+        self.timeline = timeline
         self.setWindowTitle("Cloudflare Argo Tunnel Manager")
         self.resize(800, 600)
         
         # Keep references to active threads
         self.active_threads = []
         
-        # Track running tunnels
+        # Track running tunnels: tunnel id -> ReplicaSet of its local connectors
         self.running_tunnels = {}
-        
-        # Check if cloudflared is installed
-        self.cloudflared_installed = check_cloudflared_installed()
+        # Replica settings of every tunnel, read with each tunnel list refresh
+        self.replica_settings = {}
+        
+        # Local index of tunnel/service logs
+        self.log_store = LogStore()
+        
+        # Last known state, so the window can render before any fork completes
+        self.state = StateStore()
+        self.cloudflared_installed, installed_at = self.state.get("cloudflared_installed", True)
+        service_running, service_at = self.state.get("service_running")
+        
+        # Coalesces config-driven restarts and skips them when nothing changed
+        self.restart_decision.connect(self.log)
+        self.restart_decision.connect(lambda message: self.refresh_status())
+        self.restart_scheduler = RestartScheduler(state=self.state, on_decision=self.restart_decision.emit)
+        
+        # Live updates for edits made to .cloudflared outside the GUI
+        self.watcher = Watcher()
+        config.attach_watcher(self.watcher)
+        self.watcher.subscribe(lambda event: self.fs_changed.emit(event.kind, event.path))
+        self.fs_changed.connect(self.on_fs_changed)
+        
+        # Samples tunnels started here plus the service's main process
+        self.resources_sampled.connect(self.update_resources_table)
+        self.resource_alert.connect(lambda message: self.log(f"Resource alert: {message}", "warn"))
+        self.resource_monitor = ResourceMonitor(
+            sources=lambda: {pid: label for replica_set in list(self.running_tunnels.values())
+                             for pid, label in replica_set.processes().items()},
+            on_sample=self.resources_sampled.emit,
+            on_alert=lambda *alert: self.resource_alert.emit(describe_alert(*alert)))
+        
+        # Tunnel details cached per tunnel; the info dialog opens from the cache
+        # and visible or hovered rows are prefetched in the background
+        self.info_dialogs = {}
+        self.tunnel_detail_ready.connect(self.on_tunnel_detail)
+        self.tunnel_details = TunnelDetails(on_update=self.tunnel_detail_ready.emit)
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(150)
+        self.prefetch_timer.timeout.connect(self.prefetch_visible_tunnels)
         
         # Create main widget and layout
         main_widget = QWidget()
@@ -276,7 +429,71 @@ class MainWindow(QMainWindow):
         # Create tabs
         self.tabs = QTabWidget()
         
-        # Dashboard tab
+        # Only the dashboard is built up front, the other tabs on first activation
+        self.tab_builders = {}
+        self.tunnels_table = None
+        self.tunnels_loading = False
+        self.tabs.addTab(self._build_dashboard_tab(installed_at, service_running, service_at), "Dashboard")
+        self.add_lazy_tab("Tunnels", self._build_tunnels_tab)
+        self.add_lazy_tab("Advanced", self._build_advanced_tab)
+        self.add_lazy_tab("Cleanup", self._build_cleanup_tab)
+        self.tabs.currentChanged.connect(self.ensure_tab_built)
+        
+        main_layout.addWidget(self.tabs)
+        main_widget.setLayout(main_layout)
+        self.setCentralWidget(main_widget)
+        
+        # Probes and background services start once the window has painted
+        QTimer.singleShot(0, self.start_background_work)
+    
+    def start_background_work(self):
+        """Startup work that must not delay the first paint; probes run in their own threads"""
+        self.startup_mark("time_to_window")
+        
+        # Initial probes run concurrently
+        self.refresh_status()
+        self.refresh_tunnels()
+        
+        # State changes arrive as events: the snapshot catches up on what other
+        # front-ends journaled, then the UI applies them incrementally
+        self.bus = events.get_bus()
+        events.track_snapshot(self.state, self.bus)
+        self.event_bridge = events.qt_bridge(self.bus, parent=self)
+        self.event_bridge.event.connect(self.on_event)
+        self.event_sync_timer = QTimer(self)
+        self.event_sync_timer.timeout.connect(self.bus.sync)
+        self.event_sync_timer.start(2000)
+        
+        self.watcher.start()
+        self.resource_monitor.start()
+    
+    def startup_mark(self, name):
+        """Record a startup milestone; once all initial data is in, report the timeline"""
+        if self.timeline is None or self.timeline.finished:
+            return
+        self.timeline.mark(name)
+        if self.timeline.has("cloudflared_status", "service_status", "tunnels"):
+            self.timeline.mark("time_to_data")
+            self.log(f"Startup: {self.timeline.describe()}")
+            for warning in self.timeline.finish():
+                self.log(f"Startup regression: {warning}", "warn")
+    
+    def add_lazy_tab(self, title, builder):
+        """Add a tab whose contents are built by builder() the first time it is shown"""
+        placeholder = QWidget()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        placeholder.setLayout(layout)
+        index = self.tabs.addTab(placeholder, title)
+        self.tab_builders[index] = builder
+    
+    def ensure_tab_built(self, index):
+        builder = self.tab_builders.pop(index, None)
+        if builder is not None:
+            self.tabs.widget(index).layout().addWidget(builder())
+    
+    def _build_dashboard_tab(self, installed_at, service_running, service_at):
+        """Build the Dashboard tab"""
         dashboard_tab = QWidget()
         dashboard_layout = QVBoxLayout()
         
@@ -285,10 +502,15 @@ class MainWindow(QMainWindow):
         status_layout = QVBoxLayout()
         
         self.status_label = QLabel("Cloudflared Status: " + 
-                                   ("Installed" if self.cloudflared_installed else "Not Installed"))
+                                   ("Installed" if self.cloudflared_installed else "Not Installed") +
+                                   (f" (cached {describe_age(installed_at)})" if installed_at else " (checking...)"))
         status_layout.addWidget(self.status_label)
         
-        self.service_status_label = QLabel("Service Status: Checking...")
+        if service_at is None:
+            self.service_status_label = QLabel("Service Status: Checking...")
+        else:
+            self.service_status_label = QLabel(
+                f"Service Status: {'Running' if service_running else 'Not Running'} (cached {describe_age(service_at)})")
         status_layout.addWidget(self.service_status_label)
         
         status_buttons = QHBoxLayout()
@@ -296,10 +518,10 @@ class MainWindow(QMainWindow):
         self.refresh_status_btn.clicked.connect(self.refresh_status)
         status_buttons.addWidget(self.refresh_status_btn)
         
-        if not self.cloudflared_installed:
-            self.install_btn = QPushButton("Install Cloudflared")
-            self.install_btn.clicked.connect(self.install_cloudflared)
-            status_buttons.addWidget(self.install_btn)
+        self.install_btn = QPushButton("Install Cloudflared")
+        self.install_btn.clicked.connect(self.install_cloudflared)
+        self.install_btn.setVisible(not self.cloudflared_installed)
+        status_buttons.addWidget(self.install_btn)
         
         status_layout.addLayout(status_buttons)
         status_group.setLayout(status_layout)
@@ -324,18 +546,30 @@ class MainWindow(QMainWindow):
         service_group.setLayout(service_layout)
         dashboard_layout.addWidget(service_group)
         
+        # Connector resource usage, sampled from /proc
+        resources_group = QGroupBox("Connector Resources")
+        resources_layout = QVBoxLayout()
+        self.resources_table = QTableWidget(0, 7)
+        self.resources_table.setHorizontalHeaderLabels(["Process", "PID", "CPU %", "RSS", "FDs", "Read/s", "Write/s"])
+        self.resources_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.resources_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        resources_layout.addWidget(self.resources_table)
+        resources_group.setLayout(resources_layout)
+        dashboard_layout.addWidget(resources_group)
+        
         # Output console
         console_group = QGroupBox("Console Output")
         console_layout = QVBoxLayout()
-        self.console_output = QTextEdit()
-        self.console_output.setReadOnly(True)
-        console_layout.addWidget(self.console_output)
+        self.console = ConsoleWidget()
+        console_layout.addWidget(self.console)
         console_group.setLayout(console_layout)
         dashboard_layout.addWidget(console_group)
         
         dashboard_tab.setLayout(dashboard_layout)
-        
-        # Tunnels tab
+        return dashboard_tab
+    
+    def _build_tunnels_tab(self):
+        """Build the Tunnels tab"""
         tunnels_tab = QWidget()
         tunnels_layout = QVBoxLayout()
         
@@ -356,16 +590,29 @@ class MainWindow(QMainWindow):
         
         tunnels_layout.addLayout(tunnel_controls)
         
+        self.tunnels_state_label = QLabel("")
+        tunnels_layout.addWidget(self.tunnels_state_label)
+        
         # Tunnels table
         self.tunnels_table = QTableWidget()
         self.tunnels_table.setColumnCount(5)
         self.tunnels_table.setHorizontalHeaderLabels(["ID", "Name", "Created", "Status", "Actions"])
         self.tunnels_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.tunnels_table.setMouseTracking(True)
+        self.tunnels_table.cellEntered.connect(self.prefetch_tunnel_row)
+        self.tunnels_table.verticalScrollBar().valueChanged.connect(lambda value: self.prefetch_timer.start())
         tunnels_layout.addWidget(self.tunnels_table)
         
         tunnels_tab.setLayout(tunnels_layout)
         
-        # Advanced tab
+        # Render what is already known; a fetch still in flight renders when it lands
+        tunnels, fetched_at = self.state.get("tunnels")
+        if tunnels is not None:
+            self.update_tunnels_table(tunnels, fetched_at=fetched_at, refreshing=self.tunnels_loading)
+        return tunnels_tab
+    
+    def _build_advanced_tab(self):
+        """Build the Advanced tab"""
         advanced_tab = QWidget()
         advanced_layout = QVBoxLayout()
         
@@ -388,6 +635,33 @@ class MainWindow(QMainWindow):
         install_service_group.setLayout(install_service_layout)
         advanced_layout.addWidget(install_service_group)
         
+        # Per-tunnel cloudflared@<tunnel> units
+        units_group = QGroupBox("Per-Tunnel Services")
+        units_layout = QVBoxLayout()
+        units_controls = QHBoxLayout()
+        self.unit_tunnel_input = QLineEdit()
+        self.unit_tunnel_input.setPlaceholderText("Tunnel ID or name")
+        units_controls.addWidget(self.unit_tunnel_input)
+        for label, action in (("Install", "install"), ("Start", "start"), ("Stop", "stop"),
+                              ("Restart", "restart"), ("Uninstall", "uninstall")):
+            button = QPushButton(label)
+            button.clicked.connect(lambda checked, a=action: self.control_tunnel_service(a))
+            units_controls.addWidget(button)
+        self.refresh_units_btn = QPushButton("Refresh")
+        self.refresh_units_btn.clicked.connect(self.refresh_tunnel_services)
+        units_controls.addWidget(self.refresh_units_btn)
+        units_layout.addLayout(units_controls)
+        self.units_table = QTableWidget()
+        self.units_table.setColumnCount(4)
+        self.units_table.setHorizontalHeaderLabels(["Tunnel", "Unit", "State", "PID"])
+        self.units_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.units_table.cellClicked.connect(
+            lambda row, column: self.unit_tunnel_input.setText(self.units_table.item(row, 0).text()))
+        units_layout.addWidget(self.units_table)
+        units_group.setLayout(units_layout)
+        advanced_layout.addWidget(units_group)
+        self.refresh_tunnel_services()
+        
         # Diagnostics
         diagnostics_group = QGroupBox("Diagnostics")
         diagnostics_layout = QVBoxLayout()
@@ -396,41 +670,147 @@ class MainWindow(QMainWindow):
         self.diagnose_btn.clicked.connect(self.diagnose_service_config)
         diagnostics_layout.addWidget(self.diagnose_btn)
         
-        diagnostics_group.setLayout(diagnostics_layout)
-        advanced_layout.addWidget(diagnostics_group)
+        self.diagnostic_bundle_btn = QPushButton("Collect Diagnostic Bundle")
+        self.diagnostic_bundle_btn.clicked.connect(self.collect_diagnostic_bundle)
+        diagnostics_layout.addWidget(self.diagnostic_bundle_btn)
         
-        advanced_tab.setLayout(advanced_layout)
+        if profiler.active():
+            self.allocation_snapshot_btn = QPushButton("Capture Allocation Snapshot")
+            self.allocation_snapshot_btn.clicked.connect(
+                lambda: self.log(f"Allocation snapshot written to {profiler.capture_allocations()}"))
+            diagnostics_layout.addWidget(self.allocation_snapshot_btn)
         
-        # Add tabs to tab widget
-        self.tabs.addTab(dashboard_tab, "Dashboard")
-        self.tabs.addTab(tunnels_tab, "Tunnels")
-        self.tabs.addTab(advanced_tab, "Advanced")
+        diagnostics_group.setLayout(diagnostics_layout)
+        advanced_layout.addWidget(diagnostics_group)
         
-        main_layout.addWidget(self.tabs)
-        main_widget.setLayout(main_layout)
-        self.setCentralWidget(main_widget)
+        # IP routes
+        ip_routes_group = QGroupBox("IP Routes")
+        ip_routes_layout = QHBoxLayout()
+        self.ip_route_input = QLineEdit()
+        self.ip_route_input.setPlaceholderText("IP to look up (10.3.4.5) or CIDR to check (10.3.0.0/16)")
+        ip_routes_layout.addWidget(self.ip_route_input)
+        self.ip_route_btn = QPushButton("Look Up")
+        self.ip_route_btn.clicked.connect(self.lookup_ip_route)
+        ip_routes_layout.addWidget(self.ip_route_btn)
+        self.reload_ip_routes_btn = QPushButton("Reload Routes")
+        self.reload_ip_routes_btn.clicked.connect(self.reload_ip_routes)
+        ip_routes_layout.addWidget(self.reload_ip_routes_btn)
+        ip_routes_group.setLayout(ip_routes_layout)
+        advanced_layout.addWidget(ip_routes_group)
+        
+        # Log search
+        logs_group = QGroupBox("Logs")
+        logs_layout = QVBoxLayout()
+        
+        logs_form = QHBoxLayout()
+        self.log_search_input = QLineEdit()
+        self.log_search_input.setPlaceholderText("Search text, e.g. connection")
+        logs_form.addWidget(self.log_search_input)
+        
+        self.log_tunnel_input = QLineEdit()
+        self.log_tunnel_input.setPlaceholderText("Tunnel ID (optional)")
+        logs_form.addWidget(self.log_tunnel_input)
+        
+        self.log_level_combo = QComboBox()
+        self.log_level_combo.addItems(["any", "debug", "info", "warn", "error", "fatal"])
+        logs_form.addWidget(self.log_level_combo)
+        
+        self.log_window_combo = QComboBox()
+        self.log_window_combo.addItems(["Last hour", "Last 24 hours", "Last 7 days", "All"])
+        logs_form.addWidget(self.log_window_combo)
+        
+        self.log_search_btn = QPushButton("Search")
+        self.log_search_btn.clicked.connect(self.search_logs)
+        logs_form.addWidget(self.log_search_btn)
+        
+        self.import_service_logs_btn = QPushButton("Import Service Logs")
+        self.import_service_logs_btn.clicked.connect(self.import_service_logs)
+        logs_form.addWidget(self.import_service_logs_btn)
+        logs_layout.addLayout(logs_form)
+        
+        self.log_results = QTextEdit()
+        self.log_results.setReadOnly(True)
+        logs_layout.addWidget(self.log_results)
+        
+        logs_group.setLayout(logs_layout)
+        advanced_layout.addWidget(logs_group)
         
-        # Initialize status
-        self.refresh_status()
-        self.refresh_tunnels()
+        advanced_tab.setLayout(advanced_layout)
+        return advanced_tab
     
-    def log(self, message):
-        """Add message to console output"""
-        self.console_output.append(message)
+    def _build_cleanup_tab(self):
+        """Build the Cleanup tab: stale tunnels and orphaned credentials, deleted on request"""
+        cleanup_tab = QWidget()
+        cleanup_layout = QVBoxLayout()
+        
+        cleanup_controls = QHBoxLayout()
+        cleanup_controls.addWidget(QLabel("Days without connectors:"))
+        self.cleanup_days_spin = QSpinBox()
+        self.cleanup_days_spin.setRange(1, 3650)
+        self.cleanup_days_spin.setValue(cleanup.DEFAULT_DAYS)
+        cleanup_controls.addWidget(self.cleanup_days_spin)
+        
+        self.cleanup_scan_btn = QPushButton("Scan")
+        self.cleanup_scan_btn.clicked.connect(self.scan_cleanup)
+        cleanup_controls.addWidget(self.cleanup_scan_btn)
+        
+        self.cleanup_delete_btn = QPushButton("Delete Selected")
+        self.cleanup_delete_btn.setEnabled(False)
+        self.cleanup_delete_btn.clicked.connect(self.apply_cleanup)
+        cleanup_controls.addWidget(self.cleanup_delete_btn)
+        cleanup_layout.addLayout(cleanup_controls)
+        
+        self.cleanup_label = QLabel("Scan to list tunnels and credentials files that can be removed.")
+        cleanup_layout.addWidget(self.cleanup_label)
+        
+        # Rows are checked by default; the Result column fills in as deletions complete
+        self.cleanup_table = QTableWidget()
+        self.cleanup_table.setColumnCount(4)
+        self.cleanup_table.setHorizontalHeaderLabels(["Item", "Kind", "Reason", "Result"])
+        self.cleanup_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        cleanup_layout.addWidget(self.cleanup_table)
+        
+        self.cleanup_items = []
+        self.cleanup_planned.connect(self.show_cleanup_plan)
+        self.cleanup_result.connect(self.show_cleanup_result)
+        
+        cleanup_tab.setLayout(cleanup_layout)
+        return cleanup_tab
+    
+    def log(self, message, level=None):
+        """Add message to console output (safe from any thread)"""
+        self.console.post(message, level)
     
     def refresh_status(self):
         """Refresh cloudflared and service status"""
-        self.cloudflared_installed = check_cloudflared_installed()
-        self.status_label.setText("Cloudflared Status: " + 
-                                  ("Installed" if self.cloudflared_installed else "Not Installed"))
+        # Check installation in a thread
+        thread = CommandThread(check_cloudflared_installed)
+        thread.output_ready.connect(self.update_installed_status)
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
         
         # Check service status in a thread
         thread = CommandThread(manager.is_service_running)
-        thread.output_ready.connect(lambda result: 
-            self.service_status_label.setText(f"Service Status: {'Running' if result.strip().lower() == 'true' else 'Not Running'}"))
+        thread.output_ready.connect(self.update_service_status)
         self.active_threads.append(thread)  # Keep reference
         thread.start()
     
+    def update_installed_status(self, result):
+        """Show the result of check_cloudflared_installed"""
+        self.cloudflared_installed = result.strip().lower() == 'true'
+        self.state.put("cloudflared_installed", self.cloudflared_installed)
+        self.status_label.setText("Cloudflared Status: " + 
+                                  ("Installed" if self.cloudflared_installed else "Not Installed"))
+        self.install_btn.setVisible(not self.cloudflared_installed)
+        self.startup_mark("cloudflared_status")
+    
+    def update_service_status(self, result):
+        """Show the result of is_service_running"""
+        running = result.strip().lower() == 'true'
+        self.state.put("service_running", running)
+        self.service_status_label.setText(f"Service Status: {'Running' if running else 'Not Running'}")
+        self.startup_mark("service_status")
+    
     def install_cloudflared(self):
         """Install cloudflared"""
         self.log("Installing cloudflared...")
@@ -461,48 +841,124 @@ class MainWindow(QMainWindow):
         self.active_threads.append(thread)  # Keep reference
         thread.start()
     
+    def refresh_tunnel_services(self):
+        """Status of every cloudflared@<tunnel> unit, from one batched systemctl call"""
+        thread = CommandThread(lambda: json.dumps(manager.tunnel_services_status()))
+        thread.output_ready.connect(self.update_units_table)
+        thread.finished_with_status.connect(lambda success, error:
+            None if success else self.log(f"Per-tunnel services unavailable: {error}"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
+    def update_units_table(self, statuses_json):
+        statuses = json.loads(statuses_json)
+        self.units_table.setRowCount(len(statuses))
+        for row, (tunnel, status) in enumerate(sorted(statuses.items())):
+            values = [tunnel, status["unit"], status["state"], str(status["pid"] or "")]
+            for column, value in enumerate(values):
+                self.units_table.setItem(row, column, QTableWidgetItem(value))
+    
+    def control_tunnel_service(self, action):
+        """Install, start, stop, restart or uninstall one tunnel's unit; other tunnels are not touched"""
+        tunnel = self.unit_tunnel_input.text().strip()
+        if not tunnel:
+            self.log("Enter a tunnel ID or name first")
+            return
+        if action == "install":
+            # Marked applied as soon as it is written, before the watcher queues a restart for our own write
+            thread = CommandThread(manager.install_tunnel_service, tunnel,
+                                   on_written=self.restart_scheduler.mark_applied)
+        else:
+            thread = CommandThread(getattr(manager, f"{action}_tunnel_service"), tunnel)
+        self.log(f"{action.capitalize()} cloudflared@{tunnel}...")
+        if action == "restart":
+            # The unit now runs the config on disk, a later edit is compared against it
+            thread.finished_with_status.connect(lambda success, error:
+                self.restart_scheduler.mark_applied(tunnel) if success else None)
+        thread.finished_with_status.connect(lambda success, error:
+            self.refresh_tunnel_services() if success else self.log(f"Error: {error}"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
     def restart_service(self):
         """Restart cloudflared service"""
         self.log("Restarting service...")
         thread = CommandThread(manager.restart_service)
         thread.output_ready.connect(self.log)
         thread.finished_with_status.connect(lambda success, error: 
-            self.refresh_status() if success else self.log(f"Error: {error}"))
+            (self.restart_scheduler.mark_applied(), self.refresh_status()) if success else self.log(f"Error: {error}"))
         self.active_threads.append(thread)  # Keep reference
         thread.start()
     
     def refresh_tunnels(self):
         """Refresh tunnels list"""
         self.log("Refreshing tunnels...")
-        thread = CommandThread(manager.list_tunnels)
+        self.tunnels_loading = True
+        
+        def fetch():
+            # Read off the UI thread, so rendering rows doesn't touch the disk
+            self.replica_settings = replicas.load_all_settings()
+            return manager.list_tunnels()
+        
+        thread = CommandThread(fetch)
         thread.output_ready.connect(self.update_tunnels_table)
+        thread.finished_with_status.connect(lambda success, error:
+            None if success else self.tunnels_refresh_failed(error))
         self.active_threads.append(thread)  # Keep reference
         thread.start()
     
-    def update_tunnels_table(self, tunnels_json):
-        """Update tunnels table with data"""
+    def tunnels_refresh_failed(self, error):
+        """End a failed refresh: the cached rows stay, and startup doesn't wait for tunnels forever"""
+        self.log(f"Error refreshing tunnels: {error}")
+        self.tunnels_loading = False
+        self.startup_mark("tunnels")
+        if self.tunnels_table is not None:
+            self.tunnels_state_label.setText("Could not refresh tunnels, showing cached data")
+    
+    def update_tunnels_table(self, tunnels_json, fetched_at=None, refreshing=True):
+        """
+        Update tunnels table with a JSON string from cloudflared or an already parsed
+        list, fetched_at is set when rendering the cached snapshot
+        """
         try:
-            tunnels = json.loads(tunnels_json)
+            tunnels = json.loads(tunnels_json) if isinstance(tunnels_json, str) else tunnels_json
+            if fetched_at is None:
+                self.state.put("tunnels", tunnels)
+                self.tunnels_loading = False
+                self.startup_mark("tunnels")
+            if self.tunnels_table is None:
+                # Rendered from the snapshot when the Tunnels tab is first opened
+                return
+            if fetched_at is None:
+                self.tunnels_state_label.setText("")
+            elif not refreshing:
+                self.tunnels_state_label.setText("")
+            else:
+                self.tunnels_state_label.setText(
+                    f"Showing cached data from {describe_age(fetched_at)}, refreshing...")
+            tunnels = Tunnel.parse_many(tunnels)
             self.tunnels_table.setRowCount(len(tunnels))
             
             for row, tunnel in enumerate(tunnels):
-                tunnel_id = tunnel.get('id', 'N/A')
+                tunnel_id = tunnel.id or 'N/A'
                 
                 # ID
                 id_item = QTableWidgetItem(tunnel_id)
                 self.tunnels_table.setItem(row, 0, id_item)
                 
                 # Name
-                name_item = QTableWidgetItem(tunnel.get('name', 'N/A'))
+                name_item = QTableWidgetItem(tunnel.name or 'N/A')
                 self.tunnels_table.setItem(row, 1, name_item)
                 
                 # Created
-                created_item = QTableWidgetItem(tunnel.get('created_at', 'N/A'))
+                created_item = QTableWidgetItem(tunnel.created_at or 'N/A')
                 self.tunnels_table.setItem(row, 2, created_item)
                 
                 # Status
                 is_running = tunnel_id in self.running_tunnels
-                status_item = QTableWidgetItem("Running" if is_running else "Stopped")
+                replica_count = len(self.running_tunnels[tunnel_id]) if is_running else 0
+                status_item = QTableWidgetItem(
+                    (f"Running ({replica_count} replicas)" if replica_count > 1 else "Running") if is_running else "Stopped")
                 if is_running:
                     status_item.setForeground(Qt.GlobalColor.green)
                 self.tunnels_table.setItem(row, 3, status_item)
@@ -527,15 +983,27 @@ class MainWindow(QMainWindow):
                 info_btn.clicked.connect(lambda checked, tid=tunnel_id: self.show_tunnel_info(tid))
                 actions_layout.addWidget(info_btn)
                 
+                replicas_spin = QSpinBox()
+                replicas_spin.setRange(1, len(replicas.available_cpus()))
+                replicas_spin.setPrefix("x")
+                replicas_spin.setToolTip("Local connector replicas")
+                replicas_spin.setValue(self.replica_settings.get(tunnel_id, replicas.DEFAULT_SETTINGS)["replicas"])
+                replicas_spin.valueChanged.connect(lambda value, tid=tunnel_id: self.set_tunnel_replicas(tid, value))
+                actions_layout.addWidget(replicas_spin)
+                
                 actions_widget.setLayout(actions_layout)
                 self.tunnels_table.setCellWidget(row, 4, actions_widget)
             
-            self.log(f"Found {len(tunnels)} tunnels")
+            self.prefetch_timer.start()
+            if fetched_at is None:
+                self.log(f"Found {len(tunnels)} tunnels")
         except Exception as e:
-            self.log(f"Error parsing tunnels: {e}")
-            if not tunnels_json or tunnels_json.strip() == "":
+            if not tunnels_json or (isinstance(tunnels_json, str) and tunnels_json.strip() == ""):
                 self.log("No tunnels found or cloudflared not installed correctly")
-                self.tunnels_table.setRowCount(0)
+            if fetched_at is None:
+                self.tunnels_refresh_failed(f"unreadable tunnel list: {e}")
+            else:
+                self.log(f"Error parsing tunnels: {e}")
     
     def show_create_tunnel_dialog(self):
         """Show dialog to create a new tunnel"""
@@ -553,33 +1021,19 @@ class MainWindow(QMainWindow):
         
         self.log(f"Creating tunnel '{name}'...")
         
-        # Create tunnel
-        thread = CommandThread(manager.create_tunnel, name)
-        thread.output_ready.connect(self.log)
+        # Create tunnel; create_tunnel returns the new tunnel's record
+        thread = CommandThread(lambda: json.dumps(manager.create_tunnel(name)))
+        thread.output_ready.connect(lambda tunnel_json: 
+            self.configure_tunnel(values, tunnel_json, dialog))
         thread.finished_with_status.connect(lambda success, error: 
-            self.process_tunnel_creation(values, success, error, dialog))
-        self.active_threads.append(thread)  # Keep reference
-        thread.start()
-    
-    def process_tunnel_creation(self, values, success, error, dialog=None):
-        """Process tunnel creation result and continue with configuration"""
-        if not success:
-            self.log(f"Error creating tunnel: {error}")
-            return
-        
-        # Get tunnel UUID from tunnel list
-        self.log("Getting tunnel details...")
-        thread = CommandThread(manager.list_tunnels)
-        thread.output_ready.connect(lambda tunnels_json: 
-            self.configure_tunnel(values, tunnels_json, dialog))
+            None if success else self.log(f"Error creating tunnel: {error}"))
         self.active_threads.append(thread)  # Keep reference
         thread.start()
     
-    def configure_tunnel(self, values, tunnels_json, dialog=None):
+    def configure_tunnel(self, values, tunnel_json, dialog=None):
         """Configure the newly created tunnel"""
         try:
-            tunnels = json.loads(tunnels_json)
-            tunnel = next((t for t in tunnels if t['name'] == values["name"]), None)
+            tunnel = json.loads(tunnel_json)
             
             if not tunnel:
                 self.log("Tunnel creation failed or tunnel not found.")
@@ -663,17 +1117,12 @@ class MainWindow(QMainWindow):
             return
         
         if values["restart_service"]:
-            self.log("Restarting service to apply new tunnel config...")
-            thread = CommandThread(manager.restart_service)
-            thread.output_ready.connect(lambda result: 
-                self.log("Service restarted with new tunnel config."))
-            thread.finished_with_status.connect(lambda success, error:
-                self.setup_routing(values, tunnel_id, dialog))
-            self.active_threads.append(thread)  # Keep reference
-            thread.start()
-        else:
-            # Skip to DNS/IP routing
-            self.setup_routing(values, tunnel_id, dialog)
+            # Back-to-back edits are merged into one restart by the scheduler
+            self.log("Service restart scheduled to apply new tunnel config...")
+            self.restart_scheduler.request(f"new tunnel {tunnel_id}")
+        
+        # Continue with DNS/IP routing
+        self.setup_routing(values, tunnel_id, dialog)
     
     def setup_routing(self, values, tunnel_id, dialog=None):
         """Setup DNS and IP routing if provided"""
@@ -722,9 +1171,6 @@ class MainWindow(QMainWindow):
         # Run tunnel if requested
         if values["run_now"]:
             self.run_tunnel(tunnel_id)
-        
-        # Refresh tunnels list
-        self.refresh_tunnels()
     
     def delete_selected_tunnel(self):
         """Delete the selected tunnel"""
@@ -747,113 +1193,134 @@ class MainWindow(QMainWindow):
             thread = CommandThread(manager.delete_tunnel, tunnel_id)
             thread.output_ready.connect(lambda result: self.log(f"Tunnel {tunnel_id} deleted"))
             thread.finished_with_status.connect(lambda success, error: 
-                self.refresh_tunnels() if success else self.log(f"Error: {error}"))
+                None if success else self.log(f"Error: {error}"))
             self.active_threads.append(thread)  # Keep reference
             thread.start()
     
     def run_tunnel(self, tunnel_id):
-        """Run the specified tunnel"""
+        """Run the configured number of connector replicas for the specified tunnel"""
         # Check if tunnel is already running
         if tunnel_id in self.running_tunnels:
             QMessageBox.information(self, "Tunnel Running", f"Tunnel {tunnel_id} is already running.")
             return
-            
-        self.log(f"Running tunnel {tunnel_id}...")
         
-        # Create a process to run the tunnel
-        import subprocess
-        import platform
-        import os
+        settings = replicas.load_settings(tunnel_id)
+        self.log(f"Running tunnel {tunnel_id} ({settings['replicas']} replicas)...")
         
         try:
-            # Start the tunnel process
-            if platform.system().lower() == "windows":
-                # Use CREATE_NEW_CONSOLE to create a new window for the tunnel
-                from subprocess import CREATE_NEW_CONSOLE
-                process = subprocess.Popen(
-                    ["cloudflared", "tunnel", "run", tunnel_id],
-                    creationflags=CREATE_NEW_CONSOLE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-            else:
-                # For non-Windows platforms
-                process = subprocess.Popen(
-                    ["cloudflared", "tunnel", "run", tunnel_id],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-            # Store the process
-            self.running_tunnels[tunnel_id] = process
-            self.log(f"Tunnel {tunnel_id} started with PID {process.pid}")
+            # Each replica gets its own metrics port and its log output is indexed
+            replica_set = replicas.ReplicaSet(
+                tunnel_id, pin_cpus=settings["pin_cpus"], nice=settings["nice"], log_store=self.log_store,
+                on_line=lambda index, line, tid=tunnel_id:
+                    self.console.post(f"[{tid[:8]}#{index}] {line}", line_level(line)))
+            self.running_tunnels[tunnel_id] = replica_set
+            replica_set.scale(settings["replicas"])
+            for replica in replica_set.list():
+                self.log(f"Tunnel {tunnel_id} replica {replica['index']} started with PID {replica['pid']}"
+                         f" (metrics {replica['metrics']})")
             
             # Update the UI to show the tunnel is running
-            self.refresh_tunnels()
+            self.render_tunnels()
             
         except Exception as e:
             self.log(f"Error starting tunnel: {e}")
     
+    def set_tunnel_replicas(self, tunnel_id, count):
+        """Save the replica count and scale a running tunnel without touching the replicas that stay"""
+        settings = replicas.load_settings(tunnel_id)
+        settings["replicas"] = count
+        replicas.save_settings(tunnel_id, settings)
+        self.replica_settings[tunnel_id] = settings
+        replica_set = self.running_tunnels.get(tunnel_id)
+        if replica_set is None:
+            return
+        thread = CommandThread(replica_set.scale, count)
+        thread.output_ready.connect(lambda result, tid=tunnel_id: self.log(f"Tunnel {tid} scaled to {count} replicas"))
+        thread.finished_with_status.connect(lambda success, error: 
+            self.render_tunnels() if success else self.log(f"Error scaling tunnel: {error}"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
     def stop_tunnel(self, tunnel_id):
-        """Stop a running tunnel"""
+        """Stop all replicas of a running tunnel"""
         if tunnel_id not in self.running_tunnels:
             self.log(f"Tunnel {tunnel_id} is not running")
             return
             
-        process = self.running_tunnels[tunnel_id]
-        self.log(f"Stopping tunnel {tunnel_id} (PID {process.pid})...")
-        
-        try:
-            import signal
-            import platform
-            
-            if platform.system().lower() == "windows":
-                import subprocess
-                # On Windows, we need to use taskkill
-                subprocess.run(["taskkill", "/F", "/PID", str(process.pid)])
-            else:
-                # On Unix-like systems, we can use the kill signal
-                process.send_signal(signal.SIGTERM)
-                
-            # Remove from running tunnels
-            del self.running_tunnels[tunnel_id]
-            self.log(f"Tunnel {tunnel_id} stopped")
-            
-            # Update the UI
-            self.refresh_tunnels()
-            
-        except Exception as e:
-            self.log(f"Error stopping tunnel: {e}")
+        # Removed right away, so a second click can't stop the same replicas twice
+        replica_set = self.running_tunnels.pop(tunnel_id)
+        self.log(f"Stopping tunnel {tunnel_id} ({len(replica_set)} replicas)...")
+        
+        # Each replica may take up to its terminate timeout to exit
+        thread = CommandThread(replica_set.stop_all)
+        thread.finished_with_status.connect(lambda success, error, tid=tunnel_id:
+            self.log(f"Tunnel {tid} stopped" if success else f"Error stopping tunnel: {error}"))
+        thread.finished_with_status.connect(lambda success, error: self.render_tunnels())
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+        self.render_tunnels()
     
     def show_tunnel_info(self, tunnel_id):
         """Show information about the specified tunnel in a modal dialog"""
         self.log(f"Getting info for tunnel {tunnel_id}...")
         
-        # Create and show the dialog
+        # Open with whatever is cached, then refresh in the background
+        info, _ = self.tunnel_details.get(tunnel_id, "info")
         info_dialog = TunnelInfoDialog(self, tunnel_id)
-        
-        # Get tunnel info in a thread
-        thread = CommandThread(manager.tunnel_info, tunnel_id)
-        thread.output_ready.connect(lambda info: self.update_tunnel_info_dialog(info_dialog, info))
-        self.active_threads.append(thread)  # Keep reference
-        thread.start()
-        
-        # Try to get config file content
-        config_thread = CommandThread(self.get_tunnel_config, tunnel_id)
-        config_thread.output_ready.connect(lambda config: info_dialog.set_config_content(config))
-        self.active_threads.append(config_thread)  # Keep reference
-        config_thread.start()
+        self.info_dialogs[tunnel_id] = info_dialog
+        if info is not None:
+            self.update_tunnel_info_dialog(info_dialog, info, self.tunnel_details.get(tunnel_id, "connectors")[0])
+        config_content, _ = self.tunnel_details.get(tunnel_id, "config")
+        if config_content is not None:
+            info_dialog.set_config_content(config_content)
+        self.tunnel_details.refresh(tunnel_id, ("info", "config"))
         
         # Show the dialog
-        info_dialog.exec()
+        try:
+            info_dialog.exec()
+        finally:
+            self.info_dialogs.pop(tunnel_id, None)
+    
+    def on_tunnel_detail(self, tunnel_id, part, error):
+        """Render a finished detail fetch into the open info dialog, if any"""
+        if tunnel_id is None:
+            dialogs = list(self.info_dialogs.items())
+        else:
+            dialogs = [(tunnel_id, self.info_dialogs[tunnel_id])] if tunnel_id in self.info_dialogs else []
+        for tid, dialog in dialogs:
+            if part == "dns_routes":
+                self.update_dns_records_table(f"Error: {error}" if error else self.tunnel_details.get(tid, part)[0], dialog)
+            elif error:
+                self.log(f"Error fetching {part} of tunnel {tid}: {error}", "error")
+            elif part == "info":
+                self.update_tunnel_info_dialog(dialog, self.tunnel_details.get(tid, "info")[0],
+                                               self.tunnel_details.get(tid, "connectors")[0])
+            elif part == "config":
+                dialog.set_config_content(self.tunnel_details.get(tid, "config")[0])
     
-    def update_tunnel_info_dialog(self, dialog, info):
+    def prefetch_visible_tunnels(self):
+        """Warm the detail cache for the rows currently on screen"""
+        table = self.tunnels_table
+        if table is None or not table.rowCount():
+            return
+        first = max(0, table.rowAt(0))
+        last = table.rowAt(table.viewport().height() - 1)
+        last = table.rowCount() - 1 if last < 0 else last
+        self.tunnel_details.prefetch(
+            table.item(row, 0).text() for row in range(first, last + 1) if table.item(row, 0))
+    
+    def prefetch_tunnel_row(self, row, column):
+        item = self.tunnels_table.item(row, 0)
+        if item is not None:
+            self.tunnel_details.prefetch([item.text()])
+    
+    def update_tunnel_info_dialog(self, dialog, info, connectors=None):
         """Update the tunnel info dialog with the retrieved information"""
         try:
             # Parse the tunnel info
             parsed_info = self.parse_tunnel_info(info)
+            if connectors is not None:
+                parsed_info["connectors"] = f"{len(connectors)} active" if connectors else "none"
             
             # Update the dialog directly instead of creating a new one
             dialog.setWindowTitle(f"Tunnel Information: {parsed_info.get('id', 'Unknown')}")
@@ -911,55 +1378,14 @@ class MainWindow(QMainWindow):
         
         return result
     
-    def get_tunnel_config(self, tunnel_id):
-        """Get the configuration for a tunnel"""
-        try:
-            # Try to find the config file
-            config_path = os.path.expanduser(f"~/.cloudflared/config.yml")
-            if os.path.exists(config_path):
-                with open(config_path, 'r') as f:
-                    config_content = f.read()
-                return config_content
-            
-            # Try to find the credentials file
-            creds_path = os.path.expanduser(f"~/.cloudflared/{tunnel_id}.json")
-            if os.path.exists(creds_path):
-                with open(creds_path, 'r') as f:
-                    creds_content = f.read()
-                return f"Credentials file:\n{creds_content}"
-            
-            return "No configuration found for this tunnel."
-        except Exception as e:
-            return f"Error reading configuration: {e}"
-    
     def fetch_dns_records(self, tunnel_id, dialog):
-        """Fetch DNS records for a tunnel and update the dialog"""
-        dialog.dns_status_label.setText("Fetching DNS records...")
-        
-        def get_dns_records():
-            try:
-                # Run cloudflared tunnel route ip list
-                import subprocess
-                result = subprocess.run(
-                    ["cloudflared", "tunnel", "route", "dns", "list", "--output", "json"],
-                    capture_output=True, text=True, check=True
-                )
-                
-                if result.stdout.strip():
-                    records = json.loads(result.stdout)
-                    # Filter records for this tunnel
-                    tunnel_records = [r for r in records if r.get('tunnel_id') == tunnel_id]
-                    return tunnel_records
-                return []
-            except subprocess.CalledProcessError as e:
-                return f"Error: {e.stderr if e.stderr else str(e)}"
-            except Exception as e:
-                return f"Error: {str(e)}"
-        
-        thread = CommandThread(get_dns_records)
-        thread.output_ready.connect(lambda result: self.update_dns_records_table(result, dialog))
-        self.active_threads.append(thread)
-        thread.start()
+        """Show cached DNS records for a tunnel and refresh them in the background"""
+        records, _ = self.tunnel_details.get(tunnel_id, "dns_routes")
+        if records is not None:
+            self.update_dns_records_table(records, dialog)
+        else:
+            dialog.dns_status_label.setText("Fetching DNS records...")
+        self.tunnel_details.refresh(tunnel_id, ("dns_routes",))
     
     def update_dns_records_table(self, records, dialog):
         """Update the DNS records table in the dialog"""
@@ -973,7 +1399,7 @@ class MainWindow(QMainWindow):
                 
                 for row, record in enumerate(records):
                     # Hostname
-                    hostname = record.get('hostname', 'N/A')
+                    hostname = record.hostname or 'N/A'
                     hostname_item = QTableWidgetItem(hostname)
                     dialog.dns_records_table.setItem(row, 0, hostname_item)
                     
@@ -982,7 +1408,7 @@ class MainWindow(QMainWindow):
                     dialog.dns_records_table.setItem(row, 1, type_item)
                     
                     # Target
-                    target = record.get('cname', 'N/A')
+                    target = record.cname or 'N/A'
                     target_item = QTableWidgetItem(target)
                     dialog.dns_records_table.setItem(row, 2, target_item)
                 
@@ -1049,25 +1475,246 @@ class MainWindow(QMainWindow):
         self.active_threads.append(thread)  # Keep reference
         thread.start()
 
+    def collect_diagnostic_bundle(self):
+        """Gather service, config, tunnel, route, log and process data into a tarball"""
+        from core.diagnostics import collect_bundle, describe_progress
+        self.log("Collecting diagnostic bundle...")
+        self.diagnostic_bundle_btn.setEnabled(False)
+        thread = CommandThread(collect_bundle, on_progress=lambda name, entry: self.log(describe_progress(name, entry)))
+        thread.output_ready.connect(lambda path: self.log(f"Diagnostic bundle written to {path}"))
+        thread.finished_with_status.connect(lambda success, error: self.diagnostic_bundle_btn.setEnabled(True))
+        thread.finished_with_status.connect(lambda success, error:
+            None if success else self.log(f"Error collecting diagnostic bundle: {error}", "error"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
+    def scan_cleanup(self):
+        """Take one snapshot of tunnels, routes and local files and show what can be removed"""
+        days = self.cleanup_days_spin.value()
+        self.cleanup_scan_btn.setEnabled(False)
+        self.cleanup_delete_btn.setEnabled(False)
+        self.cleanup_label.setText("Scanning...")
+        thread = CommandThread(lambda: self.cleanup_planned.emit(cleanup.scan(days)[1]))
+        thread.finished_with_status.connect(lambda success, error: self.cleanup_scan_btn.setEnabled(True))
+        thread.finished_with_status.connect(lambda success, error:
+            None if success else self.cleanup_label.setText(f"Scan failed, nothing was changed: {error}"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
+    def show_cleanup_plan(self, items):
+        self.cleanup_items = items
+        self.cleanup_table.setRowCount(len(items))
+        for row, item in enumerate(items):
+            label = (item["name"] or item["id"]) if item["kind"] == "tunnel" else ", ".join(item["paths"])
+            label_item = QTableWidgetItem(label)
+            label_item.setFlags(Qt.ItemFlag.ItemIsUserCheckable | Qt.ItemFlag.ItemIsEnabled)
+            label_item.setCheckState(Qt.CheckState.Checked)
+            label_item.setToolTip(item["id"])
+            self.cleanup_table.setItem(row, 0, label_item)
+            self.cleanup_table.setItem(row, 1, QTableWidgetItem(item["kind"]))
+            self.cleanup_table.setItem(row, 2, QTableWidgetItem(item["reason"]))
+            self.cleanup_table.setItem(row, 3, QTableWidgetItem(""))
+        self.cleanup_label.setText(f"{len(items)} items can be removed" if items else "Nothing to clean up")
+        self.cleanup_delete_btn.setEnabled(bool(items))
+    
+    def apply_cleanup(self):
+        """Delete the checked items concurrently; each row shows its own result"""
+        selected = [(row, item) for row, item in enumerate(self.cleanup_items)
+                    if self.cleanup_table.item(row, 0).checkState() == Qt.CheckState.Checked]
+        if not selected:
+            return
+        reply = QMessageBox.question(
+            self,
+            "Confirm Cleanup",
+            f"Delete {len(selected)} tunnels and credentials files? .cloudflared is snapshotted first.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        rows = {id(item): row for row, item in selected}
+        for row, _ in selected:
+            self.cleanup_table.item(row, 3).setText("pending")
+        self.cleanup_scan_btn.setEnabled(False)
+        self.cleanup_delete_btn.setEnabled(False)
+        thread = CommandThread(cleanup.apply, [item for _, item in selected],
+                               on_result=lambda item, status, error: self.cleanup_result.emit(rows[id(item)], status, error))
+        thread.output_ready.connect(lambda counts: self.log(f"Cleanup finished: {counts}"))
+        thread.finished_with_status.connect(lambda success, error: self.cleanup_scan_btn.setEnabled(True))
+        thread.finished_with_status.connect(lambda success, error:
+            None if success else self.log(f"Error during cleanup: {error}", "error"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
+    def show_cleanup_result(self, row, status, error):
+        self.cleanup_table.item(row, 3).setText(f"{status}: {error}" if error else status)
+        self.cleanup_table.item(row, 0).setFlags(Qt.ItemFlag.ItemIsEnabled)
+    
+    def render_tunnels(self):
+        """Re-render the tunnels table from the snapshot, fetching only if there is none"""
+        tunnels, fetched_at = self.state.get("tunnels")
+        if tunnels is None:
+            self.refresh_tunnels()
+        else:
+            self.update_tunnels_table(tunnels, fetched_at=fetched_at, refreshing=False)
+    
+    def on_event(self, event):
+        """Apply a state-change event from the bus (runs on the UI thread)"""
+        self.log(events.describe(event), "error" if event.kind == events.CONNECTOR_CRASHED else "info")
+        self.tunnel_details.apply_event(event)
+        if event.kind in (events.TUNNEL_CREATED, events.TUNNEL_DELETED):
+            self.render_tunnels()
+        elif event.kind == events.SERVICE_STATE_CHANGED and "running" in event.data:
+            running = event.data.get("running")
+            self.service_status_label.setText(f"Service Status: {'Running' if running else 'Not Running'}")
+        elif event.kind == events.SERVICE_STATE_CHANGED and hasattr(self, "units_table"):
+            self.refresh_tunnel_services()
+        elif event.kind == events.CONNECTOR_CRASHED:
+            self.render_tunnels()
+        elif event.kind == events.IP_ROUTE_ADDED:
+            # Rebuilt from cloudflared on the next lookup
+            self.ip_route_index = None
+    
+    def on_fs_changed(self, kind, path):
+        """React to a change in a watched .cloudflared directory"""
+        if kind == CONFIG_CHANGED:
+            self.log(f"Config changed on disk: {path}")
+            self.tunnel_details.invalidate(parts=("config",))
+            if is_tunnel_config(path):
+                # Only that tunnel's unit restarts, and only if its effective config changed
+                tunnel = os.path.basename(path)[:-len(".yml")]
+                self.restart_scheduler.request(f"{path} changed", tunnel=tunnel)
+        elif kind == CERT_ROTATED:
+            self.log(f"Origin certificate changed: {path}")
+        elif kind in (CREDENTIALS_ADDED, CREDENTIALS_REMOVED):
+            self.log(f"Tunnel credentials {'added' if kind == CREDENTIALS_ADDED else 'removed'}: {path}")
+            self.tunnel_details.invalidate(parts=("config",))
+            self.refresh_tunnels()
+        elif kind == CREDENTIALS_CHANGED:
+            self.log(f"Tunnel credentials changed: {path}")
+            self.tunnel_details.invalidate(parts=("config",))
+            if os.path.dirname(path) == os.path.abspath(manager.get_service_config_dir()):
+                # Part of the service's effective config; restarts only if the referenced file changed
+                self.restart_scheduler.request(f"{path} changed")
+    
+    def reload_ip_routes(self, then=None):
+        """Fetch IP routes and rebuild the route index"""
+        self.log("Loading IP routes...")
+        
+        def load():
+            self.ip_route_index = build_index()
+            return len(self.ip_route_index)
+        
+        thread = CommandThread(load)
+        thread.output_ready.connect(lambda count: self.log(f"Loaded {count} IP routes"))
+        thread.finished_with_status.connect(lambda success, error:
+            (then() if then else None) if success else self.log(f"Error loading IP routes: {error}"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
+    def lookup_ip_route(self):
+        """Longest-prefix lookup of an IP, or overlap check of a CIDR"""
+        query = self.ip_route_input.text().strip()
+        if not query:
+            return
+        if getattr(self, "ip_route_index", None) is None:
+            self.reload_ip_routes(then=self.lookup_ip_route)
+            return
+        try:
+            if "/" in query:
+                findings = self.ip_route_index.check(query)
+                for finding in findings:
+                    self.log(describe_finding(query, finding))
+                if not findings:
+                    self.log(f"{query} does not overlap any existing route")
+            else:
+                route = self.ip_route_index.lookup(query)
+                if route:
+                    self.log(f"{query} -> {route.network} via tunnel {route.target}")
+                else:
+                    self.log(f"No route serves {query}")
+        except ValueError as e:
+            self.log(f"Invalid address: {e}")
+    
+    def search_logs(self):
+        """Search the local log index"""
+        import time
+        windows = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400}
+        window = windows.get(self.log_window_combo.currentText())
+        level = self.log_level_combo.currentText()
+        
+        def run_query():
+            records = self.log_store.query(
+                text=self.log_search_input.text().strip() or None,
+                level=None if level == "any" else level,
+                tunnel_id=self.log_tunnel_input.text().strip() or None,
+                since=time.time() - window if window else None,
+                limit=500
+            )
+            if not records:
+                return "No matching log entries."
+            return "\n".join(format_record(r) for r in records)
+        
+        thread = CommandThread(run_query)
+        thread.output_ready.connect(self.log_results.setPlainText)
+        thread.finished_with_status.connect(lambda success, error:
+            None if success else self.log_results.setPlainText(f"Error searching logs: {error}"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
+    def import_service_logs(self):
+        """Import recent cloudflared service logs into the log index"""
+        self.log("Importing service logs...")
+        thread = CommandThread(ingest_service_logs, self.log_store)
+        thread.output_ready.connect(lambda count: self.log(f"Imported {count} service log lines"))
+        self.active_threads.append(thread)  # Keep reference
+        thread.start()
+    
+    def update_resources_table(self, rows):
+        """Show the latest resource sample of each connector process"""
+        self.resources_table.setRowCount(len(rows))
+        for row, sample in enumerate(rows):
+            values = [
+                sample["label"],
+                str(sample["pid"]),
+                f"{sample['cpu_percent']:.1f}",
+                format_bytes(sample["rss_bytes"]),
+                "n/a" if sample["fds"] is None else str(sample["fds"]),
+                format_bytes(sample["read_bps"]),
+                format_bytes(sample["write_bps"]),
+            ]
+            for column, value in enumerate(values):
+                self.resources_table.setItem(row, column, QTableWidgetItem(value))
+    
     def closeEvent(self, event):
         """Handle window close event - clean up threads and processes"""
         try:
-            # Stop all running tunnels
+            # Stop all running tunnels, waiting here since the window is going away
             running_tunnel_ids = list(self.running_tunnels.keys())
             for tunnel_id in running_tunnel_ids:
                 try:
-                    self.stop_tunnel(tunnel_id)
+                    self.running_tunnels.pop(tunnel_id).stop_all()
                 except Exception as e:
                     print(f"Error stopping tunnel {tunnel_id}: {e}")
         except Exception as e:
             print(f"Error stopping tunnels: {e}")
         
+        self.watcher.stop()
+        self.resource_monitor.stop()
+        self.tunnel_details.close()
+        
+        # Apply any restart still waiting for its debounce window
+        try:
+            self.restart_scheduler.flush()
+        except Exception as e:
+            print(f"Error applying pending restart: {e}")
+        
         # Accept the close event
         event.accept()
 
 def main():
+    timeline = StartupTimeline(origin=process_start())
     app = QApplication(sys.argv)
-    window = MainWindow()
+    window = MainWindow(timeline)
     window.show()
     sys.exit(app.exec())
 
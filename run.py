@@ -1,8 +1,140 @@
 import sys
 from core.utils import check_cloudflared_installed
 
+def fleet_main(args):
+    """python run.py fleet <hosts> <method> [args...]"""
+    import json
+    from core.fleet import fan_out, load_hosts
+    if len(args) < 2:
+        print("Usage: python run.py fleet <host[:port],...|hosts-file> <method> [args...] [--timeout=SECONDS]")
+        sys.exit(1)
+    timeout = 10
+    positional = []
+    for arg in args:
+        if arg.startswith("--timeout="):
+            timeout = float(arg.split("=", 1)[1])
+        else:
+            positional.append(arg)
+    hosts = load_hosts(positional[0])
+    failed = 0
+    for address, ok, result, elapsed in fan_out(hosts, positional[1], positional[2:], timeout=timeout):
+        if not ok:
+            failed += 1
+        text = result if isinstance(result, str) else json.dumps(result)
+        print(f"[{address}] {'OK' if ok else 'FAILED'} ({elapsed:.2f}s) {text}")
+    print(f"{len(hosts) - failed}/{len(hosts)} hosts succeeded")
+    sys.exit(1 if failed else 0)
+
+def emulate_main(args):
+    """python run.py emulate <config.yml> [--port=N] [--load=host/path,...] [--concurrency=N] [--requests=N]"""
+    from core.emulator import IngressEmulator, load_rules_file, run_load, format_report
+    if not args:
+        print("Usage: python run.py emulate <config.yml> [--port=N] [--load=host/path,...] "
+              "[--concurrency=N] [--requests=N]")
+        sys.exit(1)
+    options = dict(arg[2:].split("=", 1) for arg in args[1:] if arg.startswith("--") and "=" in arg)
+    rules = load_rules_file(args[0])
+    emulator = IngressEmulator(rules, port=int(options.get("port", 0))).start()
+    print(f"Ingress emulator listening on {emulator.address}")
+    for rule in rules:
+        print(f"  {rule.label()}")
+    if "load" in options:
+        targets = [t.strip() for t in options["load"].split(",") if t.strip()]
+        rows, elapsed = run_load(emulator.address, targets, int(options.get("concurrency", 10)),
+                                 int(options.get("requests", 1000)), rules=rules)
+        print(format_report(rows, elapsed))
+        emulator.stop()
+        sys.exit(0)
+    try:
+        while True:
+            import time
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        emulator.stop()
+    sys.exit(0)
+
+def start_profiling(argv):
+    """Handle --profile[=sampling|deterministic] anywhere on the command line; returns the other arguments"""
+    rest = []
+    mode = None
+    for arg in argv:
+        if arg == "--profile" or arg.startswith("--profile="):
+            mode = arg.partition("=")[2] or "sampling"
+        else:
+            rest.append(arg)
+    if mode:
+        from core import profiler
+        try:
+            profiler.start(mode)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print(f"Profiling ({mode}); send SIGUSR2 for an allocation snapshot. Output goes to {profiler.PROFILE_DIR}")
+    return rest
+
+def diagnose_main(args):
+    """python run.py diagnose [--bundle] [--output=PATH] [--timeout=SECONDS]"""
+    if "--bundle" not in args:
+        from core import manager
+        print(manager.diagnose_service_config())
+        sys.exit(0)
+    from core.diagnostics import BUNDLE_TIMEOUT, collect_bundle, describe_progress
+    options = dict(arg[2:].split("=", 1) for arg in args if arg.startswith("--") and "=" in arg)
+    path = collect_bundle(options.get("output"), timeout=float(options.get("timeout", BUNDLE_TIMEOUT)),
+                          on_progress=lambda name, entry: print(describe_progress(name, entry)))
+    print(f"Diagnostic bundle written to {path}")
+    sys.exit(0)
+
+def benchmark_main(args):
+    """python run.py benchmark [--tunnels=N] [--connections=N]"""
+    from core.records import benchmark, describe_benchmark
+    options = dict(arg[2:].split("=", 1) for arg in args if arg.startswith("--") and "=" in arg)
+    print(describe_benchmark(benchmark(int(options.get("tunnels", 10000)), int(options.get("connections", 4)))))
+    sys.exit(0)
+
+def gc_main(args):
+    """python run.py gc [--days=N] [--apply]"""
+    from core import cleanup
+    options = dict(arg[2:].split("=", 1) for arg in args if arg.startswith("--") and "=" in arg)
+    try:
+        _, items = cleanup.scan(int(options.get("days", cleanup.DEFAULT_DAYS)))
+    except RuntimeError as e:
+        print(f"Could not take a snapshot, nothing was changed: {e}")
+        sys.exit(1)
+    if not items:
+        print("Nothing to clean up.")
+        sys.exit(0)
+    for item in items:
+        print(cleanup.describe_item(item))
+    if "--apply" not in args:
+        print(f"{len(items)} items would be cleaned up. Re-run with --apply to delete them.")
+        sys.exit(0)
+
+    def on_result(item, status, error):
+        print(f"[{status}] {cleanup.describe_item(item)}" + (f": {error}" if error else ""))
+
+    counts = cleanup.apply(items, on_result=on_result)
+    print(", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    sys.exit(1 if counts.get("failed") else 0)
+
 if __name__ == "__main__":
-    if not check_cloudflared_installed():
+    sys.argv = start_profiling(sys.argv)
+    if len(sys.argv) >= 2 and sys.argv[1] == "fleet":
+        # The controller only talks to agents, it doesn't need a local cloudflared
+        fleet_main(sys.argv[2:])
+    if len(sys.argv) >= 2 and sys.argv[1] == "emulate":
+        # Runs entirely offline, no cloudflared involved
+        emulate_main(sys.argv[2:])
+    if len(sys.argv) >= 2 and sys.argv[1] == "diagnose":
+        # Works without cloudflared too, the bundle records that it is missing
+        diagnose_main(sys.argv[2:])
+    if len(sys.argv) >= 2 and sys.argv[1] == "benchmark":
+        # Synthetic data, no cloudflared involved
+        benchmark_main(sys.argv[2:])
+
+    # A running daemon already knows whether cloudflared is installed
+    from core import daemon
+    if not daemon.call_or_direct("check_cloudflared_installed", check_cloudflared_installed):
         print("cloudflared is not installed.")
         choice = input("Would you like to download and install cloudflared automatically? (y/n): ").strip().lower()
         if choice == "y":
@@ -17,7 +149,7 @@ if __name__ == "__main__":
             sys.exit(1)
 
     if len(sys.argv) < 2:
-        print("Usage: python run.py [cli|web|desktop]")
+        print("Usage: python run.py [--profile[=sampling|deterministic]] [cli|web|desktop|daemon|agent|fleet|emulate|diagnose|benchmark|gc]")
         sys.exit(1)
 
     mode = sys.argv[1]
@@ -31,5 +163,15 @@ if __name__ == "__main__":
     elif mode == "desktop":
         import desktop_ui
         desktop_ui.main()
+    elif mode == "daemon":
+        daemon.run_daemon()
+    elif mode == "agent":
+        from core.fleet import run_agent, DEFAULT_PORT
+        host = sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1"
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_PORT
+        run_agent(host, port)
+    elif mode == "gc":
+        gc_main(sys.argv[2:])
     else:
-        print("Invalid mode. Use 'cli', 'web', or 'desktop'.")
\ No newline at end of file
+        print("Invalid mode. Use 'cli', 'web', 'desktop', 'daemon', 'agent', 'fleet', 'emulate', "
+              "'diagnose', 'benchmark' or 'gc'.")
\ No newline at end of file
@@ -0,0 +1,103 @@
+import subprocess
+
+from core import units
+from core.units import TemplateUnits
+
+
+class FakeSystemd:
+    """Runner standing in for systemctl: records commands and answers `show` from a state table"""
+
+    def __init__(self, active=()):
+        self.commands = []
+        self.active = set(active)
+
+    def __call__(self, args):
+        self.commands.append(list(args))
+        if args[:2] == ["systemctl", "show"]:
+            blocks = []
+            for unit in args[4:]:
+                state = "active" if unit in self.active else "inactive"
+                pid = "4242" if unit in self.active else "0"
+                blocks.append(f"Id={unit}\nLoadState=loaded\nActiveState={state}\nSubState=running\n"
+                              f"MainPID={pid}\nNRestarts=0\n")
+            return subprocess.CompletedProcess(args, 0, "\n".join(blocks), "")
+        if args[:2] == ["systemctl", "enable"] and "--now" in args:
+            self.active.add(args[-1])
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+    def named(self, verb):
+        return [command for command in self.commands if command[1:2] == [verb]]
+
+
+def make_units(tmp_path, runner):
+    return TemplateUnits(runner=runner, unit_dir=str(tmp_path / "units"),
+                         config_dir=str(tmp_path / "tunnels"), use_sudo=False)
+
+
+def test_escape_instance_matches_systemd_escape():
+    assert units.escape_instance("web-prod") == "web\\x2dprod"
+    assert units.escape_instance("a/b") == "a-b"
+    assert units.escape_instance(".hidden") == "\\x2ehidden"
+    assert units.escape_instance("ok_1:2.3") == "ok_1:2.3"
+    assert units.escape_instance("café") == "caf\\xc3\\xa9"
+
+
+def test_unit_names_round_trip():
+    for tunnel in ("web-prod", "a/b", ".hidden", "café", "6ff42ae2-765d-4adf-8112-31c55c1551ef"):
+        assert units.tunnel_of(units.unit_name(tunnel)) == tunnel
+    assert units.tunnel_of(units.GLOBAL_UNIT) is None
+
+
+def test_render_template_points_at_per_tunnel_configs():
+    text = units.render_template("/usr/bin/cloudflared", "/etc/cloudflared/tunnels")
+    assert "ExecStart=/usr/bin/cloudflared --no-autoupdate --config /etc/cloudflared/tunnels/%I.yml tunnel run" in text
+    assert "Restart=on-failure" in text
+    assert "WantedBy=multi-user.target" in text
+
+
+def test_parse_show_splits_units():
+    text = ("Id=cloudflared@a.service\nActiveState=active\nMainPID=10\n\n"
+            "Id=cloudflared@b.service\nActiveState=inactive\nMainPID=0\n\n"
+            "ActiveState=unknown\n")
+    parsed = units.parse_show(text)
+    assert set(parsed) == {"cloudflared@a.service", "cloudflared@b.service"}
+    assert parsed["cloudflared@a.service"]["MainPID"] == "10"
+    status = units.describe_unit(parsed["cloudflared@b.service"])
+    assert status["active"] is False and status["pid"] is None
+
+
+def test_batches():
+    assert units.batches(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+    assert units.batches([], 2) == []
+
+
+def test_status_uses_one_show_per_batch(tmp_path):
+    runner = FakeSystemd(active={units.unit_name("t0")})
+    tunnels = [f"t{i}" for i in range(units.SHOW_BATCH + 10)]
+    statuses = make_units(tmp_path, runner).status(tunnels, include_global=True)
+    assert len(runner.named("show")) == 2
+    assert set(statuses) == set(tunnels) | {None}
+    assert statuses["t0"]["active"] and statuses["t0"]["pid"] == 4242
+    assert not statuses["t1"]["active"]
+
+
+def test_install_restarts_only_when_the_config_changed(tmp_path):
+    runner = FakeSystemd()
+    template_units = make_units(tmp_path, runner)
+    written = []
+
+    template_units.install("web", "id-1", "/creds/id-1.json", on_written=written.append)
+    assert (tmp_path / "tunnels" / "web.yml").read_text().startswith("tunnel: id-1\n")
+    assert (tmp_path / "units" / units.TEMPLATE).exists()
+    assert written == ["web"]
+    assert runner.named("restart") == []
+
+    # Same config again: the running unit is left alone
+    template_units.install("web", "id-1", "/creds/id-1.json")
+    assert runner.named("restart") == []
+    assert len(runner.named("daemon-reload")) == 1
+
+    # A changed config restarts just this tunnel's unit
+    template_units.install("web", "id-1", "/creds/id-1.json", url="http://localhost:8080")
+    assert runner.named("restart") == [["systemctl", "restart", units.unit_name("web")]]
+    assert template_units.instances() == ["web"]
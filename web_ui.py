@@ -1,6 +1,10 @@
 import streamlit as st
 import os
-from core import manager
+import subprocess
+from core import events, manager
+from core.fleet import LocalConnectors
+from core.records import DnsRoute, IpRoute, Tunnel, group_by_tunnel
+from core.state import StateStore, describe_age, refresh_in_background, STALE_AFTER
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,6 +21,111 @@ def check_auth():
         else:
             st.error("Invalid credentials")
 
+PAGE_SIZES = [25, 50, 100]
+SORT_FIELDS = {"Name": "name", "Created": "created_at", "ID": "id", "Connections": "connections"}
+
+@st.cache_resource
+def get_state():
+    state = StateStore()
+    # Applies state-change events to the snapshot, including ones journaled by other front-ends
+    events.track_snapshot(state)
+    return state
+
+@st.cache_resource
+def get_connectors():
+    return LocalConnectors()
+
+def _tunnel_row(tunnel):
+    return {
+        "id": tunnel.id or "",
+        "name": tunnel.name or "",
+        "created_at": tunnel.created_at or "",
+        "connections": len(tunnel.connections),
+    }
+
+@st.cache_data(max_entries=16)
+def query_tunnels(fetched_at, text, sort_field, descending):
+    """
+    Filtered and sorted Tunnel records of the snapshot. fetched_at keys the
+    cache, so the snapshot is only re-read and re-sorted after a refresh; reruns
+    that just change the page slice the cached list. cache_data hands every
+    session its own copy, so one session can't mutate another's rows.
+    """
+    tunnels, _ = get_state().get("tunnels", [])
+    text = text.strip().lower()
+    rows = Tunnel.parse_many(tunnels)
+    if text:
+        rows = [t for t in rows if text in (t.name or "").lower() or text in (t.id or "")]
+    if sort_field == "connections":
+        rows.sort(key=lambda t: len(t.connections), reverse=descending)
+    else:
+        rows.sort(key=lambda t: getattr(t, sort_field) or "", reverse=descending)
+    return rows
+
+def tunnel_grid(state):
+    """One page of the tunnel snapshot plus lazily loaded per-tunnel actions"""
+    st.subheader("Tunnels")
+    _, fetched_at = state.get("tunnels")
+    if fetched_at is None:
+        state.put("tunnels", list(manager.iter_tunnels()))
+        _, fetched_at = state.get("tunnels")
+    st.caption(f"Fetched {describe_age(fetched_at)}" + (" (stale, refreshing)" if state.is_stale("tunnels") else ""))
+
+    filter_col, sort_col, order_col, size_col = st.columns([3, 2, 1, 1])
+    text = filter_col.text_input("Filter by name or ID")
+    sort_label = sort_col.selectbox("Sort by", list(SORT_FIELDS))
+    descending = order_col.checkbox("Descending")
+    page_size = size_col.selectbox("Per page", PAGE_SIZES)
+
+    rows = query_tunnels(fetched_at, text, SORT_FIELDS[sort_label], descending)
+    pages = max(1, -(-len(rows) // page_size))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+    # Only the visible page is turned into dicts for the dataframe
+    page_rows = [_tunnel_row(t) for t in rows[(page - 1) * page_size:page * page_size]]
+    st.caption(f"{len(rows)} tunnels")
+    if not page_rows:
+        return
+    st.dataframe(page_rows, use_container_width=True)
+
+    names = {r["id"]: r["name"] for r in page_rows}
+    tunnel_id = st.selectbox("Tunnel", list(names), format_func=lambda tid: f"{names[tid]} ({tid})")
+    info_col, routes_col, run_col, delete_col = st.columns(4)
+    connectors = get_connectors()
+    running = connectors.list().get(tunnel_id, {}).get("running")
+
+    if info_col.button("Info"):
+        try:
+            st.code(manager.tunnel_info(tunnel_id, capture_output=True).stdout or "No connectors")
+        except subprocess.CalledProcessError as e:
+            st.error(e.stderr or str(e))
+    if routes_col.button("Routes"):
+        try:
+            dns_routes = manager.list_dns_routes()
+        except RuntimeError as e:
+            st.error(f"Could not list DNS routes: {e}")
+        else:
+            state.put("dns_routes", dns_routes)
+            dns_by_tunnel = group_by_tunnel(DnsRoute.parse_many(dns_routes))
+            st.write("DNS routes:", [r.hostname for r in dns_by_tunnel.get(tunnel_id, [])])
+        try:
+            ip_routes = manager.list_ip_routes()
+        except RuntimeError as e:
+            st.error(f"Could not list IP routes: {e}")
+        else:
+            state.put("ip_routes", ip_routes)
+            ip_by_tunnel = group_by_tunnel(IpRoute.parse_many(ip_routes))
+            st.write("IP routes:", [r.network for r in ip_by_tunnel.get(tunnel_id, [])])
+    if running:
+        if run_col.button("Stop"):
+            connectors.stop(tunnel_id)
+            st.success(f"Tunnel {names[tunnel_id]} stopped")
+    elif run_col.button("Run"):
+        pid = connectors.start(tunnel_id)
+        st.success(f"Tunnel {names[tunnel_id]} started with PID {pid}")
+    if delete_col.button("Delete"):
+        manager.delete_tunnel(tunnel_id)
+        st.success("Tunnel deleted")
+
 def main():
     if "authenticated" not in st.session_state:
         st.session_state["authenticated"] = False
@@ -27,6 +136,15 @@ def main():
 
     st.title("Cloudflare Argo Tunnel Manager")
 
+    # Render from the local snapshot and reconcile stale entries in the background
+    state = get_state()
+    events.get_bus().sync()
+    stale = [key for key in ("service_running", "tunnels") if state.is_stale(key, STALE_AFTER)]
+    if stale and not st.session_state.get("refreshing"):
+        st.session_state["refreshing"] = refresh_in_background(state, stale)
+    elif st.session_state.get("refreshing") and not st.session_state["refreshing"].is_alive():
+        st.session_state["refreshing"] = None
+
     if st.button("Install cloudflared"):
         from core.utils import download_and_install_cloudflared
         result = download_and_install_cloudflared()
@@ -35,8 +153,7 @@ def main():
         else:
             st.error(result)
 
-    if st.button("List Tunnels"):
-        st.json(manager.list_tunnels())
+    tunnel_grid(state)
 
     name = st.text_input("Tunnel Name")
     if st.button("Create Tunnel") and name:
@@ -56,4 +173,10 @@ def main():
         manager.stop_service()
         st.success("Service stopped")
 
-    st.write("Service status:", manager.is_service_running())
+    running, fetched_at = state.get("service_running")
+    if fetched_at is None:
+        running = manager.is_service_running()
+        state.put("service_running", running)
+        fetched_at = state.get("service_running")[1]
+    st.write("Service status:", running)
+    st.caption(f"Fetched {describe_age(fetched_at)}" + (" (stale, refreshing)" if state.is_stale("service_running") else ""))